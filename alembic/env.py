@@ -15,6 +15,10 @@ from app.config.database import Base
 from app.accounts.models.user import User
 from app.chat.models.file import File
 from app.chat.models.conversation import Conversation
+from app.chat.models.analytics import ConversationDailyStats, SourceCitationStats, UnansweredQuestionStats
+from app.chat.models.chunk import Chunk
+from app.chat.models.citation import ConversationCitation
+from app.config.http_cache import ResourceVersion
 
 target_metadata = Base.metadata
 
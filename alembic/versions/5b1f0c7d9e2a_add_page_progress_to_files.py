@@ -0,0 +1,32 @@
+"""Add page progress fields to File model
+
+Revision ID: 5b1f0c7d9e2a
+Revises: ee25c746a0c4
+Create Date: 2025-06-02 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0c7d9e2a'
+down_revision: Union[str, None] = 'ee25c746a0c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.add_column(sa.Column('pages_total', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('pages_processed', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('files') as batch_op:
+        batch_op.drop_column('pages_processed')
+        batch_op.drop_column('pages_total')
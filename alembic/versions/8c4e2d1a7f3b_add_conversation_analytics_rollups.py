@@ -0,0 +1,94 @@
+"""Add created_at and outcome to Conversation model and analytics rollups
+
+Revision ID: 8c4e2d1a7f3b
+Revises: 5b1f0c7d9e2a
+Create Date: 2025-06-04 09:41:17.052816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2d1a7f3b'
+down_revision: Union[str, None] = '5b1f0c7d9e2a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+conversation_type = sa.Enum('PUBLIC', 'PRIVATE', name='conversationtype', native_enum=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Conversations never stored when they were asked, so existing rows get
+    # the migration time as created_at and are flagged created_at_backfilled.
+    # POST /admin/analytics/rebuild leaves them out of the daily rollups, and
+    # retention ages them from the migration (ARCHIVE_BACKFILLED_CONVERSATIONS
+    # archives them on the next run instead)
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.add_column(sa.Column('outcome', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column(
+            'created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False,
+        ))
+        batch_op.add_column(sa.Column(
+            'created_at_backfilled', sa.Boolean(), server_default=sa.false(), nullable=False,
+        ))
+        batch_op.create_index(batch_op.f('ix_conversations_created_at'), ['created_at'], unique=False)
+    # Every row present now predates the column
+    conversations = sa.table('conversations', sa.column('created_at_backfilled', sa.Boolean()))
+    op.execute(conversations.update().values(created_at_backfilled=True))
+
+    op.create_table('conversation_daily_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('conversation_type', conversation_type, nullable=False),
+    sa.Column('outcome', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('day', 'conversation_type', 'outcome')
+    )
+    op.create_index(op.f('ix_conversation_daily_stats_day'), 'conversation_daily_stats', ['day'], unique=False)
+    op.create_table('source_citation_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('conversation_type', conversation_type, nullable=False),
+    sa.Column('source', sa.String(length=256), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('day', 'conversation_type', 'source')
+    )
+    op.create_index(op.f('ix_source_citation_stats_day'), 'source_citation_stats', ['day'], unique=False)
+    op.create_table('unanswered_question_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('query_hash', sa.String(length=64), nullable=False),
+    sa.Column('conversation_type', conversation_type, nullable=False),
+    sa.Column('query', sa.Text(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('last_asked_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('day', 'query_hash', 'conversation_type')
+    )
+    op.create_index(op.f('ix_unanswered_question_stats_day'), 'unanswered_question_stats', ['day'], unique=False)
+    op.create_index(
+        op.f('ix_unanswered_question_stats_last_asked_at'), 'unanswered_question_stats', ['last_asked_at'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_unanswered_question_stats_last_asked_at'), table_name='unanswered_question_stats')
+    op.drop_index(op.f('ix_unanswered_question_stats_day'), table_name='unanswered_question_stats')
+    op.drop_table('unanswered_question_stats')
+    op.drop_index(op.f('ix_source_citation_stats_day'), table_name='source_citation_stats')
+    op.drop_table('source_citation_stats')
+    op.drop_index(op.f('ix_conversation_daily_stats_day'), table_name='conversation_daily_stats')
+    op.drop_table('conversation_daily_stats')
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_conversations_created_at'))
+        batch_op.drop_column('created_at_backfilled')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('outcome')
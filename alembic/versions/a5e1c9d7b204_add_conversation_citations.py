@@ -0,0 +1,155 @@
+"""Store conversation sources as citations instead of JSON snippets
+
+Revision ID: a5e1c9d7b204
+Revises: f2c8a4d6e913
+Create Date: 2025-06-16 10:12:44.208519
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5e1c9d7b204'
+down_revision: Union[str, None] = 'f2c8a4d6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+conversations = sa.table(
+    'conversations',
+    sa.column('id', sa.Integer()),
+    sa.column('conversation_type', sa.String()),
+    sa.column('sources', sa.JSON()),
+)
+citations = sa.table(
+    'conversation_citations',
+    sa.column('id', sa.Integer()),
+    sa.column('conversation_id', sa.Integer()),
+    sa.column('rank', sa.Integer()),
+    sa.column('file_uid', sa.String()),
+    sa.column('chunk_id', sa.Integer()),
+    sa.column('score', sa.Float()),
+    sa.column('source', sa.String()),
+    sa.column('snippet', sa.Text()),
+)
+files = sa.table(
+    'files',
+    sa.column('uid', sa.String()),
+    sa.column('filename', sa.String()),
+    sa.column('information_type', sa.String()),
+)
+
+
+def _backfill(bind) -> None:
+    """Citations from the JSON sources, matched to files by filename."""
+    uids = {}
+    for row in bind.execute(sa.select(files.c.uid, files.c.filename, files.c.information_type)):
+        uids.setdefault((row.information_type, row.filename), row.uid)
+
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(conversations.c.id, conversations.c.conversation_type, conversations.c.sources)
+            .where(conversations.c.id > last_id)
+            .order_by(conversations.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        values = []
+        for row in rows:
+            sources = json.loads(row.sources) if isinstance(row.sources, str) else row.sources
+            for rank, item in enumerate(sources or []):
+                name = (item.get('source') or '')[:256]
+                file_uid = uids.get((row.conversation_type or 'PUBLIC', name))
+                values.append({
+                    'conversation_id': row.id,
+                    'rank': rank,
+                    'file_uid': file_uid,
+                    'chunk_id': None,
+                    'score': None,
+                    'source': None if file_uid else name,
+                    # Linked to its chunk later by `python -m app.reconcile`
+                    'snippet': item.get('content') or None,
+                })
+        if values:
+            bind.execute(citations.insert(), values)
+        last_id = rows[-1].id
+
+
+def _restore(bind, batch) -> None:
+    if batch:
+        bind.execute(
+            conversations.update()
+            .where(conversations.c.id == sa.bindparam('conversation_id'))
+            .values(sources=sa.bindparam('sources', type_=sa.JSON())),
+            batch,
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('conversation_citations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('conversation_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('file_uid', sa.String(), nullable=True),
+    sa.Column('chunk_id', sa.Integer(), nullable=True),
+    sa.Column('score', sa.Float(), nullable=True),
+    sa.Column('source', sa.String(length=256), nullable=True),
+    sa.Column('snippet', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['chunk_id'], ['chunks.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['file_uid'], ['files.uid'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _backfill(op.get_bind())
+    op.create_index(
+        'ix_conversation_citations_conversation_rank', 'conversation_citations', ['conversation_id', 'rank'],
+        unique=True,
+    )
+    op.create_index(
+        'ix_conversation_citations_file_uid_conversation', 'conversation_citations', ['file_uid', 'conversation_id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_conversation_citations_chunk_id'), 'conversation_citations', ['chunk_id'], unique=False,
+    )
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.drop_column('sources')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Snippets are not stored with new citations; they come back empty
+    with op.batch_alter_table('conversations') as batch_op:
+        batch_op.add_column(sa.Column('sources', sa.JSON(), nullable=True))
+
+    bind = op.get_bind()
+    stmt = (
+        sa.select(citations.c.conversation_id, citations.c.source, citations.c.snippet, files.c.filename)
+        .select_from(citations.outerjoin(files, files.c.uid == citations.c.file_uid))
+        .order_by(citations.c.conversation_id, citations.c.rank)
+    )
+    batch, current, sources = [], None, []
+    for row in bind.execute(stmt).all():
+        if row.conversation_id != current:
+            if current is not None:
+                batch.append({'conversation_id': current, 'sources': sources})
+            current, sources = row.conversation_id, []
+        sources.append({'source': row.filename or row.source or '', 'content': row.snippet or ''})
+        if len(batch) >= BATCH_SIZE:
+            _restore(bind, batch)
+            batch = []
+    if current is not None:
+        batch.append({'conversation_id': current, 'sources': sources})
+    _restore(bind, batch)
+
+    op.drop_index(op.f('ix_conversation_citations_chunk_id'), table_name='conversation_citations')
+    op.drop_index('ix_conversation_citations_file_uid_conversation', table_name='conversation_citations')
+    op.drop_index('ix_conversation_citations_conversation_rank', table_name='conversation_citations')
+    op.drop_table('conversation_citations')
@@ -0,0 +1,96 @@
+"""Partition conversations by month on Postgres
+
+Revision ID: b7d3f9a2c6e1
+Revises: 8c4e2d1a7f3b
+Create Date: 2025-06-06 14:03:52.774120
+
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3f9a2c6e1'
+down_revision: Union[str, None] = '8c4e2d1a7f3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of the current month; the app keeps creating
+# them (see app.chat.services.retention.ensure_conversation_partitions)
+MONTHS_AHEAD = 3
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _create_indexes() -> None:
+    op.create_index(op.f('ix_conversations_id'), 'conversations', ['id'], unique=False)
+    op.create_index(op.f('ix_conversations_created_at'), 'conversations', ['created_at'], unique=False)
+    op.create_foreign_key(
+        'conversations_user_uid_fkey', 'conversations', 'users', ['user_uid'], ['uid'], ondelete='SET NULL',
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Only Postgres supports declarative partitioning; SQLite deployments rely
+    # on the batched archiver alone
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE conversations RENAME TO conversations_unpartitioned")
+    op.execute("ALTER TABLE conversations_unpartitioned RENAME CONSTRAINT conversations_pkey TO conversations_unpartitioned_pkey")
+
+    # The partition key must be part of every unique constraint, so uid is
+    # only unique together with created_at (it is a random UUID anyway)
+    op.execute(
+        "CREATE TABLE conversations (LIKE conversations_unpartitioned INCLUDING DEFAULTS, "
+        "PRIMARY KEY (id, created_at), UNIQUE (uid, created_at)) PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER SEQUENCE conversations_id_seq OWNED BY conversations.id")
+    op.execute("CREATE TABLE conversations_default PARTITION OF conversations DEFAULT")
+
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM conversations_unpartitioned")).scalar()
+    today = datetime.now(timezone.utc).date()
+    start = (oldest.date() if oldest else today).replace(day=1)
+    last = today.replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while start <= last:
+        end = _next_month(start)
+        op.execute(
+            f"CREATE TABLE conversations_p{start:%Y%m} PARTITION OF conversations "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+    op.execute("INSERT INTO conversations SELECT * FROM conversations_unpartitioned")
+    op.execute("DROP TABLE conversations_unpartitioned")
+    op.create_index(op.f('ix_conversations_uid'), 'conversations', ['uid'], unique=False)
+    _create_indexes()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER TABLE conversations RENAME TO conversations_partitioned")
+    op.execute("ALTER INDEX ix_conversations_id RENAME TO ix_conversations_partitioned_id")
+    op.execute("ALTER INDEX ix_conversations_uid RENAME TO ix_conversations_partitioned_uid")
+    op.execute("ALTER INDEX ix_conversations_created_at RENAME TO ix_conversations_partitioned_created_at")
+    op.execute("ALTER TABLE conversations_partitioned DROP CONSTRAINT conversations_user_uid_fkey")
+    op.execute(
+        "CREATE TABLE conversations (LIKE conversations_partitioned INCLUDING DEFAULTS, PRIMARY KEY (id))"
+    )
+    op.execute("ALTER SEQUENCE conversations_id_seq OWNED BY conversations.id")
+    op.execute("INSERT INTO conversations SELECT * FROM conversations_partitioned")
+    op.execute("DROP TABLE conversations_partitioned CASCADE")
+    op.create_index(op.f('ix_conversations_uid'), 'conversations', ['uid'], unique=True)
+    _create_indexes()
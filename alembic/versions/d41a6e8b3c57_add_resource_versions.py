@@ -0,0 +1,33 @@
+"""Add resource_versions for HTTP caching of read endpoints
+
+Revision ID: d41a6e8b3c57
+Revises: b7d3f9a2c6e1
+Create Date: 2025-06-09 10:22:31.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a6e8b3c57'
+down_revision: Union[str, None] = 'b7d3f9a2c6e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('resource_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('resource_versions')
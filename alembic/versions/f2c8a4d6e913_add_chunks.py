@@ -0,0 +1,46 @@
+"""Add the chunks registry of embedded file chunks
+
+Revision ID: f2c8a4d6e913
+Revises: d41a6e8b3c57
+Create Date: 2025-06-12 09:41:07.512364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8a4d6e913'
+down_revision: Union[str, None] = 'd41a6e8b3c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chunks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('vector_id', sa.String(length=64), nullable=False),
+    sa.Column('file_uid', sa.String(), nullable=False),
+    sa.Column('collection', sa.String(length=20), nullable=False),
+    sa.Column('ordinal', sa.Integer(), nullable=False),
+    sa.Column('token_count', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['file_uid'], ['files.uid'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('vector_id')
+    )
+    op.create_index('ix_chunks_file_uid_ordinal', 'chunks', ['file_uid', 'ordinal'], unique=False)
+    op.create_index(op.f('ix_chunks_collection'), 'chunks', ['collection'], unique=False)
+    # Existing vectors are registered by the reconciliation job:
+    #   python -m app.reconcile
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chunks_collection'), table_name='chunks')
+    op.drop_index('ix_chunks_file_uid_ordinal', table_name='chunks')
+    op.drop_table('chunks')
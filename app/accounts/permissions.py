@@ -1,3 +1,5 @@
+import hmac
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import select
@@ -6,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.accounts.services.auth import verify_token_async
 from app.accounts.models.user import User, RoleEnum
 from app.config.database import get_db
+from app.config.settings import settings
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/accounts/login")
@@ -33,6 +36,15 @@ def admin_required(current_user: User = Depends(get_current_user)) -> User:
         )
     return current_user
 
+async def metrics_access(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> None:
+    """Admins, or a scraper sending METRICS_TOKEN as its bearer token."""
+    if settings.METRICS_TOKEN and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return
+    admin_required(await get_current_user(token, db))
+
 def _credentials_exc() -> HTTPException:
     return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -3,7 +3,7 @@
 
 from datetime import timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -15,6 +15,7 @@ from app.accounts.permissions import admin_required
 from app.accounts.schemas.users import UserCreate, UserOut, UserLogin, Token
 from app.accounts.services.auth import create_access_token
 from app.config.database import get_db
+from app.config.http_cache import USERS, bump_version, conditional_response
 from app.config.settings import settings
 
 
@@ -71,6 +72,7 @@ async def create_user(
         role=new_user.role or RoleEnum.MODERATOR,
     )
     db.add(user)
+    await bump_version(db, USERS)
     try:
         await db.commit()  # Save user
     except IntegrityError:
@@ -117,6 +119,13 @@ admin_router = APIRouter(
 )
 
 @admin_router.get("", response_model=list[UserOut])
-async def list_users(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(User))
-    return res.scalars().all()
+async def list_users(request: Request, db: AsyncSession = Depends(get_db)):
+    async def build():
+        # Column-only select shaped like UserOut; skips ORM hydration and
+        # response_model re-validation
+        stmt = select(User.username, User.email, User.uid, User.role, User.created_at)
+        res = await db.execute(stmt)
+        return [{**row, "role": row["role"].value} for row in res.mappings()]
+
+    # Same list for every admin, so one cache entry per version
+    return await conditional_response(request, db, USERS, "all", build)
@@ -0,0 +1,22 @@
+"""
+Run the one-time startup tasks (migrations, admin bootstrap) and exit.
+
+Used by the gunicorn master before it forks workers:
+
+    python -m app.bootstrap
+"""
+import asyncio
+
+from app.config.database import engine
+from app.main import run_startup_tasks
+
+
+async def main():
+    try:
+        await run_startup_tasks()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Date, DateTime, Enum as SqlEnum, Integer, String, Text, UniqueConstraint
+
+from app.chat.models.conversation import ConversationType
+from app.config.database import Base
+
+
+# Rollups of the conversations table, maintained on insert by
+# app.chat.services.analytics so dashboards never scan conversations.
+class ConversationDailyStats(Base):
+    """Conversations per day, type and outcome."""
+    __tablename__ = "conversation_daily_stats"
+    __table_args__ = (UniqueConstraint("day", "conversation_type", "outcome"),)
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    conversation_type = Column(SqlEnum(ConversationType, native_enum=False), nullable=False)
+    outcome = Column(String(20), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class SourceCitationStats(Base):
+    """Conversations citing a source document, per day and type."""
+    __tablename__ = "source_citation_stats"
+    __table_args__ = (UniqueConstraint("day", "conversation_type", "source"),)
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    conversation_type = Column(SqlEnum(ConversationType, native_enum=False), nullable=False)
+    source = Column(String(256), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class UnansweredQuestionStats(Base):
+    """Questions that got no answer, per day, grouped by their normalized text."""
+    __tablename__ = "unanswered_question_stats"
+    __table_args__ = (UniqueConstraint("day", "query_hash", "conversation_type"),)
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    query_hash = Column(String(64), nullable=False)
+    conversation_type = Column(SqlEnum(ConversationType, native_enum=False), nullable=False)
+    query = Column(Text, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    last_asked_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
+
+from app.config.database import Base
+
+
+class Chunk(Base):
+    """
+    One embedded chunk of a file. `vector_id` is its id in the Chroma
+    collection, so file bookkeeping never has to scan vector metadata.
+    """
+    __tablename__ = "chunks"
+    __table_args__ = (Index("ix_chunks_file_uid_ordinal", "file_uid", "ordinal"),)
+
+    id = Column(Integer, primary_key=True)
+    vector_id = Column(String(64), nullable=False, unique=True)
+    file_uid = Column(String, ForeignKey("files.uid", ondelete="CASCADE"), nullable=False)
+    # Key of the store in VECTOR_STORES: "public" or "private"
+    collection = Column(String(20), nullable=False, index=True)
+    ordinal = Column(Integer, nullable=False)
+    token_count = Column(Integer, nullable=False)
+    # sha256 of the chunk text
+    content_hash = Column(String(64), nullable=False)
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"Chunk {self.ordinal} of {self.file_uid}"
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, Text
+
+from app.config.database import Base
+
+
+class ConversationCitation(Base):
+    """
+    One source an answer was based on: a reference to the cited chunk and
+    its file, ranked as the sources were returned. The snippet shown with a
+    source is read from the chunk when the conversation is read.
+    """
+    __tablename__ = "conversation_citations"
+    __table_args__ = (
+        Index("ix_conversation_citations_conversation_rank", "conversation_id", "rank", unique=True),
+        # "Which conversations cited file X", newest first
+        Index("ix_conversation_citations_file_uid_conversation", "file_uid", "conversation_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # No foreign key: on Postgres `conversations` is partitioned and its id
+    # alone is not a key. Retention deletes citations with their conversations.
+    conversation_id = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+    file_uid = Column(String, ForeignKey("files.uid", ondelete="SET NULL"), nullable=True)
+    chunk_id = Column(Integer, ForeignKey("chunks.id", ondelete="SET NULL"), nullable=True, index=True)
+    score = Column(Float, nullable=True)
+    # Filename, only kept when the source is not (or no longer) a known file
+    source = Column(String(256), nullable=True)
+    # Snippet of a citation migrated from the old JSON column, kept until
+    # its chunk is found (see link_legacy_citations)
+    snippet = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"Citation {self.rank} of conversation {self.conversation_id}"
@@ -1,6 +1,8 @@
 import enum
 import uuid
-from sqlalchemy import Column, Integer, String, Text, Enum as SqlEnum, ForeignKey, JSON
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text, Enum as SqlEnum, ForeignKey, false
 from sqlalchemy.orm import relationship
 from app.config.database import Base
 
@@ -8,6 +10,13 @@ class ConversationType(enum.Enum):
     PUBLIC = "Public"
     PRIVATE = "Private"
 
+class ConversationOutcome(str, enum.Enum):
+    ANSWERED = "answered"
+    # Retrieval found nothing relevant, the canned reply was returned
+    UNANSWERED = "unanswered"
+    ERROR = "error"
+
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -21,7 +30,15 @@ class Conversation(Base):
     conversation_type = Column(SqlEnum(ConversationType), default=ConversationType.PUBLIC)
     query = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
-    sources = Column(JSON, nullable=True)
+    outcome = Column(String(20), nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+        index=True,
+    )
+    # Saved before created_at existed: created_at is the migration time
+    created_at_backfilled = Column(Boolean, default=False, server_default=false(), nullable=False)
 
     def __repr__(self):
         return f"Conversation {self.id} ({self.conversation_type.value})"
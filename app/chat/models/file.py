@@ -4,11 +4,17 @@ import logging
 import os
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum as SqlEnum
+from typing import List, Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum as SqlEnum, delete, select, update
 from sqlalchemy.orm import relationship
 
+from app.chat.models.chunk import Chunk
+from app.chat.models.citation import ConversationCitation
 from app.chat.utils.private_chat import private_vector_store
 from app.chat.utils.public_chat import public_vector_store
+from app.chat.services.vector_index import vector_writes
+from app.chat.utils.quantization import invalidate_quantized_index
 from app.config.database import Base
 from app.config.settings import settings
 from app.config import settings as app_settings
@@ -34,6 +40,9 @@ class File(Base):
     user = relationship("User", back_populates="files")
     status = Column(String(20), default="Not Processed")
     information_type = Column(SqlEnum(InfoType), default=InfoType.PUBLIC)
+    # Parsing progress, updated while the file is processed
+    pages_total = Column(Integer, nullable=True)
+    pages_processed = Column(Integer, default=0, server_default="0", nullable=False)
 
     def __repr__(self):
         return f"{self.filename} ({self.information_type.value})"
@@ -41,14 +50,22 @@ class File(Base):
     def get_upload_path(self) -> str:
         return os.path.join(BASE_DIR, "uploads", self.filename)
 
-    def delete_embeddings(self) -> bool:
+    def delete_embeddings(self, vector_ids: Optional[List[str]] = None) -> bool:
+        """
+        Delete the file's vectors: by id when they are registered in the
+        `chunks` table, otherwise by scanning the collection's metadata.
+        """
         try:
             store = private_vector_store if self.information_type == InfoType.PRIVATE else public_vector_store
-            col = store._collection
-            results = col.get(where={"source": self.filename})
-            vector_ids = results.get("ids", [])
+            with vector_writes(store):
+                if not vector_ids:
+                    col = store._collection
+                    results = col.get(where={"source": self.filename}, include=[])
+                    vector_ids = results.get("ids", [])
+                if vector_ids:
+                    store.delete(ids=vector_ids)
             if vector_ids:
-                store.delete(ids=vector_ids)
+                invalidate_quantized_index(store)
             return True
         except Exception as e:
             logger.exception(f"Error deleting embeddings for {self.filename}")
@@ -73,7 +90,18 @@ class File(Base):
 
     async def async_delete(self, db_session):
         """Async version of delete to ensure embeddings and file are removed before DB deletion."""
-        self.delete_embeddings()
+        vector_ids = list((await db_session.execute(
+            select(Chunk.vector_id).where(Chunk.file_uid == self.uid)
+        )).scalars())
+        self.delete_embeddings(vector_ids)
         self.delete_from_filesystem()
+        # Not left to ON DELETE CASCADE / SET NULL, which SQLite does not enforce by default.
+        # Citations of the file keep its name
+        await db_session.execute(
+            update(ConversationCitation)
+            .where(ConversationCitation.file_uid == self.uid)
+            .values(file_uid=None, chunk_id=None, source=self.filename[:256], snippet=None)
+        )
+        await db_session.execute(delete(Chunk).where(Chunk.file_uid == self.uid))
         await db_session.delete(self)
         await db_session.commit()
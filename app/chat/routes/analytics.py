@@ -0,0 +1,48 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.accounts.permissions import admin_required
+from app.chat.models.conversation import ConversationType
+from app.chat.schemas.analytics import ConversationAnalytics, RollupRebuildResponse
+from app.chat.services.analytics import conversation_analytics, rebuild_conversation_rollups_background
+from app.config.database import get_db
+
+logger = logging.getLogger(__name__)
+
+admin_analytics_router = APIRouter(
+    dependencies=[Depends(admin_required)],
+)
+
+
+@admin_analytics_router.get("", response_model=ConversationAnalytics)
+async def get_conversation_analytics(
+        days: int = Query(30, ge=1, le=366),
+        conversation_type: Optional[str] = Query(None, description="Public or Private"),
+        limit: int = Query(20, ge=1, le=200),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Daily conversation counts by type and outcome, most cited documents and
+    most frequent unanswered questions over the last `days` days. Reads only
+    the rollup tables.
+    """
+    conv_type = None
+    if conversation_type:
+        try:
+            conv_type = ConversationType(conversation_type)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid conversation type. Must be one of: {', '.join([t.value for t in ConversationType])}"
+            )
+    return await conversation_analytics(db, days=days, conversation_type=conv_type, limit=limit)
+
+
+@admin_analytics_router.post("/rebuild", response_model=RollupRebuildResponse)
+async def rebuild_rollups(background_tasks: BackgroundTasks):
+    """Recompute the rollups from the conversations table (backfill), skipping backfilled created_at rows."""
+    background_tasks.add_task(rebuild_conversation_rollups_background)
+    return RollupRebuildResponse(message="Rollup rebuild started")
@@ -1,16 +1,25 @@
 import logging
+from datetime import datetime, timezone
 from typing import List, Dict, Any
 
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Body
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.accounts.models.user import User
 from app.accounts.permissions import get_current_user
 from app.chat.models.conversation import Conversation, ConversationType
-from app.chat.schemas.chat import ChatRequest, ChatResponse, ChatResponseWithSources, SourceDocument
-from app.chat.utils.public_chat import public_ask
+from app.chat.schemas.chat import (
+    BatchChatRequest, BatchChatResponse, ChatRequest, ChatResponse, ChatResponseWithSources, SourceDocument,
+)
+from app.chat.services.analytics import conversation_outcome, record_conversation, record_conversations
+from app.chat.services.citations import citations_of, save_citations
+from app.chat.utils.public_chat import public_ask_async, public_ask_batch
+from app.config.admission import AdmissionRejected, chat_admission, request_client, too_many_requests, user_client
+from app.config.resilience import deadline
 from app.config.database import get_db
+from app.config.responses import prebuilt_response
+from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +28,29 @@ public_chat_router = APIRouter()
 private_chat_router = APIRouter()
 
 
+def _format_sources(source_docs) -> List[Dict[str, str]]:
+    return [
+        {
+            'source': doc.metadata.get('source') or '',
+            'content': doc.page_content[:200]
+        }
+        for doc in source_docs
+    ]
+
+
 @public_chat_router.post("", response_model=ChatResponseWithSources)
 async def public_chat(
     request: ChatRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Public chat endpoint that doesn't require authentication.
     Processes the user's message and returns a reply.
+
+    Callers share the chat capacity fairly, keyed by their user when they
+    send a bearer token and by IP otherwise; over their share or token
+    quota they get 429 with Retry-After.
     """
     message = request.message.strip()
     if not message:
@@ -35,19 +59,21 @@ async def public_chat(
             detail="Message is required"
         )
 
-    # Call the public_ask function to get a reply
-    output = public_ask(message)
+    # Wait for the caller's turn, then get a reply within the route's time budget
+    key, weight = await request_client(http_request)
+    try:
+        async with chat_admission.admit(key, weight) as ticket:
+            with deadline(settings.CHAT_DEADLINE_SECONDS):
+                output = await public_ask_async(message)
+            ticket.charge(output.get('tokens', 0))
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
     reply = output.get('result')
     source_docs = output.get('source_documents', [])
 
     # Format the sources
-    sources = [
-        {
-            'source': doc.metadata.get('source'),
-            'content': doc.page_content[:200]
-        }
-        for doc in source_docs
-    ]
+    sources = _format_sources(source_docs)
+    citations = citations_of(source_docs)
 
     # For public chats, we can now save the conversation with a NULL user_uid
     conversation = Conversation(
@@ -55,10 +81,83 @@ async def public_chat(
         conversation_type=ConversationType.PUBLIC,
         query=message,
         answer=reply,
-        sources=sources
+        outcome=conversation_outcome(output).value,
     )
     db.add(conversation)
+    # Sources are saved as references to the cited chunks, which needs the id
+    await db.flush()
+    await save_citations(db, [conversation.id], [citations])
+    await record_conversation(db, conversation, [c["source"] for c in citations])
     await db.commit()
 
-    # Return the reply with sources
-    return ChatResponseWithSources(reply=reply, sources=sources)
+    # Return the reply with sources; the payload already matches
+    # ChatResponseWithSources, so skip re-validating it
+    return prebuilt_response({"reply": reply, "sources": sources})
+
+
+@public_chat_router.post("/batch", response_model=BatchChatResponse)
+async def public_chat_batch(
+    request: BatchChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Answer many questions in one call, e.g. to regenerate an FAQ.
+
+    All questions are embedded in one request and searched together, LLM
+    calls run with bounded concurrency, and every conversation is saved in
+    one bulk insert. Results keep the order of `messages`; a question that
+    fails has its `error` set instead of failing the whole batch.
+    """
+    if len(request.messages) > settings.BATCH_CHAT_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.BATCH_CHAT_MAX_QUESTIONS} messages per batch"
+        )
+
+    messages = [message.strip() for message in request.messages]
+    questions = [message for message in messages if message]
+    key, weight = user_client(current_user)
+    try:
+        # One slot per batch, weighted by its questions in the fair share
+        async with chat_admission.admit(key, weight, cost=max(1, len(questions))) as ticket:
+            with deadline(settings.BATCH_CHAT_DEADLINE_SECONDS):
+                answered = await public_ask_batch(questions) if questions else []
+            ticket.charge(sum(output.get('tokens', 0) for output in answered))
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+    outputs = iter(answered)
+
+    results, rows, citations = [], [], []
+    created_at = datetime.now(timezone.utc)
+    for message in messages:
+        if not message:
+            results.append({"reply": "", "sources": [], "error": "Message is required"})
+            continue
+        output = next(outputs)
+        reply = output.get('result')
+        source_docs = output.get('source_documents', [])
+        results.append({"reply": reply, "sources": _format_sources(source_docs), "error": output.get('error')})
+        citations.append(citations_of(source_docs))
+        rows.append({
+            "user_uid": current_user.uid,
+            "conversation_type": ConversationType.PUBLIC,
+            "query": message,
+            "answer": reply,
+            "outcome": conversation_outcome(output).value,
+            "created_at": created_at,
+        })
+
+    if rows:
+        # One bulk INSERT returning the ids; db.add_all would insert row by row to fetch each id
+        stmt = insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True)
+        ids = list((await db.execute(stmt, rows)).scalars())
+        await save_citations(db, ids, citations)
+        await record_conversations(
+            db,
+            [Conversation(**row) for row in rows],
+            [[c["source"] for c in cited] for cited in citations],
+        )
+        await db.commit()
+
+    return prebuilt_response({"results": results})
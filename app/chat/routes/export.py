@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from app.accounts.permissions import admin_required
+from app.chat.models.conversation import ConversationType
+from app.chat.models.file import InfoType
+from app.chat.services.export import EXPORT_COMPRESSIONS, EXPORT_FORMATS, export_conversations, export_files
+
+logger = logging.getLogger(__name__)
+
+admin_export_router = APIRouter(
+    dependencies=[Depends(admin_required)],
+)
+
+
+def _streaming_response(name: str, body, fmt: str, compression: str) -> StreamingResponse:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    if compression not in EXPORT_COMPRESSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid compression. Must be one of: {', '.join(EXPORT_COMPRESSIONS)}"
+        )
+    media_type, extension = EXPORT_FORMATS[fmt]
+    compressed_type, suffix = EXPORT_COMPRESSIONS[compression]
+    filename = f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{extension}{suffix}"
+    return StreamingResponse(
+        body,
+        media_type=compressed_type or media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
+def _enum_param(enum_cls, value: Optional[str], label: str):
+    if not value:
+        return None
+    try:
+        return enum_cls(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid {label}. Must be one of: {', '.join([t.value for t in enum_cls])}"
+        )
+
+
+@admin_export_router.get("/conversations")
+async def export_conversations_endpoint(
+        format: str = Query("ndjson", description="ndjson or csv"),
+        compression: str = Query("none", description="none, gzip or zstd"),
+        since: Optional[datetime] = Query(None, description="Created at or after (ISO 8601, UTC if no offset)"),
+        until: Optional[datetime] = Query(None, description="Created before (ISO 8601, UTC if no offset)"),
+        conversation_type: Optional[str] = Query(None, description="Public or Private"),
+        user_uid: Optional[str] = Query(None),
+):
+    """
+    Stream the conversations history, one row per line, in id order. Memory
+    use does not depend on the number of rows exported.
+    """
+    conv_type = _enum_param(ConversationType, conversation_type, "conversation type")
+    body = export_conversations(format, compression, since, until, conv_type, user_uid)
+    return _streaming_response("conversations", body, format, compression)
+
+
+@admin_export_router.get("/files")
+async def export_files_endpoint(
+        format: str = Query("ndjson", description="ndjson or csv"),
+        compression: str = Query("none", description="none, gzip or zstd"),
+        since: Optional[datetime] = Query(None, description="Uploaded at or after (ISO 8601, UTC if no offset)"),
+        until: Optional[datetime] = Query(None, description="Uploaded before (ISO 8601, UTC if no offset)"),
+        information_type: Optional[str] = Query(None, description="Public or Private"),
+        user_uid: Optional[str] = Query(None),
+):
+    """Stream the metadata of uploaded files, one row per line, in id order."""
+    info_type = _enum_param(InfoType, information_type, "information type")
+    body = export_files(format, compression, since, until, info_type, user_uid)
+    return _streaming_response("files", body, format, compression)
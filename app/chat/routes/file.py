@@ -1,17 +1,30 @@
+import asyncio
+import hashlib
 import os
 import logging
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 
-from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException, status, Path, BackgroundTasks
+from fastapi import (
+    APIRouter, Depends, File, UploadFile, Form, HTTPException, status, Path, BackgroundTasks, Header, Query,
+    Request, Response,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.accounts.models.user import User
 from app.accounts.permissions import get_current_user, admin_required
 from app.chat.models.file import File as FileModel, InfoType
-from app.chat.schemas.file import FileOut, FileProcessResponse
+from app.chat.schemas.file import FileChunkStats, FileCitations, FileOut, FileProcessResponse, FileStatusOut
+from app.chat.services.chunks import file_chunk_stats
+from app.chat.services.citations import file_citations
 from app.chat.services.file import process_file_background
+from app.chat.services.file_events import file_events, file_states, files_version, format_sse, is_newer
+from app.config.admission import AdmissionRejected, ingestion_admission, too_many_requests, user_client
 from app.config.database import get_db
+from app.config.http_cache import FILES, bump_version, conditional_response, etag_matches
+from app.config.responses import prebuilt_response
 from app.config.settings import settings
 from app.config import settings as app_settings
 from app.chat.utils.process_file import process_file
@@ -24,6 +37,37 @@ logger = logging.getLogger(__name__)
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+FILE_OUT_COLUMNS = (
+    FileModel.id,
+    FileModel.uid,
+    FileModel.filename,
+    FileModel.uploaded_at,
+    FileModel.status,
+    FileModel.information_type,
+    FileModel.user_uid,
+    FileModel.pages_total,
+    FileModel.pages_processed,
+)
+
+
+def _file_row(row) -> Dict[str, Any]:
+    """FileOut-shaped dict from a FILE_OUT_COLUMNS row."""
+    item = dict(row)
+    item["information_type"] = row["information_type"].value
+    return item
+
+
+# Comment line sent on idle event streams so proxies keep them open
+SSE_HEARTBEAT_SECONDS = 15
+# How often event streams check the database for changes made by other workers
+SSE_POLL_SECONDS = 2
+
+
+def _status_etag(item: Dict[str, Any]) -> str:
+    key = f"{item['status']}:{item['pages_processed']}:{item['pages_total']}"
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+
 admin_files_router = APIRouter(
     dependencies=[Depends(admin_required)],
 )
@@ -31,14 +75,89 @@ admin_files_router = APIRouter(
 
 @admin_files_router.get("", response_model=List[FileOut])
 async def get_user_files(
+        request: Request,
         current_user: User = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
-    """Get all files uploaded by the current user."""
-    stmt = select(FileModel).where(FileModel.user_uid == current_user.uid).order_by(FileModel.uploaded_at.desc())
-    result = await db.execute(stmt)
-    files = result.scalars().all()
-    return files
+    """
+    Get all files uploaded by the current user. Answers 304 to a matching
+    If-None-Match or If-Modified-Since while no file has changed.
+    """
+    async def build():
+        # Select only the FileOut columns: no ORM entities to hydrate and no
+        # response_model validation of the (possibly long) list
+        stmt = (
+            select(*FILE_OUT_COLUMNS)
+            .where(FileModel.user_uid == current_user.uid)
+            .order_by(FileModel.uploaded_at.desc())
+        )
+        result = await db.execute(stmt)
+        return [_file_row(row) for row in result.mappings()]
+
+    return await conditional_response(request, db, FILES, current_user.uid, build)
+
+
+@admin_files_router.get("/events")
+async def file_events_stream(
+        request: Request,
+        current_user: User = Depends(get_current_user),
+        last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-sent events with the status and page progress of the current
+    user's files as they are processed, by this worker or another one.
+    Reconnecting clients get missed events replayed from `Last-Event-ID`,
+    or the current state of every file when this worker cannot replay them.
+    """
+    user_uid = current_user.uid
+
+    async def stream():
+        with file_events.subscribe() as queue:
+            version, known = await file_states(user_uid)
+            # Events queued since subscribing may already have been replayed
+            replayed = 0
+            if last_event_id is not None:
+                missed = file_events.replay(last_event_id)
+                if missed is None:
+                    # Another worker's id, or too old: resync from the database
+                    for data in known.values():
+                        event_id, _ = file_events.next_id()
+                        yield format_sse({"id": event_id, "data": data})
+                else:
+                    for event in missed:
+                        if event["user_uid"] == user_uid:
+                            known[event["data"]["uid"]] = event["data"]
+                            yield format_sse(event)
+                        replayed = event["seq"]
+            idle_since = time.monotonic()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    if await files_version() != version:
+                        version, current = await file_states(user_uid)
+                        for uid, data in current.items():
+                            if is_newer(data, known.get(uid)):
+                                known[uid] = data
+                                event_id, _ = file_events.next_id()
+                                idle_since = time.monotonic()
+                                yield format_sse({"id": event_id, "data": data})
+                    if time.monotonic() - idle_since >= SSE_HEARTBEAT_SECONDS:
+                        idle_since = time.monotonic()
+                        yield ": keepalive\n\n"
+                    continue
+                if event["user_uid"] == user_uid and event["seq"] > replayed:
+                    known[event["data"]["uid"]] = event["data"]
+                    idle_since = time.monotonic()
+                    yield format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @admin_files_router.post("", response_model=FileOut, status_code=status.HTTP_201_CREATED)
@@ -75,6 +194,7 @@ async def upload_file(
 
         # Add file record to database
         db.add(file_record)
+        await bump_version(db, FILES)
         await db.commit()
         await db.refresh(file_record)
 
@@ -119,6 +239,7 @@ async def delete_file(
         )
 
     # Delete the file using the model's async_delete method
+    await bump_version(db, FILES)
     await file.async_delete(db)
 
     # Return no content
@@ -127,6 +248,92 @@ async def delete_file(
 
 
 
+@admin_files_router.get("/{file_uid}/status", response_model=FileStatusOut)
+async def get_file_status(
+        file_uid: str = Path(..., description="The UID of the file"),
+        if_none_match: Optional[str] = Header(None),
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Status and page progress of one file. Send the returned ETag back in
+    If-None-Match to get an empty 304 while nothing has changed.
+    """
+    stmt = select(
+        FileModel.uid,
+        FileModel.status,
+        FileModel.pages_processed,
+        FileModel.pages_total,
+        FileModel.user_uid,
+    ).where(FileModel.uid == file_uid)
+    row = (await db.execute(stmt)).mappings().first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if row["user_uid"] != current_user.uid:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+
+    item = {key: row[key] for key in ("uid", "status", "pages_processed", "pages_total")}
+    etag = _status_etag(item)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return prebuilt_response(item, headers=headers)
+
+
+@admin_files_router.get("/{file_uid}/chunks", response_model=FileChunkStats)
+async def get_file_chunks(
+        file_uid: str = Path(..., description="The UID of the file"),
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Number, tokens and distinct contents of the chunks indexed for a file."""
+    stmt = select(FileModel.user_uid).where(FileModel.uid == file_uid)
+    row = (await db.execute(stmt)).first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if row.user_uid != current_user.uid:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return await file_chunk_stats(db, file_uid)
+
+
+@admin_files_router.get("/{file_uid}/citations", response_model=FileCitations)
+async def get_file_citations(
+        file_uid: str = Path(..., description="The UID of the file"),
+        limit: int = Query(20, ge=1, le=100, description="Latest citing conversations to return"),
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """How often a file was cited in answers, and the latest conversations citing it."""
+    stmt = select(FileModel.user_uid).where(FileModel.uid == file_uid)
+    row = (await db.execute(stmt)).first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if row.user_uid != current_user.uid:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Permission denied"
+        )
+    return await file_citations(db, file_uid, limit)
+
+
 @admin_files_router.post("/{file_uid}/process", response_model=FileProcessResponse)
 async def process_file_endpoint(
         file_uid: str = Path(..., description="The UID of the file to process"),
@@ -154,12 +361,26 @@ async def process_file_endpoint(
             detail="Permission denied"
         )
 
+    # Take the user's place in the ingestion queue; refused when over its quota or queue limit
+    try:
+        ticket = ingestion_admission.ticket(*user_client(current_user))
+    except AdmissionRejected as e:
+        raise too_many_requests(e)
+
     # Update status to "Processing"
-    file.status = "Processing"
-    await db.commit()
+    try:
+        file.status = "Processing"
+        file.pages_total = None
+        file.pages_processed = 0
+        await bump_version(db, FILES)
+        await db.commit()
+    except Exception:
+        ticket.release()
+        raise
+    file_events.publish(file_uid, file.user_uid, "Processing")
 
     # Add the processing task to background tasks
-    background_tasks.add_task(process_file_background, file_uid, db)
+    background_tasks.add_task(process_file_background, file_uid, ticket)
 
     # Return response
     return FileProcessResponse(
@@ -0,0 +1,76 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.accounts.models.user import User
+from app.accounts.permissions import get_current_user
+from app.chat.schemas.search import SearchRequest, SearchResponse
+from app.chat.services.search import search_collection
+from app.chat.utils.private_chat import private_vector_store
+from app.chat.utils.public_chat import public_vector_store
+from app.config.database import get_db
+from app.config.resilience import CircuitOpenError, DeadlineExceeded, deadline
+from app.config.responses import prebuilt_response
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+search_router = APIRouter()
+
+
+async def _search(request: SearchRequest, db: AsyncSession, store, collection: str):
+    query = request.query.strip()
+    if not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query is required"
+        )
+    if request.offset >= settings.SEARCH_MAX_RESULTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only the first {settings.SEARCH_MAX_RESULTS} results can be paged through"
+        )
+    try:
+        with deadline(settings.SEARCH_DEADLINE_SECONDS):
+            result = await search_collection(
+                db,
+                store,
+                collection,
+                query,
+                limit=request.limit,
+                offset=request.offset,
+                sources=request.sources,
+                metadata=request.metadata,
+            )
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.warning(f"Search of the {collection} documents unavailable: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Search is temporarily unavailable",
+            headers={"Retry-After": str(int(settings.CIRCUIT_BREAKER_OPEN_SECONDS))},
+        )
+    # Already shaped like SearchResponse
+    return prebuilt_response(result)
+
+
+@search_router.post("", response_model=SearchResponse)
+async def public_search(
+    request: SearchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Top chunks of the public documents for a query, with relevance scores,
+    highlights and file metadata. Retrieval only: no answer is generated.
+    """
+    return await _search(request, db, public_vector_store, "public")
+
+
+@search_router.post("/private", response_model=SearchResponse)
+async def private_search(
+    request: SearchRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Same as the public search, over the private documents."""
+    return await _search(request, db, private_vector_store, "private")
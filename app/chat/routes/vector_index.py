@@ -0,0 +1,320 @@
+import asyncio
+import logging
+from typing import List
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query, status
+
+from app.accounts.permissions import admin_required
+from app.chat.schemas.vector_index import (
+    CollectionStats, HNSWParams, MaintenanceResponse, ProfileBenchmarkRequest,
+    ProfileBenchmarkResult, ReconcileReport, ShadowBuildRequest, ShadowStatus, SnapshotExportRequest,
+    SnapshotImportRequest, SnapshotInfo, SweepRequest, SweepResult,
+)
+from app.chat.services.chunks import reconcile_chunks
+from app.chat.services.file import reindex_collection_background
+from app.chat.services.vector_index import (
+    VECTOR_STORES,
+    RebuildInProgress,
+    benchmark_embedding_profiles,
+    collection_stats,
+    embedding_profile,
+    is_rebuilding,
+    rebuild_collection_background,
+    recall_latency_sweep,
+    update_search_ef,
+)
+from app.chat.services.vector_shadow import (
+    ShadowError,
+    build_shadow_background,
+    drop_standby,
+    rollback,
+    shadow_status,
+    switch_to_shadow,
+    target_profile,
+)
+from app.chat.services.vector_snapshot import (
+    SnapshotError,
+    default_snapshot_name,
+    export_collection_background,
+    import_snapshot_background,
+    list_snapshots,
+    read_manifest,
+    snapshot_path,
+)
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+admin_vectors_router = APIRouter(
+    dependencies=[Depends(admin_required)],
+)
+
+
+def _check_collection(name: str) -> None:
+    if name not in VECTOR_STORES:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown collection. Must be one of: {', '.join(VECTOR_STORES)}"
+        )
+
+
+def _check_not_rebuilding(name: str) -> None:
+    if is_rebuilding(name):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A rebuild of this collection is already in progress"
+        )
+
+
+@admin_vectors_router.get("", response_model=List[CollectionStats])
+async def list_collection_stats():
+    """Stats for every vector collection."""
+    return await asyncio.to_thread(lambda: [collection_stats(name) for name in VECTOR_STORES])
+
+
+@admin_vectors_router.get("/snapshots", response_model=List[SnapshotInfo])
+async def get_snapshots():
+    """Snapshots available in SNAPSHOT_DIR."""
+    return await asyncio.to_thread(list_snapshots)
+
+
+@admin_vectors_router.get("/{collection}", response_model=CollectionStats)
+async def get_collection_stats(
+        collection: str = Path(..., description="public or private"),
+):
+    """Vector count, on-disk size and deleted ratio of one collection."""
+    _check_collection(collection)
+    return await asyncio.to_thread(collection_stats, collection)
+
+
+@admin_vectors_router.patch("/{collection}/hnsw", response_model=MaintenanceResponse)
+async def set_hnsw_params(
+        params: HNSWParams,
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+):
+    """
+    Update HNSW parameters. ef_search is applied in place; M and
+    ef_construction only take effect through a background rebuild.
+    """
+    _check_collection(collection)
+    if params.m is None and params.ef_construction is None:
+        if params.ef_search is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="At least one parameter is required"
+            )
+        await asyncio.to_thread(update_search_ef, collection, params.ef_search)
+        return MaintenanceResponse(message="ef_search updated")
+
+    _check_not_rebuilding(collection)
+    background_tasks.add_task(
+        rebuild_collection_background,
+        collection,
+        m=params.m,
+        ef_construction=params.ef_construction,
+        ef_search=params.ef_search,
+    )
+    return MaintenanceResponse(message="Rebuild with new HNSW parameters started", rebuild_scheduled=True)
+
+
+@admin_vectors_router.post("/{collection}/compact", response_model=MaintenanceResponse)
+async def compact_collection(
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+):
+    """Rebuild the collection without deleted entries and swap it in atomically."""
+    _check_collection(collection)
+    _check_not_rebuilding(collection)
+    background_tasks.add_task(rebuild_collection_background, collection)
+    return MaintenanceResponse(message="Compaction started", rebuild_scheduled=True)
+
+
+@admin_vectors_router.post("/{collection}/sweep", response_model=List[SweepResult])
+async def sweep_hnsw_params(
+        request: SweepRequest,
+        collection: str = Path(..., description="public or private"),
+):
+    """Recall@k and latency for each combination of HNSW parameters."""
+    _check_collection(collection)
+    return await asyncio.to_thread(
+        recall_latency_sweep,
+        collection,
+        request.m_values,
+        request.ef_construction_values,
+        request.ef_search_values,
+        request.k,
+        request.sample_size,
+        request.max_vectors,
+    )
+
+
+@admin_vectors_router.post("/{collection}/reindex", response_model=MaintenanceResponse)
+async def reindex_collection(
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+):
+    """
+    Re-embed all processed files with the configured embedding profile.
+    The collection is empty until every file has been processed again;
+    use the /shadow endpoints to re-embed while chat keeps working.
+    """
+    _check_collection(collection)
+    _check_not_rebuilding(collection)
+    background_tasks.add_task(reindex_collection_background, collection)
+    return MaintenanceResponse(message="Re-indexing started", rebuild_scheduled=True)
+
+
+@admin_vectors_router.get("/{collection}/shadow", response_model=ShadowStatus)
+async def get_shadow_status(
+        collection: str = Path(..., description="public or private"),
+):
+    """Live and standby versions of the collection, and the progress of a shadow build."""
+    _check_collection(collection)
+    return await asyncio.to_thread(shadow_status, collection)
+
+
+@admin_vectors_router.post("/{collection}/shadow", response_model=MaintenanceResponse)
+async def start_shadow_build(
+        request: ShadowBuildRequest,
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+):
+    """
+    Re-embed the collection into a shadow collection for another embedding
+    profile, at a throttled rate, while chat keeps reading the live one.
+    New chunks are written to both. A stopped build resumes where it was.
+    """
+    _check_collection(collection)
+    _check_not_rebuilding(collection)
+    dimensions = request.embedding_dimensions
+    if "embedding_dimensions" not in request.model_fields_set:
+        dimensions = settings.EMBEDDING_DIMENSIONS
+    profile = target_profile(
+        request.embedding_backend, request.embedding_model, dimensions, request.embedding_onnx_model,
+    )
+    current = await asyncio.to_thread(shadow_status, collection)
+    if current["standby"] == "previous":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The previous version is kept for rollback; drop it before re-embedding again"
+        )
+    if current["live_profile"] == profile:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Collection is already embedded with {profile}"
+        )
+    background_tasks.add_task(build_shadow_background, collection, profile)
+    return MaintenanceResponse(message=f"Shadow build for {profile} started", rebuild_scheduled=True)
+
+
+async def _shadow_action(func, collection: str):
+    _check_collection(collection)
+    try:
+        return await asyncio.to_thread(func, collection)
+    except (RebuildInProgress, ShadowError) as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@admin_vectors_router.post("/{collection}/shadow/switch", response_model=ShadowStatus)
+async def switch_shadow(
+        collection: str = Path(..., description="public or private"),
+):
+    """
+    Serve the shadow collection. Writes pause while the vectors it still
+    misses are embedded; reads never do. The old version stays up to date
+    for a rollback until it is dropped.
+    """
+    return await _shadow_action(switch_to_shadow, collection)
+
+
+@admin_vectors_router.post("/{collection}/shadow/rollback", response_model=ShadowStatus)
+async def rollback_shadow(
+        collection: str = Path(..., description="public or private"),
+):
+    """Serve the previous version again; the newer one becomes the shadow collection."""
+    return await _shadow_action(rollback, collection)
+
+
+@admin_vectors_router.delete("/{collection}/shadow", response_model=ShadowStatus)
+async def drop_shadow(
+        collection: str = Path(..., description="public or private"),
+):
+    """Stop a shadow build and delete the shadow or previous version of the collection."""
+    return await _shadow_action(drop_standby, collection)
+
+
+@admin_vectors_router.post("/{collection}/reconcile", response_model=ReconcileReport)
+async def reconcile_collection(
+        collection: str = Path(..., description="public or private"),
+        repair: bool = Query(True, description="Fix the differences found, not only report them"),
+):
+    """
+    Compare the `chunks` table with the collection: drop rows of missing
+    vectors, register vectors of known files and delete vectors of none,
+    then link migrated conversation citations to their chunks.
+    """
+    _check_collection(collection)
+    _check_not_rebuilding(collection)
+    return await reconcile_chunks(collection, repair=repair)
+
+
+@admin_vectors_router.post("/{collection}/profiles/benchmark", response_model=List[ProfileBenchmarkResult])
+async def benchmark_profiles(
+        request: ProfileBenchmarkRequest,
+        collection: str = Path(..., description="public or private"),
+):
+    """Memory, latency and recall@k of reduced-dimension and quantized profiles."""
+    _check_collection(collection)
+    return await asyncio.to_thread(
+        benchmark_embedding_profiles,
+        collection,
+        request.dimensions_values,
+        request.modes,
+        request.k,
+        request.sample_size,
+        request.max_vectors,
+    )
+
+
+@admin_vectors_router.post("/{collection}/snapshots", response_model=MaintenanceResponse)
+async def export_snapshot(
+        request: SnapshotExportRequest,
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+):
+    """Export ids, documents, metadata and embeddings to a snapshot in SNAPSHOT_DIR."""
+    _check_collection(collection)
+    name = request.name or default_snapshot_name(collection)
+    background_tasks.add_task(export_collection_background, collection, name, request.dtype)
+    return MaintenanceResponse(message=f"Export to snapshot {name} started")
+
+
+@admin_vectors_router.post("/{collection}/snapshots/{snapshot}/import", response_model=MaintenanceResponse)
+async def import_snapshot(
+        request: SnapshotImportRequest,
+        background_tasks: BackgroundTasks,
+        collection: str = Path(..., description="public or private"),
+        snapshot: str = Path(..., description="Snapshot name"),
+):
+    """
+    Load a snapshot into the collection without calling the embeddings API.
+    With `replace` the collection is swapped for the snapshot's contents.
+    """
+    _check_collection(collection)
+    _check_not_rebuilding(collection)
+    try:
+        manifest = await asyncio.to_thread(read_manifest, snapshot_path(snapshot))
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    if not (request.replace or request.force):
+        current_profile = await asyncio.to_thread(embedding_profile, collection)
+        if manifest["embedding_profile"] != current_profile:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Snapshot was built with {manifest['embedding_profile']}, collection uses {current_profile}"
+            )
+    background_tasks.add_task(
+        import_snapshot_background, collection, snapshot, replace=request.replace, force=request.force,
+    )
+    return MaintenanceResponse(message=f"Import of snapshot {snapshot} started", rebuild_scheduled=True)
@@ -0,0 +1,44 @@
+from datetime import date, datetime
+from typing import List
+
+from pydantic import BaseModel
+
+
+class OutcomeCounts(BaseModel):
+    answered: int = 0
+    unanswered: int = 0
+    error: int = 0
+
+
+class AnalyticsTotals(OutcomeCounts):
+    conversations: int = 0
+
+
+class DailyConversationStats(OutcomeCounts):
+    day: date
+    conversation_type: str
+    total: int
+
+
+class SourceCitations(BaseModel):
+    source: str
+    citations: int
+
+
+class UnansweredQuestion(BaseModel):
+    query: str
+    conversation_type: str
+    count: int
+    last_asked_at: datetime
+
+
+class ConversationAnalytics(BaseModel):
+    since: date
+    totals: AnalyticsTotals
+    daily: List[DailyConversationStats]
+    top_sources: List[SourceCitations]
+    top_unanswered: List[UnansweredQuestion]
+
+
+class RollupRebuildResponse(BaseModel):
+    message: str
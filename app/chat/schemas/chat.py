@@ -20,4 +20,19 @@ class SourceDocument(BaseModel):
 
 class ChatResponseWithSources(ChatResponse):
     """Response model for chat endpoints with sources."""
-    sources: List[SourceDocument] = Field(default_factory=list, description="Source documents used for the reply")
\ No newline at end of file
+    sources: List[SourceDocument] = Field(default_factory=list, description="Source documents used for the reply")
+
+
+class BatchChatRequest(BaseModel):
+    """Request model for the batch chat endpoint."""
+    messages: List[str] = Field(..., min_length=1, description="Questions to answer, at most BATCH_CHAT_MAX_QUESTIONS")
+
+
+class BatchChatResult(ChatResponseWithSources):
+    """One answer of a batch, in the order of the request's messages."""
+    error: Optional[str] = Field(None, description="Why the question could not be answered, if it failed")
+
+
+class BatchChatResponse(BaseModel):
+    """Response model for the batch chat endpoint."""
+    results: List[BatchChatResult] = Field(default_factory=list)
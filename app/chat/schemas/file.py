@@ -1,6 +1,6 @@
 
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -24,12 +24,47 @@ class FileOut(FileBase):
     status: str
     information_type: InfoType
     user_uid: Optional[str] = None
+    pages_total: Optional[int] = None
+    pages_processed: int = 0
 
     class Config:
         from_attributes = True
 
 
+class FileStatusOut(BaseModel):
+    """Processing status of one file, see GET /admin/files/{uid}/status."""
+    uid: str
+    status: str
+    pages_processed: int = 0
+    pages_total: Optional[int] = None
+
+
 class FileProcessResponse(BaseModel):
     """Response model for file processing endpoint."""
     message: str
     status: str
+
+
+class FileChunkStats(BaseModel):
+    """Chunks indexed for one file, see GET /admin/files/{uid}/chunks."""
+    file_uid: str
+    chunk_count: int
+    token_count: int
+    distinct_chunks: int
+
+
+class FileCitation(BaseModel):
+    """A conversation that cited a file."""
+    conversation_uid: str
+    query: str
+    created_at: datetime
+    rank: int
+    score: Optional[float] = None
+
+
+class FileCitations(BaseModel):
+    """Citations of one file, see GET /admin/files/{uid}/citations."""
+    file_uid: str
+    citation_count: int
+    conversation_count: int
+    recent: List[FileCitation]
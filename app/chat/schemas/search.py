@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class SearchRequest(BaseModel):
+    """Request model for the retrieval-only search endpoints."""
+    query: str = Field(..., description="Text to search for")
+    limit: int = Field(10, ge=1, le=50, description="Results per page")
+    offset: int = Field(0, ge=0, description="Results to skip, e.g. the previous response's next_offset")
+    sources: Optional[List[str]] = Field(None, description="Only chunks of these filenames")
+    metadata: Optional[Dict[str, Union[str, int, float, bool]]] = Field(
+        None, description="Only chunks whose metadata has these exact values, e.g. {\"page\": 3}"
+    )
+
+
+class SearchResult(BaseModel):
+    """One matching chunk."""
+    content: str
+    score: float = Field(..., description="Relevance between 0 and 1, higher is better")
+    highlights: List[str] = Field(default_factory=list, description="Excerpts with the query's words in <mark>")
+    file_uid: Optional[str] = None
+    filename: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+    chunk_index: Optional[int] = Field(None, description="Position of the chunk in its file")
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult] = Field(default_factory=list)
+    offset: int
+    limit: int
+    next_offset: Optional[int] = Field(None, description="Offset of the next page, if there is one")
@@ -0,0 +1,149 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class CollectionStats(BaseModel):
+    """Size and health of one vector collection."""
+    name: str
+    collection_name: str
+    vector_count: int
+    index_element_count: int = Field(..., description="Slots used in the HNSW index, including deleted vectors")
+    deleted_count: int
+    deleted_ratio: float
+    index_capacity: Optional[int] = None
+    index_size_bytes: int
+    persist_size_bytes: int
+    space: Optional[str] = None
+    m: Optional[int] = None
+    ef_construction: Optional[int] = None
+    ef_search: Optional[int] = None
+    embedding_profile: str = Field(..., description="Embedding model and dimensions the vectors were built with")
+    expected_embedding_profile: str = Field(..., description="Embedding profile of the current settings")
+    collection_version: int = Field(1, description="Raised each time the collection is re-embedded")
+    rebuilding: bool = False
+
+
+class HNSWParams(BaseModel):
+    """HNSW parameters; M and ef_construction changes trigger a rebuild."""
+    m: Optional[int] = Field(None, ge=4, le=128)
+    ef_construction: Optional[int] = Field(None, ge=10, le=2000)
+    ef_search: Optional[int] = Field(None, ge=1, le=2000)
+
+
+class MaintenanceResponse(BaseModel):
+    message: str
+    rebuild_scheduled: bool = False
+
+
+class SweepRequest(BaseModel):
+    m_values: List[int] = Field(default_factory=lambda: [16, 32])
+    ef_construction_values: List[int] = Field(default_factory=lambda: [100, 200])
+    ef_search_values: List[int] = Field(default_factory=lambda: [10, 50, 100, 200])
+    k: int = Field(10, ge=1, le=100)
+    sample_size: int = Field(100, ge=1, le=1000)
+    max_vectors: int = Field(20000, ge=1)
+
+
+class SweepResult(BaseModel):
+    m: int
+    ef_construction: int
+    ef_search: int
+    recall_at_k: float
+    latency_p50_ms: float
+    latency_p95_ms: float
+    build_seconds: float
+
+
+class ProfileBenchmarkRequest(BaseModel):
+    """Embedding profiles to compare; None in dimensions_values means full size."""
+    dimensions_values: List[Optional[int]] = Field(default_factory=lambda: [None, 1024, 256])
+    modes: List[Literal["none", "int8", "binary"]] = Field(default_factory=lambda: ["none", "int8", "binary"])
+    k: int = Field(10, ge=1, le=100)
+    sample_size: int = Field(100, ge=1, le=1000)
+    max_vectors: int = Field(20000, ge=1)
+
+
+class ProfileBenchmarkResult(BaseModel):
+    dimensions: int
+    quantization: str
+    bytes_per_vector: float
+    index_bytes: int
+    recall_at_k: float
+    latency_p50_ms: float
+    latency_p95_ms: float
+
+
+class SnapshotExportRequest(BaseModel):
+    name: Optional[str] = Field(
+        None, pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]*$", description="Defaults to <collection>-<UTC timestamp>"
+    )
+    dtype: Literal["float32", "float16"] = "float32"
+
+
+class SnapshotImportRequest(BaseModel):
+    replace: bool = Field(False, description="Swap in a collection built from the snapshot only")
+    force: bool = Field(False, description="Merge even if the embedding profiles differ")
+
+
+class SnapshotInfo(BaseModel):
+    name: str
+    collection: str
+    count: int
+    dimensions: Optional[int] = None
+    dtype: str
+    embedding_profile: str
+    created_at: str
+
+
+class ReconcileReport(BaseModel):
+    """Differences between the `chunks` table and a collection."""
+    collection: str
+    registered_chunks: int
+    vectors: int
+    missing_vectors: int = Field(..., description="Registered chunks whose vector is not in the collection")
+    unregistered_vectors: int = Field(..., description="Vectors of a known file that are not registered")
+    orphan_vectors: int = Field(..., description="Vectors of no known file")
+    linked_citations: int = Field(0, description="Citations migrated from JSON sources linked to their chunk")
+    repaired: bool
+
+
+class ShadowBuildRequest(BaseModel):
+    """Embedding profile to re-embed into; omitted fields come from the settings."""
+    embedding_backend: Optional[Literal["openai", "onnx"]] = None
+    embedding_model: Optional[str] = None
+    embedding_dimensions: Optional[int] = Field(
+        None, ge=1, description="None requests the native size; omit to use EMBEDDING_DIMENSIONS"
+    )
+    embedding_onnx_model: Optional[str] = None
+
+
+class ShadowBuildProgress(BaseModel):
+    """Shadow build run by the worker that answers."""
+    state: Literal["building", "ready", "failed", "cancelled"]
+    embedding_profile: str
+    total: int
+    embedded: int
+    skipped: int = Field(..., description="Vectors already in the shadow collection, e.g. when resuming")
+    progress: float
+    vectors_per_second: float
+    eta_seconds: Optional[float] = None
+    started_at: float
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ShadowStatus(BaseModel):
+    """Live version of a collection and its shadow (not yet live) or previous (rollback) version."""
+    collection: str
+    live_version: int
+    live_profile: str
+    live_count: int
+    serving_profile: str = Field(..., description="Profile queries and new chunks are embedded with")
+    expected_embedding_profile: str = Field(..., description="Embedding profile of the current settings")
+    standby: Optional[Literal["shadow", "previous"]] = None
+    standby_version: Optional[int] = None
+    standby_profile: Optional[str] = None
+    standby_count: Optional[int] = None
+    rebuilding: bool = False
+    build: Optional[ShadowBuildProgress] = None
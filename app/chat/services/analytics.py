@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import logging
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.chat.models.analytics import ConversationDailyStats, SourceCitationStats, UnansweredQuestionStats
+from app.chat.models.conversation import Conversation, ConversationOutcome, ConversationType
+from app.chat.services.citations import cited_source_names
+from app.chat.utils.routing import NO_ANSWER_TIER
+from app.config.database import AsyncSessionLocal, engine
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Canned replies of public_ask/ask, used to classify rows saved before
+# conversations had an outcome
+_FAILURE_REPLY_PREFIX = "Sorry, something went wrong"
+_MAX_QUERY_CHARS = 1000
+_WHITESPACE_RE = re.compile(r"\s+")
+# One rollup rebuild at a time in this worker
+_rebuild_lock = asyncio.Lock()
+
+
+def conversation_outcome(output: Dict) -> ConversationOutcome:
+    """Outcome of a public_ask/ask result."""
+    if output.get("failed") or output.get("degraded"):
+        return ConversationOutcome.ERROR
+    if output.get("tier") == NO_ANSWER_TIER:
+        return ConversationOutcome.UNANSWERED
+    return ConversationOutcome.ANSWERED
+
+
+def _legacy_outcome(answer: str) -> ConversationOutcome:
+    if answer == settings.NO_RELEVANT_DOCUMENTS_REPLY:
+        return ConversationOutcome.UNANSWERED
+    if answer.startswith(_FAILURE_REPLY_PREFIX):
+        return ConversationOutcome.ERROR
+    return ConversationOutcome.ANSWERED
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE_RE.sub(" ", query).strip().rstrip("?!. ").lower()[:_MAX_QUERY_CHARS]
+
+
+def _query_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def _cited_sources(sources: Iterable[str]) -> List[str]:
+    """Distinct sources of one conversation: a document cited by several chunks counts once."""
+    return sorted({source for source in sources or [] if source})
+
+
+# --------------------------------------------------------------------------- #
+# Rollup maintenance                                                          #
+# --------------------------------------------------------------------------- #
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def _insert(model):
+    dialect = postgresql if _is_postgres() else sqlite
+    return dialect.insert(model.__table__)
+
+
+async def _increment(db: AsyncSession, model, keys: List[str], rows: List[Dict], latest: List[str] = ()) -> None:
+    """Add each row's `count` to its rollup row, creating it if needed."""
+    if not rows:
+        return
+    stmt = _insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            "count": model.__table__.c.count + stmt.excluded["count"],
+            **{column: stmt.excluded[column] for column in latest},
+        },
+    )
+    await db.execute(stmt, rows)
+
+
+async def _apply(
+        db: AsyncSession,
+        daily: Counter,
+        citations: Counter,
+        unanswered: Dict,
+) -> None:
+    await _increment(
+        db, ConversationDailyStats, ["day", "conversation_type", "outcome"],
+        [{"day": d, "conversation_type": t, "outcome": o, "count": n} for (d, t, o), n in daily.items()],
+    )
+    await _increment(
+        db, SourceCitationStats, ["day", "conversation_type", "source"],
+        [{"day": d, "conversation_type": t, "source": s, "count": n} for (d, t, s), n in citations.items()],
+    )
+    await _increment(
+        db, UnansweredQuestionStats, ["day", "query_hash", "conversation_type"],
+        [
+            {"day": d, "query_hash": h, "conversation_type": t, "query": q, "count": n, "last_asked_at": at}
+            for (d, h, t), (q, n, at) in unanswered.items()
+        ],
+        latest=["query", "last_asked_at"],
+    )
+
+
+def _accumulate(
+        daily: Counter,
+        citations: Counter,
+        unanswered: Dict,
+        conversation_type: ConversationType,
+        outcome: str,
+        query: str,
+        sources: Iterable[str],
+        created_at: datetime,
+) -> None:
+    day = created_at.date()
+    daily[(day, conversation_type, outcome)] += 1
+    for source in _cited_sources(sources):
+        citations[(day, conversation_type, source[:256])] += 1
+    if outcome == ConversationOutcome.UNANSWERED.value:
+        normalized = normalize_query(query)
+        key = (day, _query_hash(normalized), conversation_type)
+        _, count, last = unanswered.get(key, (None, 0, created_at))
+        unanswered[key] = (normalized, count + 1, max(last, created_at))
+
+
+async def record_conversation(db: AsyncSession, conversation: Conversation, sources: List[str]) -> None:
+    """
+    Add a new conversation, citing the named `sources`, to the rollups, in
+    the caller's transaction so rollups and conversations are committed
+    together.
+    """
+    await record_conversations(db, [conversation], [sources])
+
+
+async def record_conversations(
+        db: AsyncSession,
+        conversations: List[Conversation],
+        sources: List[List[str]],
+) -> None:
+    """`record_conversation` for many conversations, with one upsert per rollup."""
+    daily, citations, unanswered = Counter(), Counter(), {}
+    for conversation, cited in zip(conversations, sources):
+        if conversation.created_at is None:
+            conversation.created_at = datetime.now(timezone.utc)
+        _accumulate(
+            daily, citations, unanswered,
+            conversation.conversation_type,
+            conversation.outcome or ConversationOutcome.ANSWERED.value,
+            conversation.query,
+            cited,
+            conversation.created_at,
+        )
+    await _apply(db, daily, citations, unanswered)
+
+
+def _as_utc(created_at: Optional[datetime]) -> datetime:
+    created_at = created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at
+
+
+def rollup_floor(now: Optional[datetime] = None) -> Optional[date]:
+    """
+    First day whose conversations are all still in the conversations
+    table: the archiver only moves conversations older than the retention
+    cutoff of its run, so nothing from the day after today's cutoff on has
+    been archived. None when retention is disabled.
+    """
+    if settings.CONVERSATION_RETENTION_DAYS <= 0:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=settings.CONVERSATION_RETENTION_DAYS)).date() + timedelta(days=1)
+
+
+async def rebuild_conversation_rollups(db: AsyncSession, batch_size: int = 5000) -> int:
+    """
+    Recompute the rollups from the conversations table, e.g. to backfill
+    rows saved before rollups existed. Rows whose created_at was backfilled
+    by the migration have no real day, so they are left out; returns the
+    number of conversations counted.
+
+    The rollups are cleared together with reading the last conversation id
+    in one short transaction; conversations up to that id are then counted
+    in id order, one committed batch at a time, and later ones by
+    `record_conversations` as they are saved. No transaction stays open
+    across the scan, so chat keeps writing while dashboards show partial
+    numbers for the duration.
+
+    With retention enabled, days that may already be archived (see
+    `rollup_floor`) keep their rollup rows and are not recounted.
+    """
+    floor = rollup_floor()
+    if _is_postgres():
+        # Wait for conversations being saved to commit with their rollup
+        # upserts, and hold new ones back until the rollups are cleared.
+        # Chat inserts the conversation before the rollups, so this cannot
+        # deadlock with it.
+        await db.execute(text("LOCK TABLE conversations IN SHARE MODE"))
+    # On SQLite the delete takes the write lock before the id is read
+    for model in (ConversationDailyStats, SourceCitationStats, UnansweredQuestionStats):
+        stmt = delete(model)
+        if floor is not None:
+            stmt = stmt.where(model.day >= floor)
+        await db.execute(stmt)
+    cutoff_id = (await db.execute(select(func.max(Conversation.id)))).scalar() or 0
+    await db.commit()
+
+    last_id, total, skipped = 0, 0, 0
+    while True:
+        stmt = (
+            select(
+                Conversation.id,
+                Conversation.conversation_type,
+                Conversation.outcome,
+                Conversation.query,
+                Conversation.answer,
+                Conversation.created_at,
+                Conversation.created_at_backfilled,
+            )
+            .where(Conversation.id > last_id, Conversation.id <= cutoff_id)
+            .order_by(Conversation.id)
+            .limit(batch_size)
+        )
+        rows = (await db.execute(stmt)).all()
+        if not rows:
+            break
+
+        last_id = rows[-1].id
+        dated = [row for row in rows if not row.created_at_backfilled]
+        skipped += len(rows) - len(dated)
+        if floor is not None:
+            dated = [row for row in dated if _as_utc(row.created_at).date() >= floor]
+        if not dated:
+            await db.commit()
+            continue
+
+        names = await cited_source_names(db, [row.id for row in dated])
+        daily, citations, unanswered = Counter(), Counter(), {}
+        for row in dated:
+            created_at = _as_utc(row.created_at)
+            _accumulate(
+                daily, citations, unanswered,
+                row.conversation_type or ConversationType.PUBLIC,
+                row.outcome or _legacy_outcome(row.answer).value,
+                row.query,
+                names.get(row.id, []),
+                created_at,
+            )
+        await _apply(db, daily, citations, unanswered)
+        await db.commit()
+        total += len(dated)
+
+    logger.info(
+        f"Rebuilt conversation rollups from {total} conversations "
+        f"({skipped} with a backfilled created_at left out"
+        + (f", days before {floor} kept as they were)" if floor is not None else ")")
+    )
+    return total
+
+
+async def rebuild_conversation_rollups_background() -> None:
+    if _rebuild_lock.locked():
+        # A second rebuild would clear the rollups under the running one
+        logger.warning("Conversation rollups are already being rebuilt")
+        return
+    try:
+        async with _rebuild_lock, AsyncSessionLocal() as db:
+            await rebuild_conversation_rollups(db)
+    except Exception:
+        logger.exception("Error rebuilding conversation rollups")
+
+
+# --------------------------------------------------------------------------- #
+# Reporting                                                                   #
+# --------------------------------------------------------------------------- #
+async def conversation_analytics(
+        db: AsyncSession,
+        days: int = 30,
+        conversation_type: Optional[ConversationType] = None,
+        limit: int = 20,
+) -> Dict:
+    """Dashboard numbers for the last `days` days, read from the rollups only."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+    stmt = select(ConversationDailyStats).where(ConversationDailyStats.day >= since)
+    if conversation_type:
+        stmt = stmt.where(ConversationDailyStats.conversation_type == conversation_type)
+    daily: Dict = {}
+    totals = {"conversations": 0, **{outcome.value: 0 for outcome in ConversationOutcome}}
+    for row in (await db.execute(stmt.order_by(ConversationDailyStats.day))).scalars():
+        key = (row.day, row.conversation_type)
+        if key not in daily:
+            daily[key] = {
+                "day": row.day,
+                "conversation_type": row.conversation_type.value,
+                "total": 0,
+                **{outcome.value: 0 for outcome in ConversationOutcome},
+            }
+        daily[key][row.outcome] = daily[key].get(row.outcome, 0) + row.count
+        daily[key]["total"] += row.count
+        totals[row.outcome] = totals.get(row.outcome, 0) + row.count
+        totals["conversations"] += row.count
+
+    citations = func.sum(SourceCitationStats.count).label("citations")
+    stmt = select(SourceCitationStats.source, citations).where(SourceCitationStats.day >= since)
+    if conversation_type:
+        stmt = stmt.where(SourceCitationStats.conversation_type == conversation_type)
+    stmt = stmt.group_by(SourceCitationStats.source).order_by(citations.desc()).limit(limit)
+    top_sources = [{"source": source, "citations": count} for source, count in (await db.execute(stmt)).all()]
+
+    asked = func.sum(UnansweredQuestionStats.count).label("asked")
+    stmt = select(
+        func.max(UnansweredQuestionStats.query).label("query"),
+        UnansweredQuestionStats.conversation_type,
+        asked,
+        func.max(UnansweredQuestionStats.last_asked_at).label("last_asked_at"),
+    ).where(UnansweredQuestionStats.day >= since)
+    if conversation_type:
+        stmt = stmt.where(UnansweredQuestionStats.conversation_type == conversation_type)
+    stmt = stmt.group_by(
+        UnansweredQuestionStats.query_hash, UnansweredQuestionStats.conversation_type,
+    ).order_by(asked.desc()).limit(limit)
+    top_unanswered = [
+        {
+            "query": row.query,
+            "conversation_type": row.conversation_type.value,
+            "count": row.asked,
+            "last_asked_at": row.last_asked_at,
+        }
+        for row in (await db.execute(stmt)).all()
+    ]
+
+    return {
+        "since": since,
+        "totals": totals,
+        "daily": list(daily.values()),
+        "top_sources": top_sources,
+        "top_unanswered": top_unanswered,
+    }
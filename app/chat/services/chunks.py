@@ -0,0 +1,389 @@
+"""
+SQL registry of the chunks embedded for each file (`chunks` table).
+
+`process_file` records every chunk it adds to Chroma with its vector id,
+ordinal, token count and content hash. Deleting a file then deletes its
+vectors by id, re-processing a file re-embeds only chunks whose content
+changed (unchanged chunks keep their id, which conversation citations
+refer to), and per-file stats are plain SQL aggregates.
+
+`reconcile_chunks` compares the registry with a Chroma collection and
+repairs drift: rows whose vector is gone are dropped, vectors of known
+files missing from the registry are registered (this also backfills files
+indexed before the registry existed), and vectors of no known file are
+deleted. Files being processed are left alone, and every difference is
+checked again right before it is repaired. Citations migrated from
+the old JSON sources are then linked to their chunks.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from langchain_core.documents import Document
+from sqlalchemy import delete, func, insert, select, update
+
+from app.chat.models.chunk import Chunk
+from app.chat.models.citation import ConversationCitation
+from app.chat.models.file import File as FileModel, InfoType
+from app.chat.services.vector_index import vector_writes
+from app.chat.utils.reranking import count_tokens
+from app.config.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Ids per Chroma get/delete call and per SQL IN (...) list
+_ID_BATCH = 1000
+
+
+def collection_of(information_type: InfoType) -> str:
+    return "private" if information_type == InfoType.PRIVATE else "public"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _batches(items: List, size: int = _ID_BATCH) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _existing_ids(store, ids: List[str]) -> Set[str]:
+    found = set()
+    for batch in _batches(ids):
+        found.update(store._collection.get(ids=batch, include=[])["ids"])
+    return found
+
+
+def delete_vectors(store, ids: List[str]) -> None:
+    with vector_writes(store):
+        for batch in _batches(ids):
+            store.delete(ids=batch)
+
+
+def chunk_texts(store, ids: List[str]) -> Dict[str, str]:
+    """vector id -> chunk text, for the ids still in the collection."""
+    texts = {}
+    for batch in _batches(ids):
+        found = store._collection.get(ids=batch, include=["documents"])
+        texts.update(zip(found["ids"], (text or "" for text in found["documents"])))
+    return texts
+
+
+async def _delete_rows(ids: List[str]) -> None:
+    async with AsyncSessionLocal() as db:
+        for batch in _batches(ids):
+            # Not left to ON DELETE SET NULL, which SQLite does not enforce by default
+            chunk_ids = select(Chunk.id).where(Chunk.vector_id.in_(batch))
+            await db.execute(
+                update(ConversationCitation).where(ConversationCitation.chunk_id.in_(chunk_ids)).values(chunk_id=None)
+            )
+            await db.execute(delete(Chunk).where(Chunk.vector_id.in_(batch)))
+        await db.commit()
+
+
+class FileChunkIndexer:
+    """
+    Vector ids and registry rows for one run of `process_file`.
+
+    Chunks identical to one indexed for the file before (same content hash)
+    keep that chunk's row, so its id and the citations pointing at it stay
+    valid, and keep its vector instead of being embedded again if it is
+    still in Chroma. Whatever was not reused is deleted by `finish`.
+    """
+
+    def __init__(
+            self,
+            store,
+            file_uid: str,
+            collection: str,
+            previous: List[Tuple[int, str, str]],
+            present: Set[str],
+    ):
+        self.store = store
+        self.file_uid = file_uid
+        self.collection = collection
+        self.previous_ids = [vector_id for _, vector_id, _ in previous]
+        # content hash -> (row id, vector id, vector in Chroma); rows with
+        # their vector are last, so they are popped first
+        self._reusable: Dict[str, List[Tuple[int, str, bool]]] = defaultdict(list)
+        for row_id, vector_id, digest in sorted(previous, key=lambda p: p[1] in present):
+            self._reusable[digest].append((row_id, vector_id, vector_id in present))
+        self._added: List[str] = []
+        self._reused: Set[str] = set()
+        self.ordinal = 0
+        self.embedded = 0
+        # Tokens of the chunks embedded in this run; reused ones cost nothing
+        self.embedded_tokens = 0
+
+    @classmethod
+    async def start(cls, store, file_uid: str, collection: str) -> "FileChunkIndexer":
+        async with AsyncSessionLocal() as db:
+            stmt = select(Chunk.id, Chunk.vector_id, Chunk.content_hash).where(Chunk.file_uid == file_uid)
+            previous = [(row.id, row.vector_id, row.content_hash) for row in await db.execute(stmt)]
+        present = await asyncio.to_thread(_existing_ids, store, [vector_id for _, vector_id, _ in previous])
+        return cls(store, file_uid, collection, previous, present)
+
+    def _plan(self, chunks: List[Document]):
+        new_docs, new_ids, inserts, updates, reused_ids, reused_metadatas = [], [], [], [], [], []
+        new_tokens = 0
+        for chunk in chunks:
+            digest = content_hash(chunk.page_content)
+            candidates = self._reusable.get(digest)
+            row_id, vector_id, present = candidates.pop() if candidates else (None, None, False)
+            if present:
+                reused_ids.append(vector_id)
+                reused_metadatas.append(chunk.metadata)
+            else:
+                vector_id = str(uuid.uuid4())
+                new_docs.append(chunk)
+                new_ids.append(vector_id)
+            row = {
+                "vector_id": vector_id,
+                "ordinal": self.ordinal,
+                "token_count": count_tokens(chunk.page_content),
+            }
+            if not present:
+                new_tokens += row["token_count"]
+            if row_id is not None:
+                updates.append({"id": row_id, **row})
+            else:
+                inserts.append({
+                    **row,
+                    "file_uid": self.file_uid,
+                    "collection": self.collection,
+                    "content_hash": digest,
+                })
+            self.ordinal += 1
+        return new_docs, new_ids, inserts, updates, reused_ids, reused_metadatas, new_tokens
+
+    def _write(self, new_docs: List[Document], new_ids: List[str], reused_ids: List[str], reused_metadatas) -> None:
+        with vector_writes(self.store):
+            if new_docs:
+                self.store.add_documents(new_docs, ids=new_ids)
+                self._added.extend(new_ids)
+            if reused_ids:
+                # Same text, but the page or row it came from may have moved
+                self.store._collection.update(ids=reused_ids, metadatas=reused_metadatas)
+
+    async def add(self, chunks: List[Document]) -> None:
+        """Embed the new chunks of a window and register all of them."""
+        new_docs, new_ids, inserts, updates, reused_ids, reused_metadatas, new_tokens = await asyncio.to_thread(
+            self._plan, chunks
+        )
+        await asyncio.to_thread(self._write, new_docs, new_ids, reused_ids, reused_metadatas)
+        # Sent to the embeddings API, whether or not the run completes
+        self.embedded_tokens += new_tokens
+        async with AsyncSessionLocal() as db:
+            # Reused rows get the new ordinal, and a new vector id if re-embedded
+            if updates:
+                await db.execute(update(Chunk), updates)
+            if inserts:
+                await db.execute(insert(Chunk), inserts)
+            await db.commit()
+        self._reused.update(reused_ids)
+        self.embedded += len(new_docs)
+
+    async def finish(self) -> None:
+        """Delete the previous vectors and rows that were not reused."""
+        stale = [item for items in self._reusable.values() for item in items]
+        stale_vectors = [vector_id for _, vector_id, present in stale if present]
+        if stale_vectors:
+            await asyncio.to_thread(delete_vectors, self.store, stale_vectors)
+        # Rows of vectors already missing from Chroma go too
+        await _delete_rows([vector_id for _, vector_id, _ in stale])
+        logger.info(
+            f"Indexed {self.ordinal} chunks of file {self.file_uid}: "
+            f"{self.embedded} embedded, {len(self._reused)} unchanged, {len(stale)} removed"
+        )
+
+    async def discard(self) -> None:
+        """Remove everything of the file after a failed run."""
+        await asyncio.to_thread(delete_vectors, self.store, self.previous_ids + self._added)
+        await delete_file_chunks(self.file_uid)
+
+
+async def delete_file_chunks(file_uid: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(ConversationCitation).where(ConversationCitation.file_uid == file_uid).values(chunk_id=None)
+        )
+        await db.execute(delete(Chunk).where(Chunk.file_uid == file_uid))
+        await db.commit()
+
+
+async def file_chunk_stats(db, file_uid: str) -> Dict:
+    stmt = select(
+        func.count(Chunk.id),
+        func.coalesce(func.sum(Chunk.token_count), 0),
+        func.count(func.distinct(Chunk.content_hash)),
+    ).where(Chunk.file_uid == file_uid)
+    chunks, tokens, distinct = (await db.execute(stmt)).one()
+    return {"file_uid": file_uid, "chunk_count": chunks, "token_count": tokens, "distinct_chunks": distinct}
+
+
+# --------------------------------------------------------------------------- #
+# Reconciliation                                                              #
+# --------------------------------------------------------------------------- #
+def _chroma_inventory(store, batch_size: int) -> Dict[str, str]:
+    """vector id -> source filename of every vector in the collection."""
+    collection = store._collection
+    inventory, offset = {}, 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return inventory
+        for vector_id, metadata in zip(batch["ids"], batch["metadatas"]):
+            inventory[vector_id] = (metadata or {}).get("source") or ""
+        offset += len(batch["ids"])
+
+
+def _chroma_sources(store, vector_ids: List[str]) -> Dict[str, str]:
+    """vector id -> source filename of the given vectors still in the collection."""
+    sources = {}
+    for batch in _batches(vector_ids):
+        found = store._collection.get(ids=batch, include=["metadatas"])
+        for vector_id, metadata in zip(found["ids"], found["metadatas"]):
+            sources[vector_id] = (metadata or {}).get("source") or ""
+    return sources
+
+
+def _adoption_rows(store, vector_ids: List[str], file_uid: str, collection: str, first_ordinal: int) -> List[Dict]:
+    rows = []
+    for batch in _batches(vector_ids):
+        found = store._collection.get(ids=batch, include=["documents"])
+        for vector_id, text in zip(found["ids"], found["documents"]):
+            text = text or ""
+            rows.append({
+                "vector_id": vector_id,
+                "file_uid": file_uid,
+                "collection": collection,
+                "ordinal": first_ordinal + len(rows),
+                "token_count": count_tokens(text),
+                "content_hash": content_hash(text),
+            })
+    return rows
+
+
+async def _collection_files(db, info_type: InfoType):
+    return (await db.execute(
+        select(FileModel.uid, FileModel.filename, FileModel.status).where(FileModel.information_type == info_type)
+    )).all()
+
+
+async def _recheck(
+        store,
+        info_type: InfoType,
+        missing: List[str],
+        adopt: Dict[str, List[str]],
+        orphans: List[str],
+) -> Tuple[List[str], Dict[str, List[str]], List[str]]:
+    """
+    The differences that still hold right before repairing them. Files may
+    have started or finished processing since the registry was read: vectors
+    registered since, or of a file being processed or indexed since, are left
+    to the next run, and rows are only dropped if their vector is still
+    missing from Chroma.
+    """
+    candidates = [vector_id for ids in adopt.values() for vector_id in ids] + orphans
+    async with AsyncSessionLocal() as db:
+        files = await _collection_files(db, info_type)
+        rows = {}
+        for batch in _batches(missing + candidates):
+            stmt = select(Chunk.vector_id, Chunk.file_uid).where(Chunk.vector_id.in_(batch))
+            rows.update({row.vector_id: row.file_uid for row in await db.execute(stmt)})
+    busy = {f.uid for f in files if f.status == "Processing"}
+    indexed_names = {f.filename for f in files if f.status in ("Processing", "Processed")}
+
+    present = await asyncio.to_thread(_existing_ids, store, missing)
+    missing = [v for v in missing if v in rows and v not in present and rows[v] not in busy]
+    unregistered = {
+        file_uid: [v for v in vector_ids if v not in rows]
+        for file_uid, vector_ids in adopt.items()
+        if file_uid not in busy
+    }
+    adopt = {file_uid: vector_ids for file_uid, vector_ids in unregistered.items() if vector_ids}
+    if orphans:
+        # Orphans are told by their source: re-read it against files indexed since
+        sources = await asyncio.to_thread(_chroma_sources, store, orphans)
+        orphans = [v for v in orphans if v not in rows and v in sources and sources[v] not in indexed_names]
+    return missing, adopt, orphans
+
+
+async def reconcile_chunks(collection: str, repair: bool = True, batch_size: int = 5000) -> Dict:
+    """
+    Compare the registry of `collection` with its Chroma collection and,
+    with `repair`, fix the differences. Returns what was found.
+    """
+    from app.chat.services.vector_index import get_store
+
+    store = get_store(collection)
+    info_type = InfoType(collection.capitalize())
+
+    # The registry is read before Chroma: `process_file` adds vectors before
+    # their rows, so every vector registered at this point is in the inventory
+    # unless it really is gone
+    async with AsyncSessionLocal() as db:
+        registered = {
+            row.vector_id: row.file_uid
+            for row in await db.execute(
+                select(Chunk.vector_id, Chunk.file_uid).where(Chunk.collection == collection)
+            )
+        }
+        files = await _collection_files(db, info_type)
+    inventory = await asyncio.to_thread(_chroma_inventory, store, batch_size)
+    busy = {f.uid for f in files if f.status == "Processing"}
+    busy_names = {f.filename for f in files if f.status == "Processing"}
+    uid_by_name = {f.filename: f.uid for f in files if f.status == "Processed"}
+
+    missing = [v for v, file_uid in registered.items() if v not in inventory and file_uid not in busy]
+    adopt: Dict[str, List[str]] = defaultdict(list)
+    orphans = []
+    for vector_id, source in inventory.items():
+        if vector_id in registered or source in busy_names:
+            continue
+        if source in uid_by_name:
+            adopt[uid_by_name[source]].append(vector_id)
+        else:
+            orphans.append(vector_id)
+
+    report = {
+        "collection": collection,
+        "registered_chunks": len(registered),
+        "vectors": len(inventory),
+        "missing_vectors": len(missing),
+        "unregistered_vectors": sum(len(ids) for ids in adopt.values()),
+        "orphan_vectors": len(orphans),
+        "linked_citations": 0,
+        "repaired": repair,
+    }
+    if not repair:
+        return report
+
+    missing, adopt, orphans = await _recheck(store, info_type, missing, adopt, orphans)
+    if missing:
+        await _delete_rows(missing)
+    for file_uid, vector_ids in adopt.items():
+        async with AsyncSessionLocal() as db:
+            next_ordinal = (await db.execute(
+                select(func.coalesce(func.max(Chunk.ordinal) + 1, 0)).where(Chunk.file_uid == file_uid)
+            )).scalar()
+            rows = await asyncio.to_thread(_adoption_rows, store, vector_ids, file_uid, collection, next_ordinal)
+            if rows:
+                await db.execute(insert(Chunk), rows)
+            await db.commit()
+    if orphans:
+        await asyncio.to_thread(delete_vectors, store, orphans)
+    if missing or adopt or orphans:
+        from app.chat.utils.quantization import invalidate_quantized_index
+
+        invalidate_quantized_index(store)
+    from app.chat.services.citations import link_legacy_citations
+
+    # Citations migrated from JSON snippets, now that every vector is registered
+    report["linked_citations"] = await link_legacy_citations(collection)
+    logger.info(f"Reconciled {collection} chunks: {report}")
+    return report
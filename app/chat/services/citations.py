@@ -0,0 +1,259 @@
+"""
+Conversation citations (`conversation_citations` table).
+
+A conversation's sources are stored as references, one row per cited
+chunk: its rank among the answer's sources, its relevance score, the chunk
+id and the file uid. The snippet shown with a source is not stored; it is
+read from the chunk's text in Chroma when conversations are read (exports
+and archives), one Chroma call per page of conversations.
+
+Citations migrated from the old JSON `sources` column keep their snippet
+until `link_legacy_citations` finds the chunk it was cut from.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from langchain_core.documents import Document
+from sqlalchemy import delete, distinct, func, insert, select, update
+
+from app.chat.models.chunk import Chunk
+from app.chat.models.citation import ConversationCitation
+from app.chat.models.conversation import Conversation
+from app.chat.models.file import File as FileModel, InfoType
+from app.chat.services.chunks import chunk_texts
+from app.config.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Characters of chunk text shown with each source
+SNIPPET_CHARS = 200
+
+
+def citations_of(source_docs: List[Document]) -> List[Dict]:
+    """The citations of an answer, from the documents it was based on."""
+    return [
+        {
+            "rank": rank,
+            "vector_id": doc.id,
+            "source": doc.metadata.get("source") or "",
+            "score": doc.metadata.get("rerank_score", doc.metadata.get("relevance_score")),
+        }
+        for rank, doc in enumerate(source_docs)
+    ]
+
+
+async def save_citations(
+        db,
+        conversation_ids: List[int],
+        citations: List[List[Dict]],
+        information_type: InfoType = InfoType.PUBLIC,
+) -> None:
+    """
+    Insert the citations of each conversation, in the caller's transaction.
+    Chunks are found by vector id; vectors not registered yet are matched
+    to their file by filename.
+    """
+    vector_ids = list({c["vector_id"] for cited in citations for c in cited if c["vector_id"]})
+    chunks = {}
+    if vector_ids:
+        stmt = select(Chunk.id, Chunk.vector_id, Chunk.file_uid).where(Chunk.vector_id.in_(vector_ids))
+        chunks = {row.vector_id: row for row in await db.execute(stmt)}
+
+    names = list({c["source"] for cited in citations for c in cited if c["vector_id"] not in chunks and c["source"]})
+    uids = {}
+    if names:
+        stmt = select(FileModel.uid, FileModel.filename).where(
+            FileModel.filename.in_(names),
+            FileModel.information_type == information_type,
+        )
+        uids = {row.filename: row.uid for row in await db.execute(stmt)}
+
+    rows = []
+    for conversation_id, cited in zip(conversation_ids, citations):
+        for citation in cited:
+            chunk = chunks.get(citation["vector_id"])
+            file_uid = chunk.file_uid if chunk is not None else uids.get(citation["source"])
+            rows.append({
+                "conversation_id": conversation_id,
+                "rank": citation["rank"],
+                "file_uid": file_uid,
+                "chunk_id": chunk.id if chunk is not None else None,
+                "score": citation["score"],
+                "source": None if file_uid else citation["source"][:256] or None,
+            })
+    if rows:
+        await db.execute(insert(ConversationCitation), rows)
+
+
+def _rows_stmt(conversation_ids: List[int]):
+    return (
+        select(
+            ConversationCitation.conversation_id,
+            ConversationCitation.file_uid,
+            ConversationCitation.score,
+            ConversationCitation.source,
+            ConversationCitation.snippet,
+            FileModel.filename,
+            Chunk.vector_id,
+            Chunk.collection,
+        )
+        .outerjoin(FileModel, FileModel.uid == ConversationCitation.file_uid)
+        .outerjoin(Chunk, Chunk.id == ConversationCitation.chunk_id)
+        .where(ConversationCitation.conversation_id.in_(conversation_ids))
+        .order_by(ConversationCitation.conversation_id, ConversationCitation.rank)
+    )
+
+
+async def render_sources(db, conversation_ids: List[int]) -> Dict[int, List[Dict]]:
+    """
+    conversation id -> its sources as shown to users: source name, snippet,
+    file uid and score, best first. Snippets of chunks deleted since come
+    back empty.
+    """
+    from app.chat.services.vector_index import get_store
+
+    if not conversation_ids:
+        return {}
+    rows = (await db.execute(_rows_stmt(conversation_ids))).all()
+
+    # A chunk cited by many conversations is read once
+    by_collection: Dict[str, Set[str]] = defaultdict(set)
+    for row in rows:
+        if row.vector_id:
+            by_collection[row.collection].add(row.vector_id)
+    texts = {}
+    for collection, vector_ids in by_collection.items():
+        texts.update(await asyncio.to_thread(chunk_texts, get_store(collection), list(vector_ids)))
+
+    sources: Dict[int, List[Dict]] = defaultdict(list)
+    for row in rows:
+        text = texts.get(row.vector_id) if row.vector_id else row.snippet
+        sources[row.conversation_id].append({
+            "source": row.filename or row.source or "",
+            "content": (text or "")[:SNIPPET_CHARS],
+            "file_uid": row.file_uid,
+            "score": row.score,
+        })
+    return sources
+
+
+async def attach_sources(db, rows) -> List[Dict]:
+    """Conversation rows (mappings with an `id`) with their rendered `sources` added."""
+    sources = await render_sources(db, [row["id"] for row in rows])
+    return [{**row, "sources": sources.get(row["id"], [])} for row in rows]
+
+
+async def cited_source_names(db, conversation_ids: List[int]) -> Dict[int, List[str]]:
+    """conversation id -> names of its sources, without touching Chroma."""
+    if not conversation_ids:
+        return {}
+    stmt = (
+        select(ConversationCitation.conversation_id, func.coalesce(FileModel.filename, ConversationCitation.source))
+        .outerjoin(FileModel, FileModel.uid == ConversationCitation.file_uid)
+        .where(ConversationCitation.conversation_id.in_(conversation_ids))
+    )
+    names: Dict[int, List[str]] = defaultdict(list)
+    for conversation_id, name in await db.execute(stmt):
+        names[conversation_id].append(name or "")
+    return names
+
+
+async def delete_citations(db, conversation_ids: List[int]) -> None:
+    """Delete the citations of conversations, in the caller's transaction."""
+    if conversation_ids:
+        await db.execute(
+            delete(ConversationCitation).where(ConversationCitation.conversation_id.in_(conversation_ids))
+        )
+
+
+async def file_citations(db, file_uid: str, limit: int) -> Dict:
+    """How often a file was cited, and its latest citing conversations."""
+    stmt = select(
+        func.count(ConversationCitation.id),
+        func.count(distinct(ConversationCitation.conversation_id)),
+    ).where(ConversationCitation.file_uid == file_uid)
+    citations, conversations = (await db.execute(stmt)).one()
+
+    stmt = (
+        select(
+            Conversation.uid,
+            Conversation.query,
+            Conversation.created_at,
+            ConversationCitation.rank,
+            ConversationCitation.score,
+        )
+        .join(Conversation, Conversation.id == ConversationCitation.conversation_id)
+        .where(ConversationCitation.file_uid == file_uid)
+        .order_by(ConversationCitation.conversation_id.desc())
+        .limit(limit)
+    )
+    recent = [
+        {
+            "conversation_uid": row.uid,
+            "query": row.query,
+            "created_at": row.created_at,
+            "rank": row.rank,
+            "score": row.score,
+        }
+        for row in await db.execute(stmt)
+    ]
+    return {
+        "file_uid": file_uid,
+        "citation_count": citations,
+        "conversation_count": conversations,
+        "recent": recent,
+    }
+
+
+async def link_legacy_citations(collection: str) -> int:
+    """
+    Link migrated citations to the chunk their snippet was cut from, and
+    drop the snippet. Returns the number of citations linked.
+    """
+    from app.chat.services.vector_index import get_store
+
+    store = get_store(collection)
+    info_type = InfoType(collection.capitalize())
+    async with AsyncSessionLocal() as db:
+        file_uids = list((await db.execute(
+            select(distinct(ConversationCitation.file_uid))
+            .join(FileModel, FileModel.uid == ConversationCitation.file_uid)
+            .where(
+                ConversationCitation.chunk_id.is_(None),
+                ConversationCitation.snippet.is_not(None),
+                FileModel.information_type == info_type,
+            )
+        )).scalars())
+
+    linked = 0
+    for file_uid in file_uids:
+        async with AsyncSessionLocal() as db:
+            chunks = (await db.execute(
+                select(Chunk.id, Chunk.vector_id).where(Chunk.file_uid == file_uid).order_by(Chunk.ordinal)
+            )).all()
+            texts = await asyncio.to_thread(chunk_texts, store, [chunk.vector_id for chunk in chunks])
+            by_snippet = {}
+            for chunk in chunks:
+                if chunk.vector_id in texts:
+                    by_snippet.setdefault(texts[chunk.vector_id][:SNIPPET_CHARS], chunk.id)
+
+            pending = ConversationCitation.file_uid == file_uid, ConversationCitation.chunk_id.is_(None)
+            snippets = (await db.execute(
+                select(distinct(ConversationCitation.snippet)).where(*pending, ConversationCitation.snippet.is_not(None))
+            )).scalars()
+            for snippet in list(snippets):
+                chunk_id = by_snippet.get(snippet)
+                if chunk_id is None:
+                    continue
+                result = await db.execute(
+                    update(ConversationCitation)
+                    .where(*pending, ConversationCitation.snippet == snippet)
+                    .values(chunk_id=chunk_id, snippet=None)
+                )
+                linked += result.rowcount
+            await db.commit()
+    if linked:
+        logger.info(f"Linked {linked} migrated {collection} citations to their chunks")
+    return linked
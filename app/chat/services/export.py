@@ -0,0 +1,209 @@
+"""
+Streaming exports of conversations and file metadata as NDJSON or CSV,
+optionally gzip- or zstd-compressed on the fly.
+
+Rows are read with a streaming result (`yield_per`) and written out in
+chunks of about EXPORT_CHUNK_BYTES, so memory does not grow with the table.
+On Postgres one server-side cursor reads the whole export from a single
+snapshot; MVCC readers do not block writers. On SQLite an open read
+transaction can hold off writers, so the export is read in keyset pages of
+EXPORT_PAGE_SIZE rows, each fetched in its own short transaction.
+
+Conversations are exported with their sources, rendered from their
+citations one page of rows at a time.
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import zstandard
+from sqlalchemy import Table, select
+
+from app.chat.models.conversation import Conversation, ConversationType
+from app.chat.models.file import File as FileModel, InfoType
+from app.chat.services.citations import attach_sources
+from app.config.database import AsyncSessionLocal, engine
+from app.config.settings import settings
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+EXPORT_COMPRESSIONS = {
+    "none": (None, ""),
+    "gzip": ("application/gzip", ".gz"),
+    "zstd": ("application/zstd", ".zst"),
+}
+
+
+def _value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _Encoder:
+    """Rows to NDJSON or CSV text."""
+
+    def __init__(self, fmt: str, columns: List[str]):
+        self.fmt = fmt
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer) if fmt == "csv" else None
+
+    def header(self) -> str:
+        if self._csv is None:
+            return ""
+        self._csv.writerow(self.columns)
+        return self._take()
+
+    def row(self, row: Dict) -> str:
+        if self._csv is None:
+            return json.dumps({c: _value(row[c]) for c in self.columns}, ensure_ascii=False) + "\n"
+        self._csv.writerow([
+            json.dumps(row[c], ensure_ascii=False) if isinstance(row[c], (list, dict)) else _value(row[c])
+            for c in self.columns
+        ])
+        return self._take()
+
+    def _take(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+
+class _Compressor:
+    def __init__(self, compression: str):
+        if compression == "gzip":
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            self._compressor = None
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def flush(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+
+async def _stream_pages(table: Table, filters: List) -> AsyncIterator[List[Dict]]:
+    stmt = select(table).where(*filters)
+    batch_size = settings.EXPORT_YIELD_PER
+
+    if engine.dialect.name == "postgresql":
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.order_by(table.c.id).execution_options(yield_per=batch_size))
+            async for rows in result.mappings().partitions():
+                yield rows
+        return
+
+    last_id = 0
+    while True:
+        # Read the page and end the transaction before a slow client consumes it
+        async with AsyncSessionLocal() as db:
+            page = stmt.where(table.c.id > last_id).order_by(table.c.id).limit(settings.EXPORT_PAGE_SIZE)
+            rows = (await db.execute(page)).mappings().all()
+        if rows:
+            yield rows
+        if len(rows) < settings.EXPORT_PAGE_SIZE:
+            return
+        last_id = rows[-1]["id"]
+
+
+async def _with_sources(rows: List[Dict]) -> List[Dict]:
+    async with AsyncSessionLocal() as db:
+        return await attach_sources(db, rows)
+
+
+async def _export(
+        table: Table,
+        filters: List,
+        fmt: str,
+        compression: str,
+        extra_columns: List[str] = (),
+        enrich: Optional[Callable[[List[Dict]], Awaitable[List[Dict]]]] = None,
+) -> AsyncIterator[bytes]:
+    encoder = _Encoder(fmt, [column.name for column in table.columns] + list(extra_columns))
+    compressor = _Compressor(compression)
+    chunk = [encoder.header()]
+    size = len(chunk[0])
+    async for rows in _stream_pages(table, filters):
+        if enrich is not None:
+            rows = await enrich(rows)
+        for row in rows:
+            text = encoder.row(row)
+            chunk.append(text)
+            size += len(text)
+            if size >= settings.EXPORT_CHUNK_BYTES:
+                data = compressor.compress("".join(chunk).encode())
+                chunk, size = [], 0
+                if data:
+                    yield data
+    data = compressor.compress("".join(chunk).encode()) + compressor.flush()
+    if data:
+        yield data
+
+
+def _utc(value: datetime) -> datetime:
+    """Aware UTC datetime; naive values are taken as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return _utc(value).replace(tzinfo=None)
+
+
+def export_conversations(
+        fmt: str = "ndjson",
+        compression: str = "none",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        conversation_type: Optional[ConversationType] = None,
+        user_uid: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Conversations created in [since, until), in id order, with their sources."""
+    table = Conversation.__table__
+    filters = []
+    if since:
+        filters.append(table.c.created_at >= _utc(since))
+    if until:
+        filters.append(table.c.created_at < _utc(until))
+    if conversation_type:
+        filters.append(table.c.conversation_type == conversation_type)
+    if user_uid:
+        filters.append(table.c.user_uid == user_uid)
+    return _export(table, filters, fmt, compression, extra_columns=["sources"], enrich=_with_sources)
+
+
+def export_files(
+        fmt: str = "ndjson",
+        compression: str = "none",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        information_type: Optional[InfoType] = None,
+        user_uid: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """File metadata of files uploaded in [since, until), in id order."""
+    table = FileModel.__table__
+    filters = []
+    # uploaded_at is stored as naive UTC
+    if since:
+        filters.append(table.c.uploaded_at >= _naive_utc(since))
+    if until:
+        filters.append(table.c.uploaded_at < _naive_utc(until))
+    if information_type:
+        filters.append(table.c.information_type == information_type)
+    if user_uid:
+        filters.append(table.c.user_uid == user_uid)
+    return _export(table, filters, fmt, compression)
@@ -1,32 +1,127 @@
 import asyncio
 import logging
+import time
+from typing import Optional
 
 from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.chat.models.file import File as FileModel
+from app.chat.models.file import File as FileModel, InfoType
+from app.chat.services.file_events import file_events
+from app.chat.services.vector_index import RebuildInProgress, reset_collection
 from app.chat.utils.process_file import process_file
+from app.config.admission import Ticket
+from app.config.database import AsyncSessionLocal
+from app.config.http_cache import FILES, bump_version
 
 logger = logging.getLogger(__name__)
 
+# Minimum interval between two saves of a file's page counts
+PROGRESS_SAVE_SECONDS = 1.0
 
-async def process_file_background(file_uid: str, db: AsyncSession):
+
+class _ProgressWriter:
+    """
+    Progress callback for `process_file`: saves page counts and the final
+    status, and publishes each change on the file event bus. Every page is
+    published, but page counts are saved at most every
+    PROGRESS_SAVE_SECONDS, so a long file costs a handful of commits.
+    """
+
+    def __init__(self, db: AsyncSession, file_uid: str, user_uid: str | None):
+        self.db = db
+        self.file_uid = file_uid
+        self.user_uid = user_uid
+        self.done = 0
+        self.total = None
+        self.saved_at = None
+
+    async def __call__(self, done: int, total):
+        self.done, self.total = done, total
+        now = time.monotonic()
+        if self.saved_at is None or now - self.saved_at >= PROGRESS_SAVE_SECONDS:
+            self.saved_at = now
+            stmt = update(FileModel).where(FileModel.uid == self.file_uid).values(
+                pages_processed=done,
+                pages_total=total,
+            )
+            await self.db.execute(stmt)
+            await bump_version(self.db, FILES)
+            await self.db.commit()
+        file_events.publish(self.file_uid, self.user_uid, "Processing", done, total)
+
+    async def finish(self, status: str):
+        stmt = update(FileModel).where(FileModel.uid == self.file_uid).values(
+            status=status,
+            pages_processed=self.done,
+            pages_total=self.total,
+        )
+        await self.db.execute(stmt)
+        await bump_version(self.db, FILES)
+        await self.db.commit()
+        file_events.publish(self.file_uid, self.user_uid, status, self.done, self.total)
+
+
+async def process_file_background(file_uid: str, ticket: Optional[Ticket] = None):
     """
     Background task to process a file and update its status in the database.
+    With an ingestion `ticket` it first waits for its turn, and charges the
+    tokens of the chunks it embedded to the user's quota: chunks reused from
+    a previous run cost nothing upstream. It opens its
+    own session: the request's one is closed once the response is sent.
     """
-    # Get the file from the database
-    stmt = select(FileModel).where(FileModel.uid == file_uid)
-    result = await db.execute(stmt)
-    file: FileModel | None = result.scalars().first()
+    try:
+        if ticket is not None:
+            await ticket.wait()
 
-    if file is None:
-        logger.error(f"File with UID {file_uid} not found for processing")
+        async with AsyncSessionLocal() as db:
+            # Get the file from the database
+            stmt = select(FileModel).where(FileModel.uid == file_uid)
+            result = await db.execute(stmt)
+            file: FileModel | None = result.scalars().first()
+
+            if file is None:
+                logger.error(f"File with UID {file_uid} not found for processing")
+                return
+
+            # Process the file
+            progress = _ProgressWriter(db, file_uid, file.user_uid)
+            new_status = await process_file(
+                file, on_progress=progress, on_embedded=ticket.charge if ticket is not None else None,
+            )
+
+            # Update the file status in the database
+            await progress.finish(new_status)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+async def reindex_collection_background(collection: str):
+    """
+    Re-embed every processed file of a collection with the current embedding
+    profile: the collection is recreated empty and each file goes through
+    `process_file` again. The chunks registry is kept, so re-embedded chunks
+    keep their ids and the citations pointing at them.
+    """
+    info_type = InfoType(collection.capitalize())
+    try:
+        await asyncio.to_thread(reset_collection, collection)
+    except RebuildInProgress as e:
+        logger.warning(str(e))
         return
 
-    # Process the file
-    new_status = await process_file(file)
+    async with AsyncSessionLocal() as db:
+        stmt = select(FileModel).where(
+            FileModel.information_type == info_type,
+            FileModel.status == "Processed",
+        )
+        files = (await db.execute(stmt)).scalars().all()
+        logger.info(f"Re-indexing {len(files)} {collection} files")
+
+        for file in files:
+            progress = _ProgressWriter(db, file.uid, file.user_uid)
+            new_status = await process_file(file, on_progress=progress)
+            await progress.finish(new_status)
 
-    # Update the file status in the database
-    stmt = update(FileModel).where(FileModel.uid == file_uid).values(status=new_status)
-    await db.execute(stmt)
-    await db.commit()
+    logger.info(f"Re-indexing of {collection} collection finished")
@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from app.chat.models.file import File as FileModel
+from app.config.database import AsyncSessionLocal
+from app.config.http_cache import FILES, get_version
+
+logger = logging.getLogger(__name__)
+
+# Events kept for clients reconnecting with Last-Event-ID
+HISTORY_SIZE = 1000
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+class FileEventBus:
+    """
+    In-process fan-out of file status and progress changes.
+
+    Events only reach subscribers of the worker process that processed the
+    file; event streams pick up the others' changes from the database (see
+    `file_states`). Event ids are "<process token>-<sequence>", so SSE
+    clients resume after a reconnect to the same process, and a client
+    presenting another worker's id (or one from before a restart) is told
+    apart and resynced instead of replayed unrelated events.
+    """
+
+    def __init__(self):
+        self.token = f"{os.getpid()}.{uuid.uuid4().hex[:6]}"
+        self._seq = itertools.count(1)
+        self._history: Deque[dict] = deque(maxlen=HISTORY_SIZE)
+        # Sequence of the newest event dropped from the history
+        self._evicted = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def next_id(self) -> Tuple[str, int]:
+        """(event id, sequence) of a new event."""
+        seq = next(self._seq)
+        return f"{self.token}-{seq}", seq
+
+    def publish(
+            self,
+            file_uid: str,
+            user_uid: Optional[str],
+            status: str,
+            pages_processed: int = 0,
+            pages_total: Optional[int] = None,
+    ) -> dict:
+        event_id, seq = self.next_id()
+        event = {
+            "id": event_id,
+            "seq": seq,
+            "user_uid": user_uid,
+            "data": {
+                "uid": file_uid,
+                "status": status,
+                "pages_processed": pages_processed,
+                "pages_total": pages_total,
+            },
+        }
+        if len(self._history) == self._history.maxlen:
+            self._evicted = self._history[0]["seq"]
+        self._history.append(event)
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow client loses the oldest event rather than blocking processing
+                queue.get_nowait()
+            queue.put_nowait(event)
+        return event
+
+    def replay(self, last_event_id: str) -> Optional[List[dict]]:
+        """
+        Events after `last_event_id`, or None when they cannot all be
+        replayed: the id is another process's, or events after it were
+        already dropped from the history.
+        """
+        token, _, seq = last_event_id.rpartition("-")
+        if token != self.token or not seq.isdigit() or int(seq) < self._evicted:
+            return None
+        return [event for event in self._history if event["seq"] > int(seq)]
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+file_events = FileEventBus()
+
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['id']}\nevent: file_status\ndata: {json.dumps(event['data'])}\n\n"
+
+
+async def files_version() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await get_version(db, FILES))[0]
+
+
+async def file_states(user_uid: str) -> Tuple[int, Dict[str, dict]]:
+    """
+    (files version, uid -> event data) of a user's files as saved in the
+    database, whichever worker processed them.
+    """
+    async with AsyncSessionLocal() as db:
+        # Version first: a change in between is seen again on the next check
+        version, _ = await get_version(db, FILES)
+        stmt = select(
+            FileModel.uid, FileModel.status, FileModel.pages_processed, FileModel.pages_total,
+        ).where(FileModel.user_uid == user_uid)
+        rows = (await db.execute(stmt)).mappings().all()
+    return version, {row["uid"]: dict(row) for row in rows}
+
+
+def is_newer(data: dict, known: Optional[dict]) -> bool:
+    """
+    Whether a file state read from the database is news to a client that
+    was last sent `known`. Page counts are saved at most once a second, so
+    the database may be behind the events of the worker processing it.
+    """
+    if known is None or data["status"] != known["status"]:
+        return True
+    return (data["pages_processed"] or 0) > (known["pages_processed"] or 0)
@@ -0,0 +1,351 @@
+"""
+Conversation retention: archive conversations older than
+CONVERSATION_RETENTION_DAYS to zstd-compressed JSONL files and delete them.
+
+Rows are moved in small batches, each written and fsynced to the archive
+before its delete is committed, so no transaction holds locks for long. A
+run writes to `<archive>.partial` and renames it when done; the next run
+first cuts a leftover partial file after its last complete frame and
+renames it, so a crash can at worst archive a batch twice. On Postgres, monthly partitions
+that are entirely past the cutoff are archived and then detached and
+dropped instead of deleted row by row.
+
+Conversations saved before created_at existed carry the migration time
+(created_at_backfilled); they expire one retention period after the
+migration, or on the next run with ARCHIVE_BACKFILLED_CONVERSATIONS.
+
+Archived conversations carry their sources, rendered from their citations,
+and the citations are deleted with them. Their analytics rollups are kept:
+`rebuild_conversation_rollups` only recomputes the days retention cannot
+have archived yet.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import zstandard
+from sqlalchemy import delete, or_, select, text
+
+from app.chat.models.conversation import Conversation
+from app.chat.services.citations import attach_sources, delete_citations
+from app.config.database import AsyncSessionLocal, engine
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ZSTD_LEVEL = 10
+# Read size when scanning the archive of an interrupted run
+_RECOVER_CHUNK = 1024 * 1024
+# Postgres advisory lock key of the archiver, so only one worker runs it
+_ARCHIVER_LOCK_KEY = 0x5E7E_0C0A
+_PARTITION_RE = re.compile(r"^conversations_p(\d{4})(\d{2})$")
+# Longest a partition detach may wait for its lock before giving up
+_DETACH_LOCK_TIMEOUT = "5s"
+
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _serialize(row) -> str:
+    item = dict(row)
+    item["conversation_type"] = getattr(item["conversation_type"], "name", item["conversation_type"])
+    item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+    return json.dumps(item, ensure_ascii=False)
+
+
+class ConversationArchive:
+    """
+    Append-only zstd JSONL file. Each batch is its own zstd frame and is on
+    disk before `write` returns; the file is renamed into place on close.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._partial = f"{path}.partial"
+        self._file = open(self._partial, "wb")
+        self._writer = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).stream_writer(self._file, closefd=False)
+
+    def write(self, rows) -> None:
+        for row in rows:
+            self._writer.write((_serialize(row) + "\n").encode())
+        self._writer.flush(zstandard.FLUSH_FRAME)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        self._writer.close()
+        self._file.close()
+        if self.rows:
+            os.replace(self._partial, self.path)
+        else:
+            os.remove(self._partial)
+
+
+def _complete_frames_length(path: str) -> int:
+    """Bytes of `path` up to the end of its last complete zstd frame."""
+    decompressor = zstandard.ZstdDecompressor()
+    frame = decompressor.decompressobj()
+    length, consumed, data = 0, 0, b""
+    with open(path, "rb") as f:
+        while True:
+            data = data or f.read(_RECOVER_CHUNK)
+            if not data:
+                return length
+            try:
+                frame.decompress(data)
+            except zstandard.ZstdError:
+                return length
+            if frame.eof:
+                # What follows the frame starts the next one
+                consumed += len(data) - len(frame.unused_data)
+                length, data = consumed, frame.unused_data
+                frame = decompressor.decompressobj()
+            else:
+                consumed += len(data)
+                data = b""
+
+
+def recover_partial_archives() -> int:
+    """
+    Rename the archives of interrupted runs into place. Their batches were
+    deleted from the database once written, so they are kept, cut after
+    their last complete frame. Returns the number of files recovered.
+    """
+    recovered = 0
+    for name in sorted(os.listdir(settings.ARCHIVE_DIR)):
+        if not name.endswith(".jsonl.zst.partial"):
+            continue
+        partial = os.path.join(settings.ARCHIVE_DIR, name)
+        length = _complete_frames_length(partial)
+        if not length:
+            os.remove(partial)
+            continue
+        with open(partial, "r+b") as f:
+            f.truncate(length)
+            os.fsync(f.fileno())
+        os.replace(partial, partial.removesuffix(".partial"))
+        recovered += 1
+        logger.warning(f"Recovered the archive of an interrupted run: {partial.removesuffix('.partial')}")
+    return recovered
+
+
+@asynccontextmanager
+async def _archiver_lock() -> AsyncIterator[bool]:
+    """Cross-worker lock: a Postgres advisory lock, or a file lock on SQLite."""
+    if _is_postgres():
+        async with engine.connect() as conn:
+            acquired = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ARCHIVER_LOCK_KEY})).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ARCHIVER_LOCK_KEY})
+        return
+
+    import fcntl
+
+    os.makedirs(settings.ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(settings.ARCHIVE_DIR, ".archiver.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# --------------------------------------------------------------------------- #
+# Postgres partitions                                                         #
+# --------------------------------------------------------------------------- #
+async def conversation_partitions() -> List[Tuple[str, date, date]]:
+    """(name, start, end) of the monthly partitions, empty if not partitioned."""
+    if not _is_postgres():
+        return []
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'conversations'"
+        ))
+        names = [row[0] for row in result]
+    partitions = []
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((name, start, _next_month(start)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def ensure_conversation_partitions(months_ahead: Optional[int] = None) -> None:
+    """Create the monthly partitions for this month and the next few."""
+    if not await conversation_partitions():
+        return
+    months_ahead = settings.CONVERSATION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    start = _month_start(datetime.now(timezone.utc).date())
+    for _ in range(months_ahead + 1):
+        end = _next_month(start)
+        name = f"conversations_p{start:%Y%m}"
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF conversations "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+                await db.commit()
+        except Exception:
+            # e.g. the default partition already holds rows of that month
+            logger.exception(f"Could not create conversation partition {name}")
+        start = end
+
+
+async def _archive_partition(archive: ConversationArchive, name: str, batch_size: int) -> int:
+    table = Conversation.__table__
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    last_id, archived = 0, 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                text(f"SELECT {columns} FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit").columns(
+                    *table.columns
+                ),
+                {"last_id": last_id, "limit": batch_size},
+            )
+            rows = result.mappings().all()
+            if rows:
+                rows = await attach_sources(db, rows)
+        if not rows:
+            break
+        await asyncio.to_thread(archive.write, rows)
+        async with AsyncSessionLocal() as db:
+            # The partition itself is dropped below; its citations go batch by batch
+            await delete_citations(db, [row["id"] for row in rows])
+            await db.commit()
+        last_id = rows[-1]["id"]
+        archived += len(rows)
+        await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text(f"SET LOCAL lock_timeout = '{_DETACH_LOCK_TIMEOUT}'"))
+            await db.execute(text(f"ALTER TABLE conversations DETACH PARTITION {name}"))
+            await db.execute(text(f"DROP TABLE {name}"))
+            await db.commit()
+        logger.info(f"Archived and dropped conversation partition {name} ({archived} rows)")
+    except Exception as e:
+        # Busy table: empty the partition in batches instead of waiting for the lock
+        logger.warning(f"Could not detach conversation partition {name}, deleting its rows: {e}")
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    text(f"DELETE FROM {name} WHERE id IN (SELECT id FROM {name} ORDER BY id LIMIT :limit)"),
+                    {"limit": batch_size},
+                )
+                await db.commit()
+            if not result.rowcount:
+                break
+            await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+    return archived
+
+
+# --------------------------------------------------------------------------- #
+# Archiver                                                                    #
+# --------------------------------------------------------------------------- #
+async def _archive_in_batches(archive: ConversationArchive, cutoff: datetime, batch_size: int) -> int:
+    expired = Conversation.created_at < cutoff
+    if settings.ARCHIVE_BACKFILLED_CONVERSATIONS:
+        expired = or_(expired, Conversation.created_at_backfilled.is_(True))
+    archived = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(Conversation.__table__)
+                .where(expired)
+                .order_by(Conversation.created_at, Conversation.id)
+                .limit(batch_size)
+            )
+            rows = (await db.execute(stmt)).mappings().all()
+            if rows:
+                rows = await attach_sources(db, rows)
+            # End the read transaction before writing the archive
+            await db.commit()
+            if not rows:
+                return archived
+            await asyncio.to_thread(archive.write, rows)
+            ids = [row["id"] for row in rows]
+            await delete_citations(db, ids)
+            await db.execute(delete(Conversation).where(Conversation.id.in_(ids)))
+            await db.commit()
+        archived += len(rows)
+        # Let other writers in between batches
+        await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_SECONDS)
+
+
+async def archive_expired_conversations(
+        retention_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+) -> int:
+    """
+    Move conversations older than the retention period into a new archive
+    file in ARCHIVE_DIR. Returns the number of archived conversations; 0 if
+    retention is disabled or another worker is already archiving.
+    """
+    retention_days = settings.CONVERSATION_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return 0
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=retention_days)
+
+    async with _archiver_lock() as acquired:
+        if not acquired:
+            logger.info("Conversation archiver already running in another worker")
+            return 0
+
+        os.makedirs(settings.ARCHIVE_DIR, exist_ok=True)
+        await asyncio.to_thread(recover_partial_archives)
+        path = os.path.join(settings.ARCHIVE_DIR, f"conversations-{now:%Y%m%dT%H%M%SZ}.jsonl.zst")
+        archive = ConversationArchive(path)
+        try:
+            archived = 0
+            for name, _, end in await conversation_partitions():
+                if end <= cutoff.date():
+                    archived += await _archive_partition(archive, name, batch_size)
+            archived += await _archive_in_batches(archive, cutoff, batch_size)
+        finally:
+            await asyncio.to_thread(archive.close)
+        await ensure_conversation_partitions()
+
+    if archived:
+        logger.info(f"Archived {archived} conversations older than {cutoff:%Y-%m-%d} to {path}")
+    return archived
+
+
+async def run_retention_loop() -> None:
+    """Periodic archiver started from the app lifespan."""
+    while True:
+        try:
+            await archive_expired_conversations()
+        except Exception:
+            logger.exception("Error archiving conversations")
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
@@ -0,0 +1,212 @@
+"""
+Retrieval-only search: the top chunks of a collection for a query, with
+relevance scores, highlighted fragments and the metadata of their files.
+No LLM is called.
+
+The query is embedded with the collection's own embedding model, so results
+match what chat retrieves, and the embedding is cached so paging through
+the results of a query costs one embeddings call. The vector search is a
+single Chroma query with the filters applied as a metadata `where`.
+"""
+import html
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.chat.models.chunk import Chunk
+from app.chat.models.file import File as FileModel, InfoType
+from app.config.resilience import run_stage
+from app.config.settings import settings
+from app.monitoring.metrics import REGISTRY
+
+SEARCH_REQUESTS = REGISTRY.counter("search_requests_total", "Search requests by collection")
+SEARCH_LATENCY = REGISTRY.histogram("search_latency_seconds", "Search latency by collection")
+SEARCH_EMBEDDING_CACHE = REGISTRY.counter(
+    "search_embedding_cache_total", "Query embedding cache lookups by collection and result"
+)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# Words too common to be worth highlighting
+_STOPWORDS = frozenset(
+    "the and for are but not you your with from this that what which who how why when where does can our".split()
+)
+
+
+class _EmbeddingCache:
+    """Small LRU of query embeddings, keyed by collection id and query text."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+            return vector
+
+    def put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_embedding_cache = _EmbeddingCache(settings.SEARCH_EMBEDDING_CACHE_SIZE)
+
+
+def _query_vector(store, collection: str, query: str) -> List[float]:
+    # By collection id: a switched collection keeps its name but not its embeddings
+    key = (str(store._collection.id), query)
+    vector = _embedding_cache.get(key)
+    SEARCH_EMBEDDING_CACHE.inc(collection=collection, result="hit" if vector is not None else "miss")
+    if vector is None:
+        vector = store.embeddings.embed_query(query)
+        _embedding_cache.put(key, vector)
+    return vector
+
+
+def build_where(sources: Optional[List[str]], metadata: Optional[Dict[str, Any]]) -> Optional[Dict]:
+    """Chroma `where` for the search filters, None when there are none."""
+    clauses = [{key: value} for key, value in (metadata or {}).items()]
+    if sources:
+        clauses.append({"source": {"$in": sources}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def highlight(text: str, query: str, fragments: int, size: int) -> List[str]:
+    """
+    Up to `fragments` HTML-escaped excerpts of about `size` characters around
+    the query's words, each match wrapped in <mark>.
+    """
+    terms = {t for t in _TERM_RE.findall(query.lower()) if (len(t) > 2 and t not in _STOPWORDS) or t.isdigit()}
+    if not terms:
+        return []
+    pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + r")\b",
+                         re.IGNORECASE)
+    excerpts, end = [], 0
+    for match in pattern.finditer(text):
+        if match.start() < end:
+            continue
+        start = max(end, match.start() - size // 3)
+        # Do not open the excerpt in the middle of a word
+        while start > end and text[start - 1].isalnum():
+            start += 1
+        end = min(len(text), start + size)
+        excerpt = html.escape(text[start:end])
+        excerpt = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", excerpt)
+        excerpts.append(("…" if start else "") + excerpt.strip() + ("…" if end < len(text) else ""))
+        if len(excerpts) >= fragments:
+            break
+    return excerpts
+
+
+def _vector_search(store, collection: str, query: str, n_results: int, where: Optional[Dict]) -> List[Dict]:
+    vector = _query_vector(store, collection, query)
+    found = store._collection.query(
+        query_embeddings=[vector],
+        n_results=n_results,
+        where=where,
+        include=["documents", "metadatas", "distances"],
+    )
+    relevance = store._select_relevance_score_fn()
+    return [
+        {
+            "vector_id": vector_id,
+            "content": text or "",
+            "metadata": dict(metadata or {}),
+            "score": round(float(relevance(float(distance))), 4),
+        }
+        for vector_id, text, metadata, distance in zip(
+            found["ids"][0], found["documents"][0], found["metadatas"][0], found["distances"][0]
+        )
+    ]
+
+
+async def _file_details(db, collection: str, hits: List[Dict]) -> None:
+    """Attach the file and chunk position of each hit, from the chunks registry."""
+    if not hits:
+        return
+    stmt = (
+        select(Chunk.vector_id, Chunk.ordinal, FileModel.uid, FileModel.filename, FileModel.uploaded_at)
+        .join(FileModel, FileModel.uid == Chunk.file_uid)
+        .where(Chunk.vector_id.in_([hit["vector_id"] for hit in hits]))
+    )
+    registered = {row.vector_id: row for row in await db.execute(stmt)}
+
+    # Vectors not registered yet (see app.reconcile) are matched by filename
+    unregistered = {hit["metadata"].get("source") for hit in hits if hit["vector_id"] not in registered}
+    by_filename = {}
+    if unregistered:
+        stmt = select(FileModel.uid, FileModel.filename, FileModel.uploaded_at).where(
+            FileModel.filename.in_([name for name in unregistered if name]),
+            FileModel.information_type == InfoType(collection.capitalize()),
+        )
+        by_filename = {row.filename: row for row in await db.execute(stmt)}
+
+    for hit in hits:
+        row = registered.get(hit["vector_id"])
+        if row is None:
+            row = by_filename.get(hit["metadata"].get("source"))
+        hit["file_uid"] = row.uid if row is not None else None
+        hit["filename"] = row.filename if row is not None else hit["metadata"].get("source")
+        hit["uploaded_at"] = row.uploaded_at if row is not None else None
+        hit["chunk_index"] = getattr(row, "ordinal", None)
+
+
+async def search_collection(
+        db,
+        store,
+        collection: str,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        sources: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+) -> Dict:
+    """One page of the best chunks for `query`, best first."""
+    started = time.perf_counter()
+    SEARCH_REQUESTS.inc(collection=collection)
+    where = build_where(sources, metadata)
+    # One more than the page to know whether another page exists
+    n_results = min(offset + limit + 1, settings.SEARCH_MAX_RESULTS)
+    hits = await run_stage(
+        "retrieval", settings.RETRIEVAL_TIMEOUT_SECONDS, _vector_search, store, collection, query, n_results, where,
+    )
+    page = hits[offset:offset + limit]
+    await _file_details(db, collection, page)
+
+    results = []
+    for hit in page:
+        results.append({
+            "content": hit["content"],
+            "score": hit["score"],
+            "highlights": highlight(
+                hit["content"], query, settings.SEARCH_HIGHLIGHT_FRAGMENTS, settings.SEARCH_HIGHLIGHT_CHARS,
+            ),
+            "file_uid": hit["file_uid"],
+            "filename": hit["filename"],
+            "uploaded_at": hit["uploaded_at"],
+            "chunk_index": hit["chunk_index"],
+            "metadata": hit["metadata"],
+        })
+    has_more = len(hits) > offset + limit and offset + limit < settings.SEARCH_MAX_RESULTS
+    SEARCH_LATENCY.observe(time.perf_counter() - started, collection=collection)
+    return {
+        "query": query,
+        "results": results,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if has_more else None,
+    }
@@ -0,0 +1,653 @@
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from app.chat.utils.private_chat import private_vector_store
+from app.chat.utils.public_chat import public_vector_store
+from app.chat.utils.quantization import (
+    QuantizedIndex, invalidate_quantized_index, rerank, truncate_embeddings,
+)
+from app.config import settings as app_settings
+from app.config.embeddings import build_embedding_model, profile_settings
+from app.config.resilience import CircuitBreaker, GuardedEmbeddings
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORES: Dict[str, Chroma] = {
+    "public": public_vector_store,
+    "private": private_vector_store,
+}
+
+# hnswlib header.bin as written by chromadb: persistence version, then the
+# native hnswlib header fields up to ef_construction.
+_HNSW_HEADER = struct.Struct("<i6QiI3QdQ")
+
+# Collections created before embedding profiles were recorded
+LEGACY_EMBEDDING_PROFILE = "text-embedding-3-large:native"
+
+_rebuild_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in VECTOR_STORES}
+_swap_lock = threading.Lock()
+
+# Embedding profile each store embeds queries and writes with: the settings'
+# one, unless the live collection was built with another (see serve_collection)
+_serving_profiles: Dict[str, str] = {}
+_profile_embeddings: Dict[Tuple[str, str], Embeddings] = {}
+
+
+class WriteGate:
+    """
+    Writes to a store share the gate; a swap of its live collection holds it
+    alone, once the writes in flight are done. Writers resolve the store's
+    collection inside the gate, so none lands on a collection being swapped
+    out.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._writers = 0
+        self._closed = False
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            while self._closed:
+                self._cond.wait()
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writers -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            while self._closed:
+                self._cond.wait()
+            # New writers wait from here on, the running ones finish
+            self._closed = True
+            while self._writers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._closed = False
+                self._cond.notify_all()
+
+
+_write_gates: Dict[str, WriteGate] = {name: WriteGate() for name in VECTOR_STORES}
+
+
+class RebuildInProgress(Exception):
+    """Raised when a rebuild is requested while another one is running."""
+
+
+class EmbeddingProfileMismatch(Exception):
+    """Raised when a collection was built with another embedding profile than the settings'."""
+
+
+def get_store(name: str) -> Chroma:
+    try:
+        return VECTOR_STORES[name]
+    except KeyError:
+        raise KeyError(f"Unknown collection '{name}'. Must be one of: {', '.join(VECTOR_STORES)}")
+
+
+def is_rebuilding(name: str) -> bool:
+    return _rebuild_locks[name].locked()
+
+
+def _hnsw_config(collection) -> dict:
+    return (collection.configuration_json or {}).get("hnsw") or {}
+
+
+def collection_profile(collection) -> str:
+    return (collection.metadata or {}).get("embedding_profile", LEGACY_EMBEDDING_PROFILE)
+
+
+def collection_version(collection) -> int:
+    """Version of a collection's contents, raised by each re-embedding (1 for older collections)."""
+    return int((collection.metadata or {}).get("collection_version", 1))
+
+
+def embedding_profile(name: str) -> str:
+    """Embedding model/dimensions the collection was built with."""
+    return collection_profile(get_store(name)._collection)
+
+
+def serving_profile(name: str) -> str:
+    """Embedding profile the store currently embeds queries and new chunks with."""
+    return _serving_profiles.get(name, settings.EMBEDDING_PROFILE)
+
+
+def embeddings_for_profile(profile: str, breaker: Optional[CircuitBreaker] = None) -> Embeddings:
+    """Embeddings for `profile`, behind `breaker` (the embeddings breaker by default)."""
+    breaker = breaker or app_settings.embeddings_breaker
+    if profile == settings.EMBEDDING_PROFILE and breaker is app_settings.embeddings_breaker:
+        return app_settings.embedding_model
+    key = (profile, breaker.name)
+    if key not in _profile_embeddings:
+        model = build_embedding_model(profile_settings(settings, profile))
+        _profile_embeddings[key] = GuardedEmbeddings(model, breaker)
+    return _profile_embeddings[key]
+
+
+def serve_collection(name: str, collection) -> None:
+    """
+    Point a store at `collection`, embedding queries and writes with the
+    profile the collection was built with. Callers hold `_swap_lock`.
+    """
+    store = get_store(name)
+    profile = collection_profile(collection)
+    store._chroma_collection = collection
+    store._embedding_function = embeddings_for_profile(profile)
+    _serving_profiles[name] = profile
+    invalidate_quantized_index(store)
+
+
+def _store_name(store: Chroma) -> Optional[str]:
+    return next((name for name, candidate in VECTOR_STORES.items() if candidate is store), None)
+
+
+@contextmanager
+def vector_writes(store: Chroma) -> Iterator[None]:
+    """Hold around every write to a store, so it never races a collection swap."""
+    name = _store_name(store)
+    if name is None:
+        yield
+        return
+    with _write_gates[name].write():
+        yield
+
+
+def check_embedding_profile(store: Chroma) -> None:
+    """
+    Refuse to add to or search a collection built with another embedding
+    backend, model or dimension than its queries are embedded with: its
+    vectors are not comparable with new ones.
+    """
+    profile = collection_profile(store._collection)
+    name = _store_name(store)
+    expected = serving_profile(name) if name else settings.EMBEDDING_PROFILE
+    if profile != expected:
+        raise EmbeddingProfileMismatch(
+            f"Collection {store._collection.name} was built with {profile}, queries use {expected}; "
+            f"re-embed it with POST /admin/vectors/{{collection}}/shadow or /reindex"
+        )
+
+
+def _check_no_standby(name: str) -> None:
+    """Operations that replace the live collection would leave a shadow collection behind."""
+    if getattr(get_store(name)._collection, "mirror", None) is not None:
+        raise RebuildInProgress(
+            f"Collection '{name}' has a shadow or previous version; switch to it or drop it first"
+        )
+
+
+def _vector_segment_dir(store: Chroma) -> Optional[str]:
+    """Locate the on-disk HNSW segment directory of the store's collection."""
+    persist_dir = store._persist_directory
+    if not persist_dir:
+        return None
+    db_path = os.path.join(persist_dir, "chroma.sqlite3")
+    if not os.path.exists(db_path):
+        return None
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        row = conn.execute(
+            "SELECT id FROM segments WHERE collection = ? AND scope = 'VECTOR'",
+            (str(store._collection.id),),
+        ).fetchone()
+    if row is None:
+        return None
+    segment_dir = os.path.join(persist_dir, row[0])
+    return segment_dir if os.path.isdir(segment_dir) else None
+
+
+def _read_hnsw_header(segment_dir: str) -> Optional[dict]:
+    header_path = os.path.join(segment_dir, "header.bin")
+    if not os.path.exists(header_path):
+        return None
+    with open(header_path, "rb") as f:
+        raw = f.read(_HNSW_HEADER.size)
+    if len(raw) < _HNSW_HEADER.size:
+        return None
+    fields = _HNSW_HEADER.unpack(raw)
+    return {
+        "max_elements": fields[2],
+        "element_count": fields[3],
+        "bytes_per_element": fields[4],
+    }
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def collection_stats(name: str) -> dict:
+    """
+    Report vector count, HNSW parameters, on-disk size and the share of
+    index slots still occupied by deleted vectors.
+    """
+    store = get_store(name)
+    collection = store._collection
+    count = collection.count()
+    hnsw = _hnsw_config(collection)
+
+    segment_dir = _vector_segment_dir(store)
+    header = _read_hnsw_header(segment_dir) if segment_dir else None
+    # The header is only flushed every sync_threshold writes, so this is a
+    # lower bound on the slots in use.
+    element_count = max(header["element_count"], count) if header else count
+    deleted = max(element_count - count, 0)
+
+    return {
+        "name": name,
+        "collection_name": collection.name,
+        "vector_count": count,
+        "index_element_count": element_count,
+        "deleted_count": deleted,
+        "deleted_ratio": round(deleted / element_count, 4) if element_count else 0.0,
+        "index_capacity": header["max_elements"] if header else None,
+        "index_size_bytes": _dir_size(segment_dir) if segment_dir else 0,
+        "persist_size_bytes": _dir_size(store._persist_directory) if store._persist_directory else 0,
+        "space": hnsw.get("space"),
+        "m": hnsw.get("max_neighbors"),
+        "ef_construction": hnsw.get("ef_construction"),
+        "ef_search": hnsw.get("ef_search"),
+        "embedding_profile": embedding_profile(name),
+        "expected_embedding_profile": settings.EMBEDDING_PROFILE,
+        "collection_version": collection_version(collection),
+        "rebuilding": is_rebuilding(name),
+    }
+
+
+def _iter_batches(collection, batch_size: int):
+    offset = 0
+    while True:
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def _copy_ids(source, target, ids: List[str], batch_size: int) -> None:
+    for start in range(0, len(ids), batch_size):
+        batch = source.get(
+            ids=ids[start:start + batch_size],
+            include=["embeddings", "documents", "metadatas"],
+        )
+        if batch["ids"]:
+            target.upsert(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=batch["metadatas"],
+            )
+
+
+def _all_ids(collection, batch_size: int) -> set:
+    ids, offset = set(), 0
+    while True:
+        batch = collection.get(include=[], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return ids
+        ids.update(batch["ids"])
+        offset += len(batch["ids"])
+
+
+def update_search_ef(name: str, ef_search: int) -> None:
+    """ef_search is a query-time parameter and can be changed in place."""
+    get_store(name)._collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+
+
+def _retire(client, retired_name: str, live, swapped_ids: set, batch_size: int) -> Tuple[int, int]:
+    """
+    Delete the collection a swap retired. This process writes to the live
+    collection only, but on a Chroma server the other workers keep using the
+    retired one until their alias sync follows the swap, so it is kept for
+    two sync intervals. The vectors added to it meanwhile are then copied to
+    the live collection, unless it was built with another embedding profile,
+    and those deleted from it are deleted from the live one too. Returns how
+    many were copied and deleted.
+    """
+    if settings.CHROMA_HOST:
+        time.sleep(2 * settings.VECTOR_ALIAS_SYNC_SECONDS)
+    retired = client.get_collection(retired_name, embedding_function=None)
+    retired_ids = _all_ids(retired, batch_size)
+    late = sorted(retired_ids - swapped_ids)
+    gone = sorted(swapped_ids - retired_ids)
+    if late and collection_profile(retired) != collection_profile(live):
+        logger.warning(
+            "Not carrying %d vectors written late to %s over to %s: they were embedded with %s",
+            len(late), retired_name, live.name, collection_profile(retired),
+        )
+        late = []
+    _copy_ids(retired, live, late, batch_size)
+    for start in range(0, len(gone), batch_size):
+        live.delete(ids=gone[start:start + batch_size])
+    client.delete_collection(retired_name)
+    return len(late), len(gone)
+
+
+def rebuild_collection(
+    name: str,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> dict:
+    """
+    Rebuild a collection into a fresh, compacted HNSW index and swap it in.
+
+    Vectors are copied in batches into a side collection built with the
+    requested parameters. Writes that land on the live collection during the
+    copy are reconciled under the swap lock before the side collection takes
+    over the live name, so readers only ever see a complete index. Other
+    workers follow the new collection through their alias sync (see
+    `_retire`).
+    """
+    lock = _rebuild_locks[name]
+    if not lock.acquire(blocking=False):
+        raise RebuildInProgress(f"Collection '{name}' is already being rebuilt")
+
+    try:
+        _check_no_standby(name)
+        store = get_store(name)
+        client = store._client
+        live = store._collection
+        live_name = live.name
+        hnsw = _hnsw_config(live)
+        batch_size = settings.VECTOR_REBUILD_BATCH_SIZE
+        started = time.perf_counter()
+
+        metadata = {
+            "hnsw:space": hnsw.get("space", "l2"),
+            "hnsw:M": m or hnsw.get("max_neighbors", settings.HNSW_M),
+            "hnsw:construction_ef": ef_construction or hnsw.get("ef_construction", settings.HNSW_EF_CONSTRUCTION),
+            "hnsw:search_ef": ef_search or hnsw.get("ef_search", settings.HNSW_EF_SEARCH),
+            "embedding_profile": collection_profile(live),
+            "collection_version": collection_version(live),
+        }
+        staging_name = f"{live_name}-rebuild"
+        retired_name = f"{live_name}-retired"
+        for stale in (staging_name, retired_name):
+            try:
+                client.delete_collection(stale)
+            except Exception:
+                pass
+
+        staging = client.create_collection(staging_name, metadata=metadata, embedding_function=None)
+        logger.info("Rebuilding vector collection %s with %s", live_name, metadata)
+
+        copied = 0
+        for batch in _iter_batches(live, batch_size):
+            staging.add(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=batch["metadatas"],
+            )
+            copied += len(batch["ids"])
+
+        with _write_gates[name].exclusive(), _swap_lock:
+            # Catch up with writes that happened while copying; new ones
+            # wait for the swap and then go to the new collection
+            live_ids = _all_ids(live, batch_size)
+            staged_ids = _all_ids(staging, batch_size)
+            missing = sorted(live_ids - staged_ids)
+            removed = sorted(staged_ids - live_ids)
+            _copy_ids(live, staging, missing, batch_size)
+            if removed:
+                staging.delete(ids=removed)
+
+            live.modify(name=retired_name)
+            staging.modify(name=live_name)
+            serve_collection(name, staging)
+
+        late, gone = _retire(client, retired_name, staging, live_ids, batch_size)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Rebuilt vector collection %s: %d vectors in %.1fs "
+            "(%d caught up, %d dropped, %d written late, %d deleted late)",
+            live_name, copied, elapsed, len(missing), len(removed), late, gone,
+        )
+    finally:
+        lock.release()
+    return collection_stats(name)
+
+
+def reset_collection(name: str) -> None:
+    """
+    Replace a collection with an empty one for the current embedding
+    profile. HNSW parameters of the old collection are kept, and the old
+    collection is retired like a rebuild's (see `_retire`), so workers that
+    still serve it keep working until their alias sync.
+    """
+    lock = _rebuild_locks[name]
+    if not lock.acquire(blocking=False):
+        raise RebuildInProgress(f"Collection '{name}' is already being rebuilt")
+    try:
+        _check_no_standby(name)
+        store = get_store(name)
+        live = store._collection
+        hnsw = _hnsw_config(live)
+        metadata = {
+            "hnsw:space": hnsw.get("space", "l2"),
+            "hnsw:M": hnsw.get("max_neighbors", settings.HNSW_M),
+            "hnsw:construction_ef": hnsw.get("ef_construction", settings.HNSW_EF_CONSTRUCTION),
+            "hnsw:search_ef": hnsw.get("ef_search", settings.HNSW_EF_SEARCH),
+            "embedding_profile": settings.EMBEDDING_PROFILE,
+            "collection_version": collection_version(live) + 1,
+        }
+        client = store._client
+        live_name = live.name
+        batch_size = settings.VECTOR_REBUILD_BATCH_SIZE
+        staging_name = f"{live_name}-reset"
+        retired_name = f"{live_name}-retired"
+        for stale in (staging_name, retired_name):
+            try:
+                client.delete_collection(stale)
+            except Exception:
+                pass
+        staging = client.create_collection(staging_name, metadata=metadata, embedding_function=None)
+        with _write_gates[name].exclusive(), _swap_lock:
+            swapped_ids = _all_ids(live, batch_size)
+            live.modify(name=retired_name)
+            staging.modify(name=live_name)
+            serve_collection(name, staging)
+        _retire(client, retired_name, staging, swapped_ids, batch_size)
+        logger.info("Reset vector collection %s for profile %s", live_name, settings.EMBEDDING_PROFILE)
+    finally:
+        lock.release()
+
+
+def rebuild_collection_background(name: str, **params) -> None:
+    """Background task wrapper: log instead of raising."""
+    try:
+        rebuild_collection(name, **params)
+    except RebuildInProgress as e:
+        logger.warning(str(e))
+    except Exception:
+        logger.exception(f"Error rebuilding vector collection {name}")
+
+
+def _exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    if space in ("cosine", "ip"):
+        if space == "cosine":
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        scores = -(queries @ vectors.T)
+    else:
+        scores = (
+            (queries ** 2).sum(axis=1, keepdims=True)
+            - 2 * queries @ vectors.T
+            + (vectors ** 2).sum(axis=1)
+        )
+    return np.argsort(scores, axis=1)[:, :k]
+
+
+def recall_latency_sweep(
+    name: str,
+    m_values: List[int],
+    ef_construction_values: List[int],
+    ef_search_values: List[int],
+    k: int = 10,
+    sample_size: int = 100,
+    max_vectors: int = 20000,
+) -> List[dict]:
+    """
+    Measure recall@k against exact search and query latency for every
+    combination of HNSW parameters.
+
+    Runs against in-memory copies of (at most ``max_vectors`` of) the
+    collection so the live index and its traffic are never touched.
+    """
+    store = get_store(name)
+    live = store._collection
+    space = _hnsw_config(live).get("space", "l2")
+
+    ids, vectors = [], []
+    for batch in _iter_batches(live, settings.VECTOR_REBUILD_BATCH_SIZE):
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+        if len(ids) >= max_vectors:
+            break
+    ids, vectors = ids[:max_vectors], np.asarray(vectors[:max_vectors], dtype=np.float32)
+    if not ids:
+        return []
+
+    k = min(k, len(ids))
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(ids), size=min(sample_size, len(ids)), replace=False)]
+    exact = _exact_neighbours(vectors, queries, k, space)
+    exact_ids = [{ids[i] for i in row} for row in exact]
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for m in m_values:
+        for ef_construction in ef_construction_values:
+            sweep_name = f"sweep-{uuid.uuid4().hex}"
+            collection = client.create_collection(
+                sweep_name,
+                metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": ef_construction},
+                embedding_function=None,
+            )
+            try:
+                build_started = time.perf_counter()
+                for start in range(0, len(ids), settings.VECTOR_REBUILD_BATCH_SIZE):
+                    end = start + settings.VECTOR_REBUILD_BATCH_SIZE
+                    collection.add(ids=ids[start:end], embeddings=vectors[start:end])
+                build_seconds = time.perf_counter() - build_started
+
+                for ef_search in ef_search_values:
+                    collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+                    latencies, hits = [], 0
+                    for query, expected in zip(queries, exact_ids):
+                        query_started = time.perf_counter()
+                        found = collection.query(query_embeddings=[query], n_results=k, include=[])
+                        latencies.append((time.perf_counter() - query_started) * 1000)
+                        hits += len(expected.intersection(found["ids"][0]))
+                    results.append({
+                        "m": m,
+                        "ef_construction": ef_construction,
+                        "ef_search": ef_search,
+                        "recall_at_k": round(hits / (k * len(queries)), 4),
+                        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                        "build_seconds": round(build_seconds, 3),
+                    })
+            finally:
+                client.delete_collection(sweep_name)
+    return results
+
+
+def benchmark_embedding_profiles(
+    name: str,
+    dimensions_values: List[Optional[int]],
+    modes: List[str],
+    k: int = 10,
+    sample_size: int = 100,
+    max_vectors: int = 20000,
+) -> List[dict]:
+    """
+    Compare memory, latency and recall@k of embedding profiles on the
+    collection's own vectors, without calling the embeddings API.
+
+    Reduced dimensions are simulated by truncating and re-normalizing the
+    stored vectors, which is how text-embedding-3 shortens its output.
+    Recall is measured against exact search on the full stored vectors.
+    """
+    store = get_store(name)
+    live = store._collection
+    space = _hnsw_config(live).get("space", "l2")
+
+    ids, vectors = [], []
+    for batch in _iter_batches(live, settings.VECTOR_REBUILD_BATCH_SIZE):
+        ids.extend(batch["ids"])
+        vectors.extend(batch["embeddings"])
+        if len(ids) >= max_vectors:
+            break
+    ids, vectors = ids[:max_vectors], np.asarray(vectors[:max_vectors], dtype=np.float32)
+    if not ids:
+        return []
+
+    k = min(k, len(ids))
+    rng = np.random.default_rng(0)
+    query_positions = rng.choice(len(ids), size=min(sample_size, len(ids)), replace=False)
+    exact = _exact_neighbours(vectors, vectors[query_positions], k, space)
+    expected = [set(row) for row in exact]
+    candidates = k * settings.QUANTIZED_RERANK_FACTOR
+
+    results = []
+    for dimensions in dimensions_values:
+        reduced = truncate_embeddings(vectors, dimensions).astype(np.float32)
+        queries = reduced[query_positions]
+        for mode in modes:
+            index = None if mode == "none" else QuantizedIndex(mode).build(ids, reduced)
+            latencies, hits = [], 0
+            for query, wanted in zip(queries, expected):
+                started = time.perf_counter()
+                if index is None:
+                    order, _ = rerank(query, reduced, space)
+                    found = order[:k]
+                else:
+                    positions = index.search(query, candidates)
+                    order, _ = rerank(query, reduced[positions], space)
+                    found = positions[order[:k]]
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len(wanted.intersection(found.tolist()))
+            results.append({
+                "dimensions": reduced.shape[1],
+                "quantization": mode,
+                "bytes_per_vector": round((index.nbytes if index else reduced.nbytes) / len(ids), 1),
+                "index_bytes": index.nbytes if index else reduced.nbytes,
+                "recall_at_k": round(hits / (k * len(queries)), 4),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            })
+    return results
@@ -0,0 +1,523 @@
+"""
+Zero-downtime re-embedding with shadow collections.
+
+A collection is re-embedded for another embedding profile (backend, model,
+dimensions) into a shadow collection, `<live name>-shadow`, while chat
+keeps reading the live one:
+
+- `build_shadow` creates the shadow collection with the next version and
+  re-embeds the live chunks into it at VECTOR_SHADOW_MAX_VECTORS_PER_SECOND,
+  keeping their vector ids, so the chunk registry and citations stay valid.
+  A build that stopped resumes where it was: chunks already in the shadow
+  are skipped.
+- From the start of the build the store's collection is a
+  `DualWriteCollection`: every write to the live collection (ingests,
+  deletes, metadata updates) is mirrored to the shadow one, embedded with
+  its profile.
+- `switch_to_shadow` embeds what the shadow still misses, then swaps the
+  names under the swap lock: the shadow becomes the live collection and the
+  old one `<live name>-previous`, still dual-written, so `rollback` can
+  swap them back. `drop_standby` deletes whichever one is not live; the
+  other workers stop mirroring to it on their next write to it, or at the
+  next alias sync.
+
+The live name is the alias: on startup and every VECTOR_ALIAS_SYNC_SECONDS
+each worker re-resolves it, follows switches made by other workers and
+embeds queries with the profile of the collection it serves.
+
+Changes of chunking are not covered: they change the chunks themselves and
+go through re-processing the files.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.chat.services.vector_index import (
+    RebuildInProgress, _all_ids, _hnsw_config, _rebuild_locks, _swap_lock, collection_profile,
+    collection_version, embeddings_for_profile, get_store, is_rebuilding, serve_collection,
+    serving_profile, VECTOR_STORES,
+)
+from app.config.embeddings import EMBEDDING_BACKENDS
+from app.config.resilience import build_breaker
+from app.config.settings import settings
+from app.monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SHADOW_SUFFIX = "-shadow"
+PREVIOUS_SUFFIX = "-previous"
+
+SHADOW_EMBEDDED = REGISTRY.counter(
+    "vector_shadow_embedded_total", "Vectors re-embedded into shadow collections, by collection"
+)
+SHADOW_PROGRESS = REGISTRY.gauge(
+    "vector_shadow_progress_ratio", "Share of the live collection covered by the shadow build, by collection"
+)
+SHADOW_RATE = REGISTRY.gauge(
+    "vector_shadow_vectors_per_second", "Re-embedding throughput of the running shadow build, by collection"
+)
+MIRROR_WRITES = REGISTRY.counter(
+    "vector_mirror_writes_total", "Writes mirrored to a shadow or previous collection, by collection and operation"
+)
+MIRROR_ERRORS = REGISTRY.counter(
+    "vector_mirror_errors_total", "Mirrored writes that failed and are left to the switch's catch-up, by collection"
+)
+ALIAS_SWITCHES = REGISTRY.counter(
+    "vector_alias_switches_total", "Live collection swaps, by collection and direction (switch, rollback)"
+)
+
+# Shadow builds and mirrored writes have their own breaker, so their
+# failures never open the one chat depends on
+shadow_breaker = build_breaker("embeddings_shadow", settings)
+
+_builds: Dict[str, "ShadowBuild"] = {}
+
+
+class ShadowError(Exception):
+    """The shadow collection is missing, incomplete or in the way."""
+
+
+class DualWriteCollection:
+    """
+    The live Chroma collection, with every write mirrored to a standby
+    collection built with another embedding profile. Reads and all other
+    attributes are the live collection's. A mirrored write that fails is
+    logged and left to the catch-up of the next switch.
+    """
+
+    def __init__(self, key: str, primary, mirror, mirror_embeddings):
+        self.key = key
+        self.primary = primary
+        self.mirror = mirror
+        self.mirror_embeddings = mirror_embeddings
+        # Held across a write to both collections, so the build and the
+        # switch never interleave with one
+        self.lock = threading.Lock()
+
+    def __getattr__(self, item):
+        return getattr(self.primary, item)
+
+    def _embed(self, documents) -> Optional[List[List[float]]]:
+        try:
+            return self.mirror_embeddings.embed_documents([text or "" for text in documents])
+        except Exception as e:
+            MIRROR_ERRORS.inc(collection=self.key)
+            logger.warning(f"Not mirroring a write to {self.mirror.name}: {type(e).__name__}: {e}")
+            return None
+
+    def _mirror(self, op: str, **kwargs) -> None:
+        try:
+            getattr(self.mirror, op)(**kwargs)
+            MIRROR_WRITES.inc(collection=self.key, op=op)
+        except Exception:
+            if self._mirror_dropped():
+                return
+            MIRROR_ERRORS.inc(collection=self.key)
+            logger.exception(f"Error mirroring {op} to {self.mirror.name}")
+
+    def _mirror_dropped(self) -> bool:
+        """
+        Whether the standby was dropped, e.g. by another worker's
+        `drop_standby`; if so the store goes back to the bare live collection
+        without waiting for the alias sync. The caller holds self.lock.
+        """
+        store = get_store(self.key)
+        standby = _find(store._client, self.mirror.name)
+        if standby is not None and standby.id == self.mirror.id:
+            return False
+        with _swap_lock:
+            if store._chroma_collection is self:
+                store._chroma_collection = self.primary
+        logger.info(f"{self.mirror.name} was dropped, no longer mirroring writes of {self.key} to it")
+        return True
+
+    def _write(self, op: str, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        # Embedded before taking the lock; without documents there is nothing to embed
+        vectors = self._embed(documents) if documents is not None else None
+        with self.lock:
+            result = getattr(self.primary, op)(
+                ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents, **kwargs
+            )
+            if vectors is not None:
+                mirror_op = "update" if op == "update" else "upsert"
+                self._mirror(mirror_op, ids=ids, embeddings=vectors, metadatas=metadatas, documents=documents)
+            elif op == "update" and documents is None and metadatas is not None:
+                self._mirror("update", ids=ids, metadatas=metadatas)
+        return result
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        return self._write("add", ids, embeddings, metadatas, documents, **kwargs)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        return self._write("upsert", ids, embeddings, metadatas, documents, **kwargs)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        return self._write("update", ids, embeddings, metadatas, documents, **kwargs)
+
+    def delete(self, ids=None, where=None, where_document=None, **kwargs):
+        with self.lock:
+            result = self.primary.delete(ids=ids, where=where, where_document=where_document, **kwargs)
+            self._mirror("delete", ids=ids, where=where, where_document=where_document)
+        return result
+
+
+@dataclass
+class ShadowBuild:
+    """Progress of the shadow build of one collection in this process."""
+    collection: str
+    profile: str
+    state: str = "building"
+    total: int = 0
+    embedded: int = 0
+    skipped: int = 0
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    cancel: threading.Event = field(default_factory=threading.Event)
+
+    def as_dict(self) -> Dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = self.embedded / elapsed if elapsed > 0 else 0.0
+        done = self.embedded + self.skipped
+        remaining = max(self.total - done, 0)
+        return {
+            "state": self.state,
+            "embedding_profile": self.profile,
+            "total": self.total,
+            "embedded": self.embedded,
+            "skipped": self.skipped,
+            "progress": round(min(done / self.total, 1.0), 4) if self.total else 1.0,
+            "vectors_per_second": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if self.state == "building" and rate else None,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+def target_profile(
+        backend: Optional[str] = None,
+        model: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        onnx_model: Optional[str] = None,
+) -> str:
+    """Embedding profile of the settings with the given fields replaced (`dimensions` None: native)."""
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Embedding backend must be one of: {', '.join(EMBEDDING_BACKENDS)}")
+    return settings.model_copy(update={
+        "EMBEDDING_BACKEND": backend,
+        "EMBEDDING_MODEL": model or settings.EMBEDDING_MODEL,
+        "EMBEDDING_DIMENSIONS": dimensions,
+        "EMBEDDING_ONNX_MODEL": onnx_model or settings.EMBEDDING_ONNX_MODEL,
+    }).EMBEDDING_PROFILE
+
+
+def _find(client, name: str):
+    try:
+        return client.get_collection(name, embedding_function=None)
+    except Exception:
+        return None
+
+
+def _parts(name: str):
+    """The store, its live collection, and the dual-write wrapper if one is installed."""
+    store = get_store(name)
+    current = store._collection
+    if isinstance(current, DualWriteCollection):
+        return store, current.primary, current
+    return store, current, None
+
+
+def _dual_write(name: str, live, standby) -> DualWriteCollection:
+    return DualWriteCollection(
+        name, live, standby, embeddings_for_profile(collection_profile(standby), shadow_breaker)
+    )
+
+
+def _shadow_metadata(live, profile: str) -> Dict:
+    hnsw = _hnsw_config(live)
+    return {
+        "hnsw:space": hnsw.get("space", "l2"),
+        "hnsw:M": hnsw.get("max_neighbors", settings.HNSW_M),
+        "hnsw:construction_ef": hnsw.get("ef_construction", settings.HNSW_EF_CONSTRUCTION),
+        "hnsw:search_ef": hnsw.get("ef_search", settings.HNSW_EF_SEARCH),
+        "embedding_profile": profile,
+        "collection_version": collection_version(live) + 1,
+    }
+
+
+# --------------------------------------------------------------------------- #
+# Build                                                                       #
+# --------------------------------------------------------------------------- #
+def build_shadow(name: str, profile: str) -> Dict:
+    """
+    Re-embed the live collection into its shadow collection for `profile`,
+    dual-writing from the start. Resumes a shadow built for the same
+    profile; one for another profile is replaced.
+    """
+    lock = _rebuild_locks[name]
+    if not lock.acquire(blocking=False):
+        raise RebuildInProgress(f"Collection '{name}' is already being rebuilt")
+    try:
+        store, live, proxy = _parts(name)
+        client = store._client
+        base = store._collection_name
+        with _swap_lock:
+            if _find(client, base + PREVIOUS_SUFFIX) is not None:
+                raise ShadowError(
+                    f"Collection '{name}' keeps its previous version for rollback; drop it before re-embedding again"
+                )
+            if profile == collection_profile(live):
+                raise ShadowError(f"Collection '{name}' is already embedded with {profile}")
+            shadow = _find(client, base + SHADOW_SUFFIX)
+            if shadow is not None and collection_profile(shadow) != profile:
+                client.delete_collection(shadow.name)
+                shadow = None
+            if shadow is None:
+                shadow = client.create_collection(
+                    base + SHADOW_SUFFIX, metadata=_shadow_metadata(live, profile), embedding_function=None,
+                )
+            if proxy is None or proxy.mirror.id != shadow.id:
+                proxy = _dual_write(name, live, shadow)
+                store._chroma_collection = proxy
+
+        build = ShadowBuild(name, profile)
+        _builds[name] = build
+        logger.info(f"Building shadow collection {shadow.name} for {profile}")
+        try:
+            _copy(build, proxy)
+        except Exception as e:
+            build.state, build.error = "failed", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            build.finished_at = time.time()
+            SHADOW_RATE.set(0, collection=name)
+        logger.info(
+            f"Shadow collection {shadow.name} {build.state}: {build.embedded} embedded, "
+            f"{build.skipped} already there, in {build.finished_at - build.started_at:.1f}s"
+        )
+        return build.as_dict()
+    finally:
+        lock.release()
+
+
+def _copy(build: ShadowBuild, proxy: DualWriteCollection) -> None:
+    live, shadow, embeddings = proxy.primary, proxy.mirror, proxy.mirror_embeddings
+    batch_size = max(1, settings.VECTOR_SHADOW_BATCH_SIZE)
+    max_rate = settings.VECTOR_SHADOW_MAX_VECTORS_PER_SECOND
+    build.total = live.count()
+    offset = 0
+    while True:
+        if build.cancel.is_set():
+            build.state = "cancelled"
+            return
+        batch = live.get(include=["documents"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+        present = set(shadow.get(ids=batch["ids"], include=[])["ids"])
+        todo = [(i, text) for i, text in zip(batch["ids"], batch["documents"]) if i not in present]
+        build.skipped += len(batch["ids"]) - len(todo)
+
+        if todo:
+            started = time.monotonic()
+            vectors = dict(zip((i for i, _ in todo), embeddings.embed_documents([text or "" for _, text in todo])))
+            with proxy.lock:
+                # Read again under the lock: chunks deleted meanwhile are left
+                # out, metadata changed meanwhile is taken as it is now
+                current = live.get(ids=list(vectors), include=["documents", "metadatas"])
+                if current["ids"]:
+                    shadow.upsert(
+                        ids=current["ids"],
+                        embeddings=[vectors[i] for i in current["ids"]],
+                        documents=current["documents"],
+                        metadatas=current["metadatas"],
+                    )
+            build.embedded += len(current["ids"])
+            SHADOW_EMBEDDED.inc(len(current["ids"]), collection=build.collection)
+            if max_rate:
+                # Leave the embeddings API and the CPU to chat
+                time.sleep(max(0.0, len(todo) / max_rate - (time.monotonic() - started)))
+
+        SHADOW_PROGRESS.set(min((build.embedded + build.skipped) / max(build.total, 1), 1.0), collection=build.collection)
+        SHADOW_RATE.set(build.as_dict()["vectors_per_second"], collection=build.collection)
+    build.state = "ready"
+    SHADOW_PROGRESS.set(1.0, collection=build.collection)
+
+
+def build_shadow_background(name: str, profile: str) -> None:
+    """Background task wrapper: log instead of raising."""
+    try:
+        build_shadow(name, profile)
+    except (RebuildInProgress, ShadowError) as e:
+        logger.warning(str(e))
+    except Exception:
+        logger.exception(f"Error building shadow collection of {name}")
+
+
+# --------------------------------------------------------------------------- #
+# Switch, rollback, drop                                                      #
+# --------------------------------------------------------------------------- #
+def _catch_up(proxy: DualWriteCollection) -> Dict:
+    """Make the standby hold exactly the live ids; the caller holds proxy.lock."""
+    live, standby = proxy.primary, proxy.mirror
+    batch_size = settings.VECTOR_REBUILD_BATCH_SIZE
+    live_ids, standby_ids = _all_ids(live, batch_size), _all_ids(standby, batch_size)
+    missing = sorted(live_ids - standby_ids)
+    extra = sorted(standby_ids - live_ids)
+    if len(missing) > settings.VECTOR_SHADOW_MAX_CATCH_UP:
+        raise ShadowError(
+            f"{standby.name} misses {len(missing)} of {len(live_ids)} vectors; "
+            f"build it again (POST /admin/vectors/{{collection}}/shadow) to catch up"
+        )
+    for start in range(0, len(missing), batch_size):
+        batch = live.get(ids=missing[start:start + batch_size], include=["documents", "metadatas"])
+        if batch["ids"]:
+            standby.upsert(
+                ids=batch["ids"],
+                embeddings=proxy.mirror_embeddings.embed_documents([text or "" for text in batch["documents"]]),
+                documents=batch["documents"],
+                metadatas=batch["metadatas"],
+            )
+    for start in range(0, len(extra), batch_size):
+        standby.delete(ids=extra[start:start + batch_size])
+    return {"caught_up": len(missing), "dropped": len(extra)}
+
+
+def _swap(name: str, standby_suffix: str, retired_suffix: str, direction: str) -> Dict:
+    lock = _rebuild_locks[name]
+    if not lock.acquire(blocking=False):
+        raise RebuildInProgress(f"Collection '{name}' is being rebuilt")
+    try:
+        store, live, proxy = _parts(name)
+        base = store._collection_name
+        if proxy is None or not proxy.mirror.name.endswith(standby_suffix):
+            target = "shadow" if standby_suffix == SHADOW_SUFFIX else "previous"
+            raise ShadowError(f"Collection '{name}' has no {target} version to switch to")
+        standby = proxy.mirror
+        with proxy.lock:
+            # Writes wait here, reads keep going to the live collection
+            report = _catch_up(proxy)
+            with _swap_lock:
+                live.modify(name=base + retired_suffix)
+                standby.modify(name=base)
+                serve_collection(name, _dual_write(name, standby, live))
+        ALIAS_SWITCHES.inc(collection=name, direction=direction)
+        logger.info(
+            f"Collection {name} now serves version {collection_version(standby)} ({collection_profile(standby)}) "
+            f"after {direction}; {report['caught_up']} vectors caught up, {report['dropped']} dropped"
+        )
+    finally:
+        lock.release()
+    return shadow_status(name)
+
+
+def switch_to_shadow(name: str) -> Dict:
+    """Serve the shadow collection; the old one stays dual-written for `rollback`."""
+    return _swap(name, SHADOW_SUFFIX, PREVIOUS_SUFFIX, "switch")
+
+
+def rollback(name: str) -> Dict:
+    """Serve the previous version again; the newer one goes back to being the shadow."""
+    return _swap(name, PREVIOUS_SUFFIX, SHADOW_SUFFIX, "rollback")
+
+
+def drop_standby(name: str, timeout: float = 60.0) -> Dict:
+    """Stop a running build and delete the shadow or previous collection."""
+    build = _builds.get(name)
+    if build is not None and build.state == "building":
+        build.cancel.set()
+    lock = _rebuild_locks[name]
+    if not lock.acquire(timeout=timeout):
+        raise RebuildInProgress(f"Collection '{name}' is being rebuilt")
+    try:
+        store, live, proxy = _parts(name)
+        base = store._collection_name
+        with _swap_lock:
+            store._chroma_collection = live
+            for suffix in (SHADOW_SUFFIX, PREVIOUS_SUFFIX):
+                if _find(store._client, base + suffix) is not None:
+                    store._client.delete_collection(base + suffix)
+                    logger.info(f"Dropped {base + suffix}")
+        SHADOW_PROGRESS.set(0, collection=name)
+    finally:
+        lock.release()
+    return shadow_status(name)
+
+
+# --------------------------------------------------------------------------- #
+# Status and alias sync                                                       #
+# --------------------------------------------------------------------------- #
+def shadow_status(name: str) -> Dict:
+    store, live, proxy = _parts(name)
+    standby = proxy.mirror if proxy is not None else None
+    build = _builds.get(name)
+    return {
+        "collection": name,
+        "live_version": collection_version(live),
+        "live_profile": collection_profile(live),
+        "live_count": live.count(),
+        "serving_profile": serving_profile(name),
+        "expected_embedding_profile": settings.EMBEDDING_PROFILE,
+        "standby": None if standby is None else ("shadow" if standby.name.endswith(SHADOW_SUFFIX) else "previous"),
+        "standby_version": collection_version(standby) if standby is not None else None,
+        "standby_profile": collection_profile(standby) if standby is not None else None,
+        "standby_count": standby.count() if standby is not None else None,
+        "rebuilding": is_rebuilding(name),
+        "build": build.as_dict() if build is not None else None,
+    }
+
+
+def sync_collection(name: str) -> None:
+    """
+    Re-resolve the live name and the standby collection, e.g. after another
+    worker switched or built a shadow, and serve the live collection with
+    its own embedding profile.
+    """
+    if is_rebuilding(name):
+        # This process is changing the collections itself
+        return
+    store, current_live, proxy = _parts(name)
+    client = store._client
+    base = store._collection_name
+    live = _find(client, base)
+    if live is None:
+        return
+    standby = _find(client, base + SHADOW_SUFFIX) or _find(client, base + PREVIOUS_SUFFIX)
+    with _swap_lock:
+        live_changed = live.id != current_live.id or serving_profile(name) != collection_profile(live)
+        standby_changed = (standby is None) != (proxy is None) or (
+            standby is not None and proxy is not None and standby.id != proxy.mirror.id
+        )
+        if not (live_changed or standby_changed):
+            return
+        if not live_changed:
+            live = current_live
+        serve_collection(name, _dual_write(name, live, standby) if standby is not None else live)
+    if not live_changed:
+        return
+    logger.info(f"Collection {name} serves version {collection_version(live)} ({collection_profile(live)})")
+    if collection_profile(live) != settings.EMBEDDING_PROFILE:
+        logger.warning(
+            f"Collection {name} is embedded with {collection_profile(live)}, settings use "
+            f"{settings.EMBEDDING_PROFILE}; build a shadow collection and switch to it"
+        )
+
+
+def sync_collections() -> None:
+    for name in VECTOR_STORES:
+        try:
+            sync_collection(name)
+        except Exception:
+            logger.exception(f"Error syncing vector collection {name}")
+
+
+async def run_alias_sync_loop() -> None:
+    """Periodic `sync_collections`, started from the app lifespan."""
+    while True:
+        await asyncio.sleep(settings.VECTOR_ALIAS_SYNC_SECONDS)
+        await asyncio.to_thread(sync_collections)
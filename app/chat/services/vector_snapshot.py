@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+
+from app.chat.services.vector_index import (
+    LEGACY_EMBEDDING_PROFILE, RebuildInProgress, _all_ids, _check_no_standby, _hnsw_config, _iter_batches,
+    _rebuild_locks, _retire, _swap_lock, _write_gates, get_store, serve_collection,
+)
+from app.chat.utils.quantization import invalidate_quantized_index
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout (one directory per snapshot):
+#   manifest.json   collection settings, embedding profile, row count, dtype
+#   embeddings.npy  N x D matrix, loadable with np.load(mmap_mode="r")
+#   records.jsonl   one {"id", "document", "metadata"} line per matrix row
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+
+_SNAPSHOT_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+_COPY_CHUNK = 16 * 1024 * 1024
+
+
+class SnapshotError(Exception):
+    """Raised for missing, malformed or incompatible snapshots."""
+
+
+def snapshot_path(snapshot: str) -> str:
+    """Resolve a snapshot name inside SNAPSHOT_DIR, rejecting path tricks."""
+    if not _SNAPSHOT_NAME_RE.match(snapshot):
+        raise SnapshotError(f"Invalid snapshot name: {snapshot}")
+    return os.path.join(settings.SNAPSHOT_DIR, snapshot)
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise SnapshotError(f"No snapshot at {path}")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    return manifest
+
+
+def list_snapshots() -> List[dict]:
+    if not os.path.isdir(settings.SNAPSHOT_DIR):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(settings.SNAPSHOT_DIR)):
+        try:
+            manifest = read_manifest(os.path.join(settings.SNAPSHOT_DIR, name))
+        except (SnapshotError, ValueError, OSError):
+            continue
+        snapshots.append({"name": name, **manifest})
+    return snapshots
+
+
+def export_collection(name: str, path: str, dtype: str = "float32") -> dict:
+    """
+    Stream a collection into a snapshot directory.
+
+    Embeddings are written batch by batch to a raw file and wrapped in an
+    .npy header at the end, so memory use stays at one batch.
+    """
+    if dtype not in ("float32", "float16"):
+        raise SnapshotError("dtype must be float32 or float16")
+    store = get_store(name)
+    collection = store._collection
+    started = time.perf_counter()
+
+    tmp_path = f"{path}.partial"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    raw_path = os.path.join(tmp_path, "embeddings.raw")
+
+    rows, dimensions = 0, None
+    with open(raw_path, "wb") as raw, open(os.path.join(tmp_path, RECORDS_FILE), "w", encoding="utf-8") as records:
+        for batch in _iter_batches(collection, settings.VECTOR_REBUILD_BATCH_SIZE):
+            vectors = np.asarray(batch["embeddings"], dtype=dtype)
+            if dimensions is None:
+                dimensions = vectors.shape[1]
+            raw.write(np.ascontiguousarray(vectors).tobytes())
+            for i, vector_id in enumerate(batch["ids"]):
+                records.write(json.dumps({
+                    "id": vector_id,
+                    "document": batch["documents"][i],
+                    "metadata": batch["metadatas"][i],
+                }, ensure_ascii=False) + "\n")
+            rows += len(batch["ids"])
+
+    with open(os.path.join(tmp_path, EMBEDDINGS_FILE), "wb") as out, open(raw_path, "rb") as raw:
+        header = {"descr": np.dtype(dtype).str, "fortran_order": False, "shape": (rows, dimensions or 0)}
+        np.lib.format.write_array_header_1_0(out, header)
+        shutil.copyfileobj(raw, out, _COPY_CHUNK)
+    os.remove(raw_path)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection": name,
+        "collection_name": collection.name,
+        "count": rows,
+        "dimensions": dimensions,
+        "dtype": dtype,
+        "embedding_profile": (collection.metadata or {}).get("embedding_profile", LEGACY_EMBEDDING_PROFILE),
+        "hnsw": _hnsw_config(collection),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    logger.info("Exported %d vectors from %s to %s in %.1fs", rows, name, path, time.perf_counter() - started)
+    return manifest
+
+
+def _snapshot_metadata(manifest: dict) -> dict:
+    hnsw = manifest.get("hnsw") or {}
+    return {
+        "hnsw:space": hnsw.get("space", "l2"),
+        "hnsw:M": hnsw.get("max_neighbors", settings.HNSW_M),
+        "hnsw:construction_ef": hnsw.get("ef_construction", settings.HNSW_EF_CONSTRUCTION),
+        "hnsw:search_ef": hnsw.get("ef_search", settings.HNSW_EF_SEARCH),
+        "embedding_profile": manifest["embedding_profile"],
+    }
+
+
+def _load_rows(collection, path: str, batch_size: int) -> int:
+    embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+    rows = 0
+    ids, documents, metadatas = [], [], []
+
+    def flush():
+        if ids:
+            collection.upsert(
+                ids=ids,
+                embeddings=np.asarray(embeddings[rows - len(ids):rows], dtype=np.float32),
+                documents=documents,
+                metadatas=[metadata or None for metadata in metadatas],
+            )
+            ids.clear()
+            documents.clear()
+            metadatas.clear()
+
+    with open(os.path.join(path, RECORDS_FILE), "r", encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            ids.append(record["id"])
+            documents.append(record["document"])
+            metadatas.append(record["metadata"])
+            rows += 1
+            if len(ids) >= batch_size:
+                flush()
+        flush()
+    return rows
+
+
+def import_snapshot(name: str, path: str, replace: bool = False, force: bool = False) -> int:
+    """
+    Stream a snapshot into a collection in batches, without calling the
+    embeddings API.
+
+    With `replace` the snapshot is loaded into a side collection built from
+    its HNSW settings and embedding profile, then swapped in for the live
+    one, which is retired like a rebuild's (see `_retire`). Otherwise rows
+    are upserted into the live collection, which must use the same
+    embedding profile unless `force` is set, even when it is empty: its
+    queries are embedded with its own profile.
+    """
+    manifest = read_manifest(path)
+    store = get_store(name)
+    profile = manifest["embedding_profile"]
+    current_profile = (store._collection.metadata or {}).get("embedding_profile", LEGACY_EMBEDDING_PROFILE)
+    if not replace and not force and profile != current_profile:
+        raise SnapshotError(
+            f"Snapshot embedding profile {profile} does not match collection profile {current_profile}; "
+            f"import it with replace to adopt the snapshot's profile"
+        )
+
+    lock = _rebuild_locks[name]
+    if not lock.acquire(blocking=False):
+        raise RebuildInProgress(f"Collection '{name}' is already being rebuilt")
+    try:
+        started = time.perf_counter()
+        batch_size = settings.VECTOR_REBUILD_BATCH_SIZE
+        client = store._client
+        live = store._collection
+
+        if not replace:
+            rows = _load_rows(live, path, batch_size)
+        else:
+            _check_no_standby(name)
+            live_name = live.name
+            staging_name = f"{live_name}-import"
+            retired_name = f"{live_name}-retired"
+            for stale in (staging_name, retired_name):
+                try:
+                    client.delete_collection(stale)
+                except Exception:
+                    pass
+            staging = client.create_collection(
+                staging_name, metadata=_snapshot_metadata(manifest), embedding_function=None,
+            )
+            try:
+                rows = _load_rows(staging, path, batch_size)
+            except Exception:
+                client.delete_collection(staging_name)
+                raise
+            with _write_gates[name].exclusive(), _swap_lock:
+                swapped_ids = _all_ids(live, batch_size)
+                live.modify(name=retired_name)
+                staging.modify(name=live_name)
+                serve_collection(name, staging)
+            _retire(client, retired_name, staging, swapped_ids, batch_size)
+
+        invalidate_quantized_index(store)
+        if rows != manifest["count"]:
+            logger.warning("Snapshot %s has %d records, manifest says %d", path, rows, manifest["count"])
+        logger.info("Imported %d vectors into %s from %s in %.1fs", rows, name, path, time.perf_counter() - started)
+        return rows
+    finally:
+        lock.release()
+
+
+def export_collection_background(name: str, snapshot: str, dtype: str = "float32") -> None:
+    """Background task wrapper: log instead of raising."""
+    try:
+        os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+        export_collection(name, snapshot_path(snapshot), dtype=dtype)
+    except Exception:
+        logger.exception(f"Error exporting vector collection {name} to {snapshot}")
+
+
+def import_snapshot_background(name: str, snapshot: str, replace: bool = False, force: bool = False) -> None:
+    try:
+        import_snapshot(name, snapshot_path(snapshot), replace=replace, force=force)
+    except RebuildInProgress as e:
+        logger.warning(str(e))
+    except Exception:
+        logger.exception(f"Error importing snapshot {snapshot} into {name}")
+
+
+def default_snapshot_name(name: str, now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{name}-{now.strftime('%Y%m%dT%H%M%SZ')}"
@@ -0,0 +1,179 @@
+"""
+Streaming document parsing off the event loop.
+
+CPU-heavy formats are parsed in their own spawned process which streams
+pages back through a bounded queue, so the API worker never holds more than
+a window of pages and a runaway parse can be killed without taking the
+server down. Light formats are streamed from a thread.
+
+This module is imported by the worker processes: keep it free of app
+settings, database and vector store imports.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import time
+from typing import AsyncIterator, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.chat.utils.loaders import LOADERS, Loader
+
+logger = logging.getLogger(__name__)
+
+# How often the parent checks that the worker is still alive while waiting
+_POLL_INTERVAL = 1.0
+
+_mp_context = multiprocessing.get_context("spawn")
+
+
+class ParseError(Exception):
+    """The loader failed to parse the file, or its worker died."""
+
+
+class ParseTimeout(ParseError):
+    """The worker did not finish within the per-file timeout."""
+
+
+def _limit_memory(memory_limit_mb: Optional[int]) -> None:
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _parse_worker(path: str, loader_name: str, options: dict, out, memory_limit_mb: Optional[int]) -> None:
+    """Worker process entry point: stream pages into `out`."""
+    try:
+        _limit_memory(memory_limit_mb)
+        for total, text, metadata in LOADERS[loader_name].load(path, **options):
+            out.put(("page", total, text, metadata))
+        out.put(("done", None, None, None))
+    except MemoryError:
+        out.put(("error", None, f"Memory limit of {memory_limit_mb} MB exceeded", None))
+    except Exception as e:
+        out.put(("error", None, f"{type(e).__name__}: {e}", None))
+
+
+def _get(out, timeout: float):
+    try:
+        return out.get(timeout=timeout)
+    except queue_module.Empty:
+        return None
+
+
+async def _iter_in_thread(
+        path: str,
+        loader: Loader,
+        options: dict,
+        timeout: float,
+) -> AsyncIterator[Tuple[Document, Optional[int]]]:
+    pages = loader.load(path, **options)
+    # Only the time spent in the parser counts, not the consumer's between pages
+    parsing = 0.0
+    done = object()
+    try:
+        while True:
+            if parsing > timeout:
+                raise ParseTimeout(f"Parsing {path} took longer than {timeout:.0f}s")
+            started = time.monotonic()
+            try:
+                page = await asyncio.to_thread(next, pages, done)
+            except Exception as e:
+                raise ParseError(f"{type(e).__name__}: {e}") from e
+            finally:
+                parsing += time.monotonic() - started
+            if page is done:
+                return
+            total, text, metadata = page
+            yield Document(page_content=text, metadata=metadata), total
+    finally:
+        try:
+            pages.close()
+        except ValueError:  # Still running in the thread after a cancellation
+            pass
+
+
+async def _iter_in_process(
+        path: str,
+        loader: Loader,
+        options: dict,
+        timeout: float,
+        memory_limit_mb: Optional[int],
+        max_buffered_pages: int,
+) -> AsyncIterator[Tuple[Document, Optional[int]]]:
+    out = _mp_context.Queue(maxsize=max_buffered_pages)
+    process = _mp_context.Process(
+        target=_parse_worker,
+        args=(path, loader.name, options, out, memory_limit_mb),
+        name=f"parse-{os.path.basename(path)}",
+        daemon=True,
+    )
+    process.start()
+    # Only the time spent waiting for the worker counts: while the consumer
+    # handles a window, the worker parses ahead or waits on the full queue
+    waited = 0.0
+    try:
+        while True:
+            remaining = timeout - waited
+            if remaining <= 0:
+                raise ParseTimeout(f"Parsing {path} took longer than {timeout:.0f}s")
+
+            started = time.monotonic()
+            message = await asyncio.to_thread(_get, out, min(_POLL_INTERVAL, remaining))
+            waited += time.monotonic() - started
+            if message is None:
+                if not process.is_alive():
+                    # The worker may have exited right after its last put
+                    message = await asyncio.to_thread(_get, out, 0.1)
+                    if message is None:
+                        raise ParseError(f"Parser for {path} exited with code {process.exitcode}")
+                else:
+                    continue
+
+            kind, total, text, metadata = message
+            if kind == "page":
+                yield Document(page_content=text, metadata=metadata), total
+            elif kind == "done":
+                return
+            else:
+                raise ParseError(text)
+    finally:
+        if process.is_alive():
+            process.kill()
+        await asyncio.to_thread(process.join, 5)
+        out.close()
+        out.cancel_join_thread()
+
+
+def iter_pages(
+        path: str,
+        loader: Loader,
+        timeout: float,
+        memory_limit_mb: Optional[int] = None,
+        max_buffered_pages: int = 50,
+        options: Optional[dict] = None,
+) -> AsyncIterator[Tuple[Document, Optional[int]]]:
+    """
+    Parse `path` with `loader` and yield (page, total pages) as pages
+    arrive; `options` are passed on to the loader.
+
+    CPU-heavy loaders run in a worker process that blocks once
+    `max_buffered_pages` are waiting, so a slow consumer bounds memory on
+    both sides, and that is killed if it exceeds `memory_limit_mb`. Other
+    loaders are stepped through in a thread.
+
+    Raises ParseTimeout if the consumer waits on the parser for more than
+    `timeout` seconds in total (time spent handling the pages in between
+    does not count) and ParseError if the loader fails or its worker dies.
+    """
+    options = options or {}
+    if loader.cpu_heavy:
+        return _iter_in_process(path, loader, options, timeout, memory_limit_mb, max_buffered_pages)
+    return _iter_in_thread(path, loader, options, timeout)
@@ -0,0 +1,346 @@
+"""
+Document loader registry.
+
+A loader turns a file into a stream of (total pages, text, metadata)
+tuples, one "page" at a time: a PDF page, a slide, a block of text or a
+batch of table rows. Loaders are looked up by file extension, then by a
+MIME type sniffed from the file's first bytes.
+
+Loaders marked `cpu_heavy` are run in a parse worker process, the others
+in a thread. This module is imported by the worker processes: keep it free
+of app settings, database and vector store imports.
+"""
+import csv
+import mimetypes
+import os
+import re
+import zipfile
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+Page = Tuple[Optional[int], str, dict]
+
+# Text formats are streamed in blocks of roughly this many characters
+TEXT_BLOCK_CHARS = 20_000
+_READ_CHUNK = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Loader:
+    name: str
+    extensions: Tuple[str, ...]
+    mime_types: Tuple[str, ...]
+    load: Callable[..., Iterator[Page]]
+    # Parsing is CPU-bound: run it in a worker process rather than a thread
+    cpu_heavy: bool = False
+    # Pages are row batches that are already chunk-sized: do not re-split them
+    tabular: bool = False
+
+
+LOADERS: Dict[str, Loader] = {}
+_BY_EXTENSION: Dict[str, Loader] = {}
+_BY_MIME_TYPE: Dict[str, Loader] = {}
+
+
+def register_loader(loader: Loader) -> Loader:
+    LOADERS[loader.name] = loader
+    for ext in loader.extensions:
+        _BY_EXTENSION[ext] = loader
+    for mime_type in loader.mime_types:
+        _BY_MIME_TYPE[mime_type] = loader
+    return loader
+
+
+def supported_extensions() -> List[str]:
+    return sorted(_BY_EXTENSION)
+
+
+# --------------------------------------------------------------------------- #
+# Format detection                                                            #
+# --------------------------------------------------------------------------- #
+_OOXML_PARTS = (
+    ("word/document.xml", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    ("ppt/presentation.xml", "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    ("xl/workbook.xml", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+)
+
+
+def sniff_mime_type(path: str) -> Optional[str]:
+    """Guess a MIME type from the file's content."""
+    with open(path, "rb") as f:
+        head = f.read(2048)
+    if head.startswith(b"%PDF"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            return None
+        for part, mime_type in _OOXML_PARTS:
+            if part in names:
+                return mime_type
+        return None
+    lowered = head.lstrip().lower()
+    if lowered.startswith((b"<!doctype html", b"<html")):
+        return "text/html"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is fine
+        if e.start < len(head) - 3:
+            return None
+    return "text/plain"
+
+
+def get_loader(path: str, filename: Optional[str] = None) -> Optional[Loader]:
+    """Loader for a file: by extension, then by sniffed or guessed MIME type."""
+    filename = filename or path
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in _BY_EXTENSION:
+        return _BY_EXTENSION[ext]
+    for mime_type in (sniff_mime_type(path), mimetypes.guess_type(filename)[0]):
+        if mime_type in _BY_MIME_TYPE:
+            return _BY_MIME_TYPE[mime_type]
+    return None
+
+
+# --------------------------------------------------------------------------- #
+# Text formats                                                                #
+# --------------------------------------------------------------------------- #
+def _open_text(path: str):
+    return open(path, "r", encoding="utf-8-sig", errors="replace", newline="")
+
+
+def _iter_text_blocks(lines: Iterable[str]) -> Iterator[str]:
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= TEXT_BLOCK_CHARS:
+            yield "".join(block)
+            block, size = [], 0
+    if block:
+        yield "".join(block)
+
+
+def load_text(path: str, **options) -> Iterator[Page]:
+    with _open_text(path) as f:
+        for block in _iter_text_blocks(f):
+            yield None, block, {}
+
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def load_markdown(path: str, **options) -> Iterator[Page]:
+    """One page per heading section, split further if a section is long."""
+    section, lines, size, has_text = None, [], 0, False
+
+    def flush():
+        return None, "".join(lines), {"section": section} if section else {}
+
+    with _open_text(path) as f:
+        in_code = False
+        for line in f:
+            if line.lstrip().startswith("```"):
+                in_code = not in_code
+            match = None if in_code else _HEADING_RE.match(line)
+            if (match or size >= TEXT_BLOCK_CHARS) and has_text:
+                yield flush()
+                lines, size, has_text = [], 0, False
+            if match:
+                section = match.group(2)
+            lines.append(line)
+            size += len(line)
+            has_text = has_text or bool(line.strip())
+    if has_text:
+        yield flush()
+
+
+class _HTMLTextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "noscript", "template"}
+    _BLOCK = {
+        "p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+        "section", "article", "header", "footer", "table", "pre", "blockquote",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.size = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth and data.strip():
+            self.parts.append(data)
+            self.size += len(data)
+
+    def take(self) -> str:
+        text = re.sub(r"\n\s*\n+", "\n\n", "".join(self.parts)).strip()
+        self.parts, self.size = [], 0
+        return text
+
+
+def load_html(path: str, **options) -> Iterator[Page]:
+    """Visible text of the page, without scripts, styles or markup."""
+    parser = _HTMLTextExtractor()
+    with _open_text(path) as f:
+        while True:
+            data = f.read(_READ_CHUNK)
+            if not data:
+                break
+            parser.feed(data)
+            if parser.size >= TEXT_BLOCK_CHARS:
+                yield None, parser.take(), {}
+    parser.close()
+    text = parser.take()
+    if text:
+        yield None, text, {}
+
+
+# --------------------------------------------------------------------------- #
+# Tabular formats                                                             #
+# --------------------------------------------------------------------------- #
+def _format_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _iter_row_batches(
+        rows: Iterable[Iterable],
+        rows_per_chunk: int = 50,
+        max_chunk_chars: int = 4000,
+        **metadata,
+) -> Iterator[Page]:
+    """
+    Render table rows as "column: value" lines, batched so that every page
+    stays chunk-sized and repeats the header the rows need for context.
+    """
+    header, lines, size, first_row, row_number = None, [], 0, 0, 0
+
+    def flush():
+        text = f"Columns: {', '.join(header)}\n" + "\n".join(lines)
+        return None, text, {**metadata, "rows": f"{first_row}-{row_number}"}
+
+    for row in rows:
+        cells = [_format_cell(value) for value in row]
+        if not any(cells):
+            continue
+        if header is None:
+            header = [cell or f"column {i + 1}" for i, cell in enumerate(cells)]
+            continue
+        row_number += 1
+        if not lines:
+            first_row = row_number
+        line = "; ".join(
+            f"{header[i] if i < len(header) else f'column {i + 1}'}: {cell}"
+            for i, cell in enumerate(cells) if cell
+        )
+        lines.append(line)
+        size += len(line)
+        if len(lines) >= rows_per_chunk or size >= max_chunk_chars:
+            yield flush()
+            lines, size = [], 0
+    if lines:
+        yield flush()
+
+
+def load_csv(path: str, **options) -> Iterator[Page]:
+    with _open_text(path) as f:
+        sample = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel_tab if path.lower().endswith(".tsv") else csv.excel
+        yield from _iter_row_batches(csv.reader(f, dialect), **options)
+
+
+def load_xlsx(path: str, **options) -> Iterator[Page]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from _iter_row_batches(sheet.iter_rows(values_only=True), sheet=sheet.title, **options)
+    finally:
+        workbook.close()
+
+
+# --------------------------------------------------------------------------- #
+# Paged formats                                                               #
+# --------------------------------------------------------------------------- #
+def load_pdf(path: str, **options) -> Iterator[Page]:
+    # Text layer only, no OCR or image extraction; pages are parsed lazily
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    for number, page in enumerate(reader.pages):
+        yield total, page.extract_text() or "", {"page": number, "total_pages": total}
+
+
+def load_docx(path: str, **options) -> Iterator[Page]:
+    from langchain_community.document_loaders import Docx2txtLoader
+
+    for doc in Docx2txtLoader(path).lazy_load():
+        yield 1, doc.page_content, {}
+
+
+def load_pptx(path: str, **options) -> Iterator[Page]:
+    """One page per slide: text frames, table cells and speaker notes."""
+    from pptx import Presentation
+
+    presentation = Presentation(path)
+    total = len(presentation.slides)
+    for number, slide in enumerate(presentation.slides):
+        parts = []
+        for shape in slide.shapes:
+            if shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+            elif getattr(shape, "has_table", False) and shape.has_table:
+                for row in shape.table.rows:
+                    parts.append(" | ".join(cell.text for cell in row.cells))
+        if slide.has_notes_slide:
+            parts.append(slide.notes_slide.notes_text_frame.text)
+        text = "\n".join(part for part in parts if part.strip())
+        yield total, text, {"slide": number + 1, "total_slides": total}
+
+
+register_loader(Loader("pdf", (".pdf",), ("application/pdf",), load_pdf, cpu_heavy=True))
+register_loader(Loader(
+    "docx", (".docx",),
+    ("application/vnd.openxmlformats-officedocument.wordprocessingml.document",),
+    load_docx, cpu_heavy=True,
+))
+register_loader(Loader(
+    "pptx", (".pptx",),
+    ("application/vnd.openxmlformats-officedocument.presentationml.presentation",),
+    load_pptx, cpu_heavy=True,
+))
+register_loader(Loader(
+    "xlsx", (".xlsx", ".xlsm"),
+    ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",),
+    load_xlsx, cpu_heavy=True, tabular=True,
+))
+register_loader(Loader("csv", (".csv", ".tsv"), ("text/csv", "text/tab-separated-values"), load_csv, tabular=True))
+register_loader(Loader("html", (".html", ".htm"), ("text/html",), load_html))
+register_loader(Loader("markdown", (".md", ".markdown"), ("text/markdown",), load_markdown))
+register_loader(Loader("text", (".txt",), ("text/plain",), load_text))
@@ -6,7 +6,9 @@ from app.config.settings import settings
 
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
+
+from app.chat.utils.reranking import build_retriever
+from app.chat.utils.routing import STRONG_TIER, ModelRouter
 
 logger = logging.getLogger(__name__)
 
@@ -17,45 +19,38 @@ PRIVATE_DB_PATH = os.path.join(BASE_DIR, "private_chroma_db")
 COLLECTION_NAME = "PRIVATE_CHAT_COLLECTION"
 
 # Embeddings and vector store using API key from settings
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-large",
-    openai_api_key=settings.OPENAI_API_KEY
-)
+embeddings = app_settings.embedding_model
 
 private_vector_store = Chroma(
     collection_name=COLLECTION_NAME,
     embedding_function=embeddings,
-    persist_directory=PRIVATE_DB_PATH,
+    **app_settings.chroma_client_kwargs(PRIVATE_DB_PATH),
+    collection_metadata=settings.HNSW_COLLECTION_METADATA,
 )
 
 # Retriever
-private_retriever = private_vector_store.as_retriever(search_kwargs={"k": 3})
+# Wide candidate fetch, re-ranked down to what fits the prompt budget
+private_retriever = build_retriever(private_vector_store)
 
-# LLM model
-chat_model = app_settings.private_chat_model
-
-# QA Chain
-private_qa_chain = RetrievalQA.from_chain_type(
-    llm=chat_model,
-    chain_type="stuff",
-    retriever=private_retriever,
-    return_source_documents=True,
-)
+# QA router over the fast and strong model tiers
+private_qa_router = ModelRouter("private", private_retriever, default_tier=STRONG_TIER)
 
 def ask(question: str) -> dict:
     """
-    Run RetrievalQA chain on a user question using the private vector DB.
+    Answer a user question from the private vector DB with the routed model tier.
     Returns:
         dict: {
             'result': answer string,
-            'source_documents': list of Document
+            'source_documents': list of Document,
+            'tier': model tier that answered ("fast", "strong" or "no_answer")
         }
     """
     try:
-        return private_qa_chain.invoke({"query": question})
+        return private_qa_router.invoke(question)
     except Exception as e:
         logger.exception(f"Error in private chat retrieval for question: {question}")
         return {
             "result": "Sorry, something went wrong while processing your question.",
-            "source_documents": []
+            "source_documents": [],
+            "failed": True,
         }
@@ -1,17 +1,29 @@
+import asyncio
 import os
 import logging
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+from typing import Awaitable, Callable, List, Optional
+
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from app.chat.models.file import File, InfoType
+from app.chat.services.chunks import FileChunkIndexer, collection_of, delete_file_chunks
+from app.chat.services.vector_index import EmbeddingProfileMismatch, check_embedding_profile, vector_writes
+from app.chat.utils.document_parser import ParseError, iter_pages
+from app.chat.utils.loaders import Loader, get_loader
 from app.chat.utils.private_chat import private_vector_store
 from app.chat.utils.public_chat import public_vector_store
+from app.chat.utils.quantization import invalidate_quantized_index
 from app.config import settings as app_settings
+from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Called with (pages processed, total pages) after each window is indexed
+ProgressCallback = Callable[[int, Optional[int]], Awaitable[None]]
+# Called once with the tokens sent to the embeddings API, also after a failed run
+EmbeddedCallback = Callable[[int], None]
+
 # Ensure the uploads folder exists
 UPLOAD_DIR = os.path.join(app_settings.BASE_DIR, 'uploads')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -22,49 +34,120 @@ splitter = RecursiveCharacterTextSplitter(
     chunk_overlap=100,
 )
 
-async def process_file(file_record: File) -> str:
+# Bounds how many files are parsed at once, i.e. the number of parse workers
+_parse_slots = asyncio.Semaphore(settings.PARSE_WORKERS)
+
+
+def _delete_source(store, filename: str) -> None:
+    with vector_writes(store):
+        store.delete(where={"source": filename})
+
+
+async def _index_window(indexer: FileChunkIndexer, loader: Loader, pages: List[Document]) -> None:
+    if loader.tabular:
+        # Row batches are already chunk-sized and must not be cut mid-row
+        chunks = [page for page in pages if page.page_content.strip()]
+    else:
+        chunks = splitter.split_documents(pages)
+    if chunks:
+        await indexer.add(chunks)
+
+
+async def process_file(
+        file_record: File,
+        on_progress: Optional[ProgressCallback] = None,
+        on_embedded: Optional[EmbeddedCallback] = None,
+) -> str:
     """
     Process one uploaded file:
     - Choose the correct Chroma store based on `information_type`
-    - Remove existing embeddings
-    - Load and tag the document
-    - Split it into chunks
-    - Upsert into Chroma
-    
+    - Pick a loader from the registry by extension or sniffed content
+    - Parse the document page by page, in a worker process for CPU-heavy
+      formats
+    - Split and upsert each window of PARSE_WINDOW_PAGES pages into Chroma,
+      reporting progress through `on_progress`. Chunks already indexed for
+      the file with the same content keep their vectors; the others are
+      embedded and registered in the `chunks` table
+    - Remove the file's previous vectors that were not reused
+    - Report the tokens embedded through `on_embedded`
+
     Returns:
         str: The new status of the file ("Processed", "Error", or "Unsupported Format")
     """
+    filename = file_record.filename
+    store = private_vector_store if file_record.information_type == InfoType.PRIVATE else public_vector_store
+    file_path = file_record.get_upload_path()
+
+    # Before touching the file's existing vectors
     try:
-        store = private_vector_store if file_record.information_type == InfoType.PRIVATE else public_vector_store
-        file_path = file_record.get_upload_path()
+        check_embedding_profile(store)
+    except EmbeddingProfileMismatch as e:
+        logger.error(f"Not indexing {filename}: {e}")
+        return "Error"
 
+    indexer = None
+    try:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found at {file_path}")
-
-        # Step 1: Delete any existing vectors
-        store.delete(where={"source": file_record.filename})
-
-        # Step 2: Load the document
-        ext = os.path.splitext(file_record.filename)[1].lower()
-        if ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif ext == ".docx":
-            loader = Docx2txtLoader(file_path)
-        elif ext == ".txt":
-            loader = TextLoader(file_path, encoding="utf-8")
-        else:
+        loader = get_loader(file_path, filename)
+        if loader is None:
             return "Unsupported Format"
 
-        docs = loader.load()
-        for doc in docs:
-            doc.metadata["source"] = file_record.filename
+        # Step 1: Load the chunks registered for the file by a previous run
+        indexer = await FileChunkIndexer.start(store, file_record.uid, collection_of(file_record.information_type))
+        if not indexer.previous_ids:
+            # Indexed before the chunk registry, or never: nothing to reuse
+            await asyncio.to_thread(_delete_source, store, filename)
 
-        # Step 3: Chunk + Upsert
-        chunks = splitter.split_documents(docs)
-        store.add_documents(chunks)
+        # Step 2: Stream pages from the parser, indexing them window by window
+        async with _parse_slots:
+            done, window = 0, []
+            async for page, total in iter_pages(
+                    file_path,
+                    loader,
+                    timeout=settings.PARSE_TIMEOUT_SECONDS,
+                    memory_limit_mb=settings.PARSE_MEMORY_LIMIT_MB,
+                    max_buffered_pages=settings.PARSE_WINDOW_PAGES * 2,
+                    options={
+                        "rows_per_chunk": settings.TABLE_ROWS_PER_CHUNK,
+                        "max_chunk_chars": settings.TABLE_CHUNK_MAX_CHARS,
+                    },
+            ):
+                page.metadata["source"] = filename
+                window.append(page)
+                if len(window) >= settings.PARSE_WINDOW_PAGES:
+                    await _index_window(indexer, loader, window)
+                    done += len(window)
+                    window = []
+                    if on_progress:
+                        await on_progress(done, total)
+            if window:
+                await _index_window(indexer, loader, window)
+                done += len(window)
+                if on_progress:
+                    await on_progress(done, total)
 
+        await indexer.finish()
+        invalidate_quantized_index(store)
+        if on_embedded:
+            on_embedded(indexer.embedded_tokens)
         return "Processed"
-    
+
     except Exception as e:
-        logger.exception(f"Error processing file {file_record.filename}")
-        return "Error"
\ No newline at end of file
+        if isinstance(e, ParseError):
+            logger.error(f"Error parsing file {filename}: {e}")
+        else:
+            logger.exception(f"Error processing file {filename}")
+        # Do not leave a partially indexed file behind
+        try:
+            if indexer is not None:
+                await indexer.discard()
+            else:
+                await delete_file_chunks(file_record.uid)
+            await asyncio.to_thread(_delete_source, store, filename)
+            invalidate_quantized_index(store)
+        except Exception:
+            logger.exception(f"Error removing partial embeddings of {filename}")
+        if on_embedded and indexer is not None:
+            on_embedded(indexer.embedded_tokens)
+        return "Error"
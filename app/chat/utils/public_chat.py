@@ -1,10 +1,15 @@
 import os
 import logging
+from typing import List
+
 from app.config import settings as app_settings
 from app.config.settings import settings
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_chroma import Chroma
-from langchain.chains import RetrievalQA
+
+from app.chat.utils.reranking import build_retriever
+from app.config.resilience import CircuitOpenError, DeadlineExceeded
+from app.chat.utils.routing import FAST_TIER, ModelRouter, failure_result
 
 logger = logging.getLogger(__name__)
 
@@ -15,32 +20,48 @@ PUBLIC_DB_PATH = os.path.join(BASE_DIR, "public_chroma_db")
 COLLECTION_NAME = "PUBLIC_CHAT_COLLECTION"
 
 # Init embeddings with OpenAI API key from settings
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-large",
-    openai_api_key=settings.OPENAI_API_KEY
-)
+embeddings = app_settings.embedding_model
 public_vector_store = Chroma(
     collection_name=COLLECTION_NAME,
     embedding_function=embeddings,
-    persist_directory=PUBLIC_DB_PATH
+    **app_settings.chroma_client_kwargs(PUBLIC_DB_PATH),
+    collection_metadata=settings.HNSW_COLLECTION_METADATA,
 )
 
-public_retriever = public_vector_store.as_retriever(search_kwargs={"k": 3})
-chat_model = app_settings.public_chat_model
+# Wide candidate fetch, re-ranked down to what fits the prompt budget
+public_retriever = build_retriever(public_vector_store)
 
-public_qa_chain = RetrievalQA.from_chain_type(
-    llm=chat_model,
-    chain_type="stuff",
-    retriever=public_retriever,
-    return_source_documents=True
-)
+# Routes each question to the fast or strong model tier
+public_qa_router = ModelRouter("public", public_retriever, default_tier=FAST_TIER)
 
 def public_ask(question: str) -> dict:
     try:
-        return public_qa_chain.invoke({"query": question})
+        return public_qa_router.invoke(question)
     except Exception as e:
         logger.exception(f"Error in public chat retrieval for question: {question}")
         return {
             "result": "Sorry, something went wrong while answering your question.",
-            "source_documents": []
-        }
\ No newline at end of file
+            "source_documents": [],
+            "failed": True,
+        }
+
+
+async def public_ask_async(question: str) -> dict:
+    """public_ask without blocking the event loop, bounded by the request deadline."""
+    try:
+        return await public_qa_router.ainvoke(question)
+    except (CircuitOpenError, DeadlineExceeded) as e:
+        logger.warning(f"Public chat retrieval unavailable ({e}) for question: {question}")
+        return failure_result(e)
+    except Exception as e:
+        logger.exception(f"Error in public chat retrieval for question: {question}")
+        return failure_result(e)
+
+
+async def public_ask_batch(questions: List[str]) -> List[dict]:
+    """public_ask for many questions at once, with per-question failures."""
+    try:
+        return await public_qa_router.abatch(questions, settings.BATCH_CHAT_CONCURRENCY)
+    except Exception as e:
+        logger.exception(f"Error in public batch chat retrieval for {len(questions)} questions")
+        return [failure_result(e) for _ in questions]
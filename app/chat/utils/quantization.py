@@ -0,0 +1,322 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Number of set bits for every byte value, used for Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+# Rows scored per step so int8 codes are never widened all at once
+_SCORE_CHUNK = 8192
+
+
+def truncate_embeddings(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """
+    Shorten text-embedding-3 vectors the way the API's `dimensions` parameter
+    does: keep the leading components and re-normalize.
+    """
+    if not dimensions or dimensions >= vectors.shape[-1]:
+        return vectors
+    short = vectors[..., :dimensions]
+    norms = np.linalg.norm(short, axis=-1, keepdims=True)
+    return short / np.where(norms == 0, 1, norms)
+
+
+class QuantizedIndex:
+    """
+    In-memory int8 or binary codes for a set of float vectors.
+
+    `search` returns candidate positions ranked on the codes only; callers
+    re-rank the candidates with the float vectors.
+    """
+
+    def __init__(self, mode: str):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unsupported quantization mode: {mode}")
+        self.mode = mode
+        self.ids: List[str] = []
+        self.codes: Optional[np.ndarray] = None
+        self._offset: Optional[np.ndarray] = None
+        self._scale: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        if self.codes is None:
+            return 0
+        extra = 0 if self._scale is None else self._scale.nbytes + self._offset.nbytes
+        return self.codes.nbytes + extra
+
+    def build(self, ids: List[str], vectors: np.ndarray) -> "QuantizedIndex":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.ids = list(ids)
+        if self.mode == "binary":
+            self.codes = np.packbits(vectors > 0, axis=1)
+            return self
+
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        self._scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+        self._offset = low.astype(np.float32)
+        self.codes = (np.round((vectors - self._offset) / self._scale) - 128).astype(np.int8)
+        return self
+
+    def build_batches(self, ids: List[str], batches: List[np.ndarray]) -> "QuantizedIndex":
+        """`build` from float vectors in batches; each batch is freed once encoded."""
+        self.ids = list(ids)
+        if self.mode == "int8":
+            low = np.min([batch.min(axis=0) for batch in batches], axis=0)
+            high = np.max([batch.max(axis=0) for batch in batches], axis=0)
+            self._scale = np.where(high > low, (high - low) / 255.0, 1.0).astype(np.float32)
+            self._offset = low.astype(np.float32)
+        codes = []
+        while batches:
+            batch = batches.pop(0)
+            if self.mode == "binary":
+                codes.append(np.packbits(batch > 0, axis=1))
+            else:
+                codes.append((np.round((batch - self._offset) / self._scale) - 128).astype(np.int8))
+        self.codes = np.concatenate(codes)
+        return self
+
+    def search(self, query: np.ndarray, n: int) -> np.ndarray:
+        """Positions of the `n` best candidates, best first."""
+        if self.codes is None or not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        query = np.asarray(query, dtype=np.float32)
+        n = min(n, len(self.ids))
+
+        if self.mode == "binary":
+            query_bits = np.packbits(query > 0)
+            # Lower Hamming distance is better
+            scores = -_POPCOUNT[np.bitwise_xor(self.codes, query_bits)].sum(axis=1, dtype=np.int32)
+        else:
+            # Inner product against de-quantized vectors, up to a constant
+            weights = query * self._scale
+            scores = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), _SCORE_CHUNK):
+                chunk = self.codes[start:start + _SCORE_CHUNK].astype(np.float32)
+                scores[start:start + _SCORE_CHUNK] = chunk @ weights
+
+        top = np.argpartition(-scores, n - 1)[:n]
+        return top[np.argsort(-scores[top])]
+
+
+def rerank(query: np.ndarray, vectors: np.ndarray, space: str = "l2") -> Tuple[np.ndarray, np.ndarray]:
+    """Exact float distances for candidate vectors; returns (order, distances)."""
+    query = np.asarray(query, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if space == "ip":
+        distances = 1.0 - vectors @ query
+    elif space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0)
+        distances = 1.0 - (vectors @ query) / np.where(norms == 0, 1, norms)
+    else:
+        distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances)
+    return order, distances[order]
+
+
+class _CollectionIndex:
+    """
+    Quantized index of one Chroma collection. Queries read the current
+    index without locking; once it is stale (vectors changed in this
+    process, or QUANTIZED_INDEX_CHECK_SECONDS passed and the vector count
+    differs) a background thread builds a new one and swaps it in, while
+    queries keep using the old one. Only the first build, or one for a
+    collection that was swapped out, makes queries wait.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.index: Optional[QuantizedIndex] = None
+        self.collection_id: Any = None
+        self.count = -1
+        self.checked_at = 0.0
+        self.dirty = True
+        self.refreshing = False
+        # Held while building, never while searching
+        self.lock = threading.Lock()
+        # Guards `refreshing` only, so a query never waits for a build
+        self._refresh_lock = threading.Lock()
+
+    def get(self, collection) -> QuantizedIndex:
+        index = self.index
+        if index is None or self.collection_id != collection.id:
+            with self.lock:
+                if self.index is None or self.collection_id != collection.id:
+                    self._build(collection)
+                return self.index
+        if self.dirty or time.monotonic() - self.checked_at >= settings.QUANTIZED_INDEX_CHECK_SECONDS:
+            with self._refresh_lock:
+                if not self.refreshing:
+                    self.refreshing = True
+                    threading.Thread(target=self._refresh, args=(collection,), daemon=True).start()
+        return index
+
+    def _refresh(self, collection) -> None:
+        try:
+            with self.lock:
+                self.checked_at = time.monotonic()
+                if self.dirty or collection.count() != self.count:
+                    self._build(collection)
+        except Exception:
+            logger.exception("Error refreshing %s index for %s", self.mode, collection.name)
+        finally:
+            self.refreshing = False
+
+    def _build(self, collection) -> None:
+        """Build a new index and swap it in; the caller holds the lock."""
+        # Invalidations from here on make it stale again
+        self.dirty = False
+        count = collection.count()
+        ids, batches, offset = [], [], 0
+        batch_size = settings.VECTOR_REBUILD_BATCH_SIZE
+        while True:
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            ids.extend(batch["ids"])
+            batches.append(np.asarray(batch["embeddings"], dtype=np.float32))
+            offset += len(batch["ids"])
+        index = QuantizedIndex(self.mode)
+        if ids:
+            index.build_batches(ids, batches)
+        self.index, self.collection_id, self.count = index, collection.id, count
+        self.checked_at = time.monotonic()
+        logger.info(
+            "Built %s index for %s: %d vectors, %d bytes",
+            self.mode, collection.name, len(ids), index.nbytes,
+        )
+
+
+_collection_indexes: Dict[str, _CollectionIndex] = {}
+
+
+def get_collection_index(collection, mode: str) -> QuantizedIndex:
+    key = f"{collection.name}:{mode}"
+    if key not in _collection_indexes:
+        _collection_indexes[key] = _CollectionIndex(mode)
+    return _collection_indexes[key].get(collection)
+
+
+def invalidate_quantized_index(store) -> None:
+    """Mark a store's quantized indexes stale after its vectors changed."""
+    name = store._collection.name
+    for key, entry in _collection_indexes.items():
+        if key.startswith(f"{name}:"):
+            entry.dirty = True
+
+
+class QuantizedRetriever(BaseRetriever):
+    """
+    Two-step retriever: coarse search over quantized codes, then exact
+    re-ranking of the top `k * rerank_factor` candidates with float vectors
+    fetched from Chroma.
+    """
+    store: Any
+    mode: str
+    k: int = 3
+    rerank_factor: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        collection = self.store._collection
+        index = get_collection_index(collection, self.mode)
+        if not len(index):
+            return []
+        query_vector = self.store.embeddings.embed_query(query)
+        return self._search(collection, index, np.asarray(query_vector, dtype=np.float32))
+
+    def search_by_vectors(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """Documents for each of several already embedded queries."""
+        collection = self.store._collection
+        index = get_collection_index(collection, self.mode)
+        if not len(index):
+            return [[] for _ in vectors]
+        return [self._search(collection, index, np.asarray(v, dtype=np.float32)) for v in vectors]
+
+    def _search(self, collection, index: QuantizedIndex, query_vector: np.ndarray) -> List[Document]:
+        positions = index.search(query_vector, self.k * self.rerank_factor)
+        candidate_ids = [index.ids[i] for i in positions]
+        found = collection.get(ids=candidate_ids, include=["embeddings", "documents", "metadatas"])
+        if not found["ids"]:
+            return []
+
+        space = ((collection.configuration_json or {}).get("hnsw") or {}).get("space", "l2")
+        order, distances = rerank(query_vector, np.asarray(found["embeddings"]), space)
+        relevance = self.store._select_relevance_score_fn()
+        docs = []
+        for i, distance in zip(order[:self.k], distances[:self.k]):
+            metadata = dict(found["metadatas"][i] or {})
+            metadata["relevance_score"] = round(float(relevance(float(distance))), 4)
+            docs.append(Document(page_content=found["documents"][i] or "", metadata=metadata, id=found["ids"][i]))
+        return docs
+
+
+class ScoredVectorRetriever(BaseRetriever):
+    """Plain similarity search that keeps the relevance score in metadata."""
+    store: Any
+    k: int = 3
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        docs = []
+        for doc, score in self.store.similarity_search_with_relevance_scores(query, k=self.k):
+            doc.metadata["relevance_score"] = round(float(score), 4)
+            docs.append(doc)
+        return docs
+
+    def search_by_vectors(self, vectors: List[List[float]]) -> List[List[Document]]:
+        """
+        Documents for each of several already embedded queries, from a single
+        Chroma query; scored like `similarity_search_with_relevance_scores`.
+        """
+        if not vectors:
+            return []
+        found = self.store._collection.query(
+            query_embeddings=vectors,
+            n_results=self.k,
+            include=["documents", "metadatas", "distances"],
+        )
+        relevance = self.store._select_relevance_score_fn()
+        results = []
+        for ids, texts, metadatas, distances in zip(
+                found["ids"], found["documents"], found["metadatas"], found["distances"]
+        ):
+            docs = []
+            for vector_id, text, metadata, distance in zip(ids, texts, metadatas, distances):
+                metadata = dict(metadata or {})
+                metadata["relevance_score"] = round(float(relevance(float(distance))), 4)
+                docs.append(Document(page_content=text or "", metadata=metadata, id=vector_id))
+            results.append(docs)
+        return results
+
+
+def build_base_retriever(store, k: int = 3):
+    """Retriever for a store honouring `EMBEDDING_QUANTIZATION`."""
+    mode = settings.EMBEDDING_QUANTIZATION.lower()
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"EMBEDDING_QUANTIZATION must be one of: {', '.join(QUANTIZATION_MODES)}")
+    if mode == "none":
+        return ScoredVectorRetriever(store=store, k=k)
+    return QuantizedRetriever(
+        store=store,
+        mode=mode,
+        k=k,
+        rerank_factor=settings.QUANTIZED_RERANK_FACTOR,
+    )
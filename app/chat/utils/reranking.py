@@ -0,0 +1,203 @@
+import logging
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.chat.utils.quantization import build_base_retriever
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# --------------------------------------------------------------------------- #
+# Token counting                                                              #
+# --------------------------------------------------------------------------- #
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        logger.warning("tiktoken encoding unavailable, estimating tokens from length")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+# --------------------------------------------------------------------------- #
+# Scorers                                                                     #
+# --------------------------------------------------------------------------- #
+class LexicalScorer:
+    """
+    Offline scorer: BM25 over the candidate set blended with the vector
+    search rank, so lexical matches break ties between similar embeddings.
+    """
+    name = "lexical"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, rank_weight: float = 0.3):
+        self.k1, self.b, self.rank_weight = k1, b, rank_weight
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        if not docs:
+            return []
+        terms = set(_TOKEN_RE.findall(query.lower()))
+        tokenized = [_TOKEN_RE.findall(doc.page_content.lower()) for doc in docs]
+        avg_len = sum(len(t) for t in tokenized) / len(tokenized) or 1.0
+        doc_freq = Counter(term for tokens in tokenized for term in set(tokens) & terms)
+
+        bm25 = []
+        for tokens in tokenized:
+            counts = Counter(tokens)
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term, 0)
+                if not tf:
+                    continue
+                idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                norm = tf + self.k1 * (1 - self.b + self.b * len(tokens) / avg_len)
+                score += idf * tf * (self.k1 + 1) / norm
+            bm25.append(score)
+
+        top = max(bm25) or 1.0
+        n = len(docs)
+        return [
+            (1 - self.rank_weight) * (s / top) + self.rank_weight * (1 - i / n)
+            for i, s in enumerate(bm25)
+        ]
+
+
+class CrossEncoderScorer:
+    """Local cross-encoder model (requires the optional sentence-transformers package)."""
+    name = "cross_encoder"
+
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise RuntimeError(
+                "RERANK_SCORER=cross_encoder requires the sentence-transformers package"
+            ) from e
+        self.model = CrossEncoder(model_name)
+
+    def score(self, query: str, docs: List[Document]) -> List[float]:
+        if not docs:
+            return []
+        scores = self.model.predict([(query, doc.page_content) for doc in docs])
+        return [float(s) for s in scores]
+
+
+SCORERS: Dict[str, Callable[[], Any]] = {
+    "lexical": LexicalScorer,
+    "cross_encoder": lambda: CrossEncoderScorer(settings.CROSS_ENCODER_MODEL),
+}
+
+
+def get_scorer(name: Optional[str] = None):
+    name = (name or settings.RERANK_SCORER).lower()
+    if name not in SCORERS:
+        raise ValueError(f"RERANK_SCORER must be one of: {', '.join(SCORERS)}")
+    return SCORERS[name]()
+
+
+# --------------------------------------------------------------------------- #
+# Adaptive selection                                                          #
+# --------------------------------------------------------------------------- #
+def select_documents(
+    docs: List[Document],
+    scores: List[float],
+    token_budget: int,
+    min_k: int = 1,
+    max_k: int = 3,
+    min_relative_score: float = 0.0,
+) -> List[Document]:
+    """
+    Keep the best-scored documents until the token budget or `max_k` is hit.
+    Documents scoring below `min_relative_score` of the best score are
+    dropped once `min_k` documents have been picked.
+    """
+    ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+    if not ranked:
+        return []
+    best = ranked[0][1]
+
+    selected, used = [], 0
+    for doc, score in ranked:
+        if len(selected) >= max_k:
+            break
+        tokens = count_tokens(doc.page_content)
+        if len(selected) >= min_k:
+            if used + tokens > token_budget:
+                break
+            if best > 0 and score < best * min_relative_score:
+                break
+        doc.metadata["rerank_score"] = round(float(score), 4)
+        selected.append(doc)
+        used += tokens
+    return selected
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Two-stage retrieval: a wide candidate fetch from the base retriever,
+    re-ranking with a pluggable scorer and an adaptive number of chunks
+    under a prompt-token budget.
+    """
+    base_retriever: BaseRetriever
+    scorer: Any
+    token_budget: int = 750
+    min_k: int = 1
+    max_k: int = 3
+    min_relative_score: float = 0.0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self._select(query, candidates)
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        """
+        Same documents as invoking once per query, but with one embeddings
+        request for all queries and the vector searches run together.
+        """
+        if not queries:
+            return []
+        vectors = self.base_retriever.store.embeddings.embed_documents(queries)
+        candidates = self.base_retriever.search_by_vectors(vectors)
+        return [self._select(query, docs) for query, docs in zip(queries, candidates)]
+
+    def _select(self, query: str, candidates: List[Document]) -> List[Document]:
+        scores = self.scorer.score(query, candidates)
+        return select_documents(
+            candidates,
+            scores,
+            token_budget=self.token_budget,
+            min_k=self.min_k,
+            max_k=self.max_k,
+            min_relative_score=self.min_relative_score,
+        )
+
+
+def build_retriever(store) -> RerankingRetriever:
+    """Two-stage retriever for a store, configured from settings."""
+    return RerankingRetriever(
+        base_retriever=build_base_retriever(store, k=settings.RETRIEVAL_FETCH_K),
+        scorer=get_scorer(),
+        token_budget=settings.PROMPT_TOKEN_BUDGET,
+        min_k=settings.RETRIEVAL_MIN_K,
+        max_k=settings.RETRIEVAL_MAX_K,
+        min_relative_score=settings.RERANK_MIN_RELATIVE_SCORE,
+    )
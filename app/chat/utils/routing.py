@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Dict, List, Optional
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+from langchain_community.callbacks import get_openai_callback
+from langchain_core.documents import Document
+
+from app.config import settings as app_settings
+from app.config.resilience import arun_stage, run_stage
+from app.config.settings import settings
+from app.monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+NO_ANSWER_TIER = "no_answer"
+# The chat models failed or were unavailable: the retrieved passages are returned alone
+RETRIEVAL_ONLY_TIER = "retrieval_only"
+
+# Wording that usually asks for reasoning over several facts
+_COMPLEX_MARKERS = re.compile(
+    r"\b(why|compare|comparison|difference|differences|versus|vs|explain|analy[sz]e|"
+    r"evaluate|pros|cons|trade-?offs?|step[- ]by[- ]step|summari[sz]e|implications?)\b",
+    re.IGNORECASE,
+)
+
+ROUTE_REQUESTS = REGISTRY.counter(
+    "chat_route_requests_total", "Chat requests by chat type and routing tier"
+)
+ROUTE_LATENCY = REGISTRY.histogram(
+    "chat_route_latency_seconds", "Answer latency by chat type and routing tier"
+)
+ROUTE_TOKENS = REGISTRY.counter(
+    "chat_route_tokens_total", "LLM tokens by chat type, routing tier and kind"
+)
+ROUTE_COST = REGISTRY.counter(
+    "chat_route_cost_usd_total", "Estimated LLM cost in USD by chat type and routing tier"
+)
+
+
+FAILURE_REPLY = "Sorry, something went wrong while answering your question."
+
+
+def failure_result(error: Exception) -> Dict:
+    """Result of a question that could not be answered."""
+    return {"result": FAILURE_REPLY, "source_documents": [], "failed": True, "error": str(error)}
+
+
+def degraded_result(docs: List[Document], error: Exception) -> Dict:
+    """Retrieval-only result of a question whose LLM call failed or was not attempted."""
+    return {"result": settings.DEGRADED_REPLY, "source_documents": docs, "degraded": True, "error": str(error)}
+
+
+def is_complex_query(question: str) -> bool:
+    words = question.split()
+    return (
+        len(words) > settings.ROUTING_COMPLEX_QUERY_WORDS
+        or question.count("?") > 1
+        or bool(_COMPLEX_MARKERS.search(question))
+    )
+
+
+def retrieval_confidence(docs: List[Document]) -> Optional[float]:
+    scores = [doc.metadata["relevance_score"] for doc in docs if "relevance_score" in doc.metadata]
+    return max(scores) if scores else None
+
+
+def choose_tier(question: str, docs: List[Document], default_tier: str) -> str:
+    """
+    Pick the tier for a question from its wording and the best retrieval
+    relevance score.
+    """
+    confidence = retrieval_confidence(docs)
+    if not docs or (confidence is not None and confidence < settings.ROUTING_NO_ANSWER_THRESHOLD):
+        return NO_ANSWER_TIER
+    if not settings.ROUTING_ENABLED:
+        return default_tier
+    if is_complex_query(question):
+        return STRONG_TIER
+    if confidence is not None and confidence < settings.ROUTING_STRONG_CONFIDENCE_THRESHOLD:
+        return STRONG_TIER
+    return FAST_TIER
+
+
+def _stuff_chain(llm):
+    """Same "stuff" prompt RetrievalQA used, over pre-retrieved documents."""
+    return create_stuff_documents_chain(llm, PROMPT_SELECTOR.get_prompt(llm))
+
+
+class ModelRouter:
+    """
+    Retrieve once, then answer with the tier the query needs. Weakly
+    supported queries get a canned reply without any LLM call.
+    """
+
+    def __init__(self, name: str, retriever, default_tier: str):
+        self.name = name
+        self.retriever = retriever
+        self.default_tier = default_tier
+        self.chains = {
+            FAST_TIER: _stuff_chain(app_settings.fast_chat_model),
+            STRONG_TIER: _stuff_chain(app_settings.strong_chat_model),
+        }
+
+    def invoke(self, question: str) -> Dict:
+        started = time.perf_counter()
+        docs = self.retriever.invoke(question)
+        return self.answer(question, docs, started)
+
+    async def ainvoke(self, question: str) -> Dict:
+        """
+        `invoke` for the event loop: retrieval runs in a worker thread and
+        each stage is bounded by its timeout and the request deadline.
+        """
+        started = time.perf_counter()
+        docs = await run_stage("retrieval", settings.RETRIEVAL_TIMEOUT_SECONDS, self.retriever.invoke, question)
+        return await self.aanswer(question, docs, started)
+
+    def answer(self, question: str, docs: List[Document], started: Optional[float] = None) -> Dict:
+        """Answer `question` from already retrieved `docs`."""
+        started = started or time.perf_counter()
+        tier = choose_tier(question, docs, self.default_tier)
+
+        if tier == NO_ANSWER_TIER:
+            result = {"result": settings.NO_RELEVANT_DOCUMENTS_REPLY, "source_documents": []}
+        else:
+            try:
+                with get_openai_callback() as usage, app_settings.chat_breaker.guard():
+                    answer = self.chains[tier].invoke({"context": docs, "question": question})
+            except Exception as e:
+                return self._degrade(question, docs, e, started)
+            result = {"result": answer, "source_documents": docs, "tokens": usage.total_tokens}
+            self._record_usage(tier, usage)
+        return self._finish(result, tier, started)
+
+    async def aanswer(self, question: str, docs: List[Document], started: Optional[float] = None) -> Dict:
+        """Async `answer`, for answering many questions on the event loop."""
+        started = started or time.perf_counter()
+        tier = choose_tier(question, docs, self.default_tier)
+
+        if tier == NO_ANSWER_TIER:
+            result = {"result": settings.NO_RELEVANT_DOCUMENTS_REPLY, "source_documents": []}
+        else:
+            # Each task has its own context, so concurrent answers count their own usage
+            try:
+                with get_openai_callback() as usage:
+                    answer = await arun_stage(
+                        "llm",
+                        settings.LLM_TIMEOUT_SECONDS,
+                        app_settings.chat_breaker.acall(
+                            self.chains[tier].ainvoke({"context": docs, "question": question})
+                        ),
+                    )
+            except Exception as e:
+                return self._degrade(question, docs, e, started)
+            result = {"result": answer, "source_documents": docs, "tokens": usage.total_tokens}
+            self._record_usage(tier, usage)
+        return self._finish(result, tier, started)
+
+    async def abatch(self, questions: List[str], concurrency: int) -> List[Dict]:
+        """
+        Answer many questions: one embeddings request and one vector search
+        pass for all of them, then at most `concurrency` LLM calls at a time.
+        Results are in the order of `questions`; a question whose LLM call
+        failed gets its passages with DEGRADED_REPLY and `error` set.
+        """
+        started = time.perf_counter()
+        # Repeated questions are embedded and searched once
+        unique = list(dict.fromkeys(questions))
+        retrieved = await run_stage("retrieval", settings.RETRIEVAL_TIMEOUT_SECONDS, self.retriever.retrieve_many, unique)
+        docs_by_question = dict(zip(unique, retrieved))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(question: str) -> Dict:
+            async with semaphore:
+                try:
+                    return await self.aanswer(question, docs_by_question[question], started)
+                except Exception as e:
+                    logger.exception(f"Error in {self.name} batch chat for question: {question}")
+                    return failure_result(e)
+
+        return await asyncio.gather(*(answer(question) for question in questions))
+
+    def _degrade(self, question: str, docs: List[Document], error: Exception, started: float) -> Dict:
+        logger.warning(f"{self.name} chat answered from retrieval only ({type(error).__name__}: {error}): {question}")
+        return self._finish(degraded_result(docs, error), RETRIEVAL_ONLY_TIER, started)
+
+    def _record_usage(self, tier: str, usage) -> None:
+        ROUTE_TOKENS.inc(usage.prompt_tokens, chat=self.name, tier=tier, kind="prompt")
+        ROUTE_TOKENS.inc(usage.completion_tokens, chat=self.name, tier=tier, kind="completion")
+        ROUTE_COST.inc(usage.total_cost, chat=self.name, tier=tier)
+
+    def _finish(self, result: Dict, tier: str, started: float) -> Dict:
+        ROUTE_REQUESTS.inc(chat=self.name, tier=tier)
+        ROUTE_LATENCY.observe(time.perf_counter() - started, chat=self.name, tier=tier)
+        result["tier"] = tier
+        return result
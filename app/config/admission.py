@@ -0,0 +1,360 @@
+"""
+Admission control: fair sharing of chat and ingestion capacity between callers.
+
+Each pool (chat, ingestion) admits at most `capacity` requests at a time,
+and at most `per_client` of them from one client. A client is a user, or
+the client IP for anonymous public chat. Requests over those limits wait in
+a per-client queue; when a slot frees up, the next request comes from the
+waiting client with the least weighted service so far (start-time fair
+queuing). A client flooding the pool thus only queues behind itself, and
+clients with a higher weight get a larger share while the pool is busy.
+
+Clients also have a token quota, a bucket refilled at `tokens_per_minute`
+and charged with the tokens a request actually used once it is done. A
+client over its quota, or whose queue is full, is refused at once with
+`AdmissionRejected`; routes answer 429 with a Retry-After estimate.
+
+Limits are per worker process.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.config.settings import settings
+from app.monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ADMITTED = REGISTRY.counter("admission_admitted_total", "Requests admitted, by pool")
+ADMISSION_REJECTED = REGISTRY.counter(
+    "admission_rejected_total", "Requests refused with 429, by pool and reason (quota, client_queue_full, "
+                                "queue_full, queue_timeout)"
+)
+ADMISSION_ACTIVE = REGISTRY.gauge("admission_active", "Requests holding a slot, by pool")
+ADMISSION_QUEUED = REGISTRY.gauge("admission_queued", "Requests waiting for a slot, by pool")
+ADMISSION_WAIT = REGISTRY.histogram("admission_queue_wait_seconds", "Time from arrival to admission, by pool")
+ADMISSION_TOKENS = REGISTRY.counter("admission_tokens_charged_total", "Tokens charged to client quotas, by pool")
+
+# Idle clients are forgotten once their bucket is full again; checked every this many tickets
+_PRUNE_EVERY = 1000
+
+# Whether the warning about an untrusted X-Forwarded-For was logged
+_proxy_warned = False
+
+
+class AdmissionRejected(Exception):
+    """A request was refused; `retry_after` is the suggested wait in seconds."""
+
+    def __init__(self, pool: str, reason: str, retry_after: float):
+        super().__init__(f"{pool} admission refused ({reason})")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass(eq=False)
+class _Client:
+    key: str
+    weight: float
+    tokens: float
+    refilled_at: float
+    active: int = 0
+    # Service received so far, in cost / weight; the next slot goes to the lowest
+    virtual: float = 0.0
+    waiters: Deque["Ticket"] = field(default_factory=deque)
+
+
+class Ticket:
+    """A request's place in a pool: queued when created, then admitted, then released."""
+
+    def __init__(self, pool: "AdmissionPool", client: _Client, cost: float):
+        self.pool = pool
+        self.client = client
+        self.cost = cost
+        self.created_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait for a slot; AdmissionRejected when `timeout` seconds pass first."""
+        try:
+            await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            self.pool._abandon(self)
+            raise self.pool._reject("queue_timeout", self.pool._retry_after()) from None
+        except asyncio.CancelledError:
+            self.pool._abandon(self)
+            raise
+
+    def charge(self, tokens: int) -> None:
+        """Take the tokens the request used from its client's quota."""
+        self.pool.charge(self.client, tokens)
+
+    def release(self) -> None:
+        """Give the slot back (or leave the queue); safe to call more than once."""
+        self.pool._abandon(self)
+
+
+class AdmissionPool:
+    """Fair-queued slots and per-client token quotas for one kind of work."""
+
+    def __init__(
+            self,
+            name: str,
+            capacity: int,
+            per_client: int,
+            max_queued_per_client: int,
+            max_queued: int,
+            queue_timeout: Optional[float],
+            tokens_per_minute: float = 0,
+            enabled: bool = True,
+    ):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.per_client = max(1, per_client)
+        self.max_queued_per_client = max_queued_per_client
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout or None
+        # 0 disables quotas; a client may spend one minute's worth at once
+        self.tokens_per_minute = tokens_per_minute
+        self.enabled = enabled
+        self.active = 0
+        self.queued = 0
+        self._clients: Dict[str, _Client] = {}
+        self._backlogged: Set[_Client] = set()
+        # Virtual time of the pool: the start tag of the latest admitted request
+        self._virtual = 0.0
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 1.0
+        self._tickets = 0
+        ADMISSION_ACTIVE.set(0, pool=name)
+        ADMISSION_QUEUED.set(0, pool=name)
+
+    # ---- clients -------------------------------------------------------- #
+    def _client(self, key: str, weight: float, now: float) -> _Client:
+        client = self._clients.get(key)
+        if client is None:
+            client = _Client(key, weight, float(self.tokens_per_minute), now)
+            self._clients[key] = client
+        client.weight = weight
+        self._refill(client, now)
+        return client
+
+    def _refill(self, client: _Client, now: float) -> None:
+        if self.tokens_per_minute:
+            rate = self.tokens_per_minute / 60
+            client.tokens = min(float(self.tokens_per_minute), client.tokens + (now - client.refilled_at) * rate)
+        client.refilled_at = now
+
+    def _prune(self, now: float) -> None:
+        for key, client in list(self._clients.items()):
+            if client.active or client.waiters:
+                continue
+            self._refill(client, now)
+            if client.tokens >= self.tokens_per_minute:
+                del self._clients[key]
+
+    # ---- admission ------------------------------------------------------ #
+    def ticket(self, key: str, weight: float = 1.0, cost: float = 1.0) -> Ticket:
+        """
+        Queue a request of `key`, or raise AdmissionRejected when the client
+        is over its quota or queue limit. The ticket is admitted right away
+        when a slot is free; `cost` is the request's share of service
+        (e.g. the questions of a batch).
+        """
+        now = time.monotonic()
+        self._tickets += 1
+        if self._tickets % _PRUNE_EVERY == 0:
+            self._prune(now)
+        client = self._client(key, weight, now)
+
+        if self.enabled:
+            if self.tokens_per_minute and client.tokens <= 0:
+                raise self._reject("quota", -client.tokens / (self.tokens_per_minute / 60) + 1)
+            if client.active >= self.per_client and len(client.waiters) >= self.max_queued_per_client:
+                raise self._reject("client_queue_full", self._retry_after(len(client.waiters) + 1))
+            if self.active >= self.capacity and self.queued >= self.max_queued:
+                raise self._reject("queue_full", self._retry_after())
+
+        ticket = Ticket(self, client, max(cost, 1e-6))
+        if not client.waiters:
+            # Back from idle: no credit for the time it sent nothing
+            client.virtual = max(client.virtual, self._virtual)
+            self._backlogged.add(client)
+        client.waiters.append(ticket)
+        self.queued += 1
+        self._dispatch()
+        ADMISSION_QUEUED.set(self.queued, pool=self.name)
+        return ticket
+
+    @asynccontextmanager
+    async def admit(self, key: str, weight: float = 1.0, cost: float = 1.0) -> AsyncIterator[Ticket]:
+        """Hold a slot for the block, waiting at most `queue_timeout` for it."""
+        ticket = self.ticket(key, weight, cost)
+        try:
+            await ticket.wait(self.queue_timeout)
+            yield ticket
+        finally:
+            ticket.release()
+
+    def charge(self, client: _Client, tokens: int) -> None:
+        if tokens <= 0:
+            return
+        ADMISSION_TOKENS.inc(tokens, pool=self.name)
+        if self.tokens_per_minute:
+            self._refill(client, time.monotonic())
+            # The bucket may go negative: usage is only known afterwards
+            client.tokens -= tokens
+
+    def _dispatch(self) -> None:
+        while self._backlogged and (not self.enabled or self.active < self.capacity):
+            eligible = [c for c in self._backlogged if not self.enabled or c.active < self.per_client]
+            if not eligible:
+                return
+            client = min(eligible, key=lambda c: c.virtual)
+            ticket = client.waiters.popleft()
+            self.queued -= 1
+            if not client.waiters:
+                self._backlogged.discard(client)
+            if ticket._future.done():
+                # Cancelled while waiting, not yet removed by its waiter
+                continue
+
+            now = time.monotonic()
+            ticket.admitted_at = now
+            client.active += 1
+            self.active += 1
+            self._virtual = client.virtual
+            client.virtual += ticket.cost / client.weight
+            ticket._future.set_result(None)
+            ADMISSION_ADMITTED.inc(pool=self.name)
+            ADMISSION_WAIT.observe(now - ticket.created_at, pool=self.name)
+        ADMISSION_ACTIVE.set(self.active, pool=self.name)
+        ADMISSION_QUEUED.set(self.queued, pool=self.name)
+
+    def _abandon(self, ticket: Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        client = ticket.client
+        if ticket.admitted:
+            client.active -= 1
+            self.active -= 1
+            held = time.monotonic() - ticket.admitted_at
+            self._hold_seconds += 0.2 * (held - self._hold_seconds)
+        else:
+            try:
+                client.waiters.remove(ticket)
+                self.queued -= 1
+            except ValueError:
+                pass
+            if not client.waiters:
+                self._backlogged.discard(client)
+        self._dispatch()
+
+    # ---- rejection ------------------------------------------------------ #
+    def _retry_after(self, ahead: int = 1) -> float:
+        """Rough wait until `ahead` more slots have been freed."""
+        return self._hold_seconds * math.ceil(ahead / self.per_client)
+
+    def _reject(self, reason: str, retry_after: float) -> AdmissionRejected:
+        ADMISSION_REJECTED.inc(pool=self.name, reason=reason)
+        return AdmissionRejected(self.name, reason, retry_after)
+
+    def as_dict(self) -> Dict:
+        return {
+            "pool": self.name,
+            "active": self.active,
+            "queued": self.queued,
+            "clients": len(self._clients),
+            "capacity": self.capacity,
+        }
+
+
+# --------------------------------------------------------------------------- #
+# Request glue                                                                #
+# --------------------------------------------------------------------------- #
+chat_admission = AdmissionPool(
+    "chat",
+    capacity=settings.CHAT_MAX_CONCURRENT,
+    per_client=settings.CHAT_MAX_CONCURRENT_PER_CLIENT,
+    max_queued_per_client=settings.CHAT_MAX_QUEUED_PER_CLIENT,
+    max_queued=settings.CHAT_MAX_QUEUED,
+    queue_timeout=settings.CHAT_QUEUE_TIMEOUT_SECONDS,
+    tokens_per_minute=settings.CHAT_TOKENS_PER_MINUTE_PER_CLIENT,
+    enabled=settings.ADMISSION_ENABLED,
+)
+ingestion_admission = AdmissionPool(
+    "ingestion",
+    capacity=settings.INGESTION_MAX_CONCURRENT,
+    per_client=settings.INGESTION_MAX_CONCURRENT_PER_CLIENT,
+    max_queued_per_client=settings.INGESTION_MAX_QUEUED_PER_CLIENT,
+    max_queued=settings.INGESTION_MAX_QUEUED,
+    # Queued processing waits in the background until its turn
+    queue_timeout=None,
+    tokens_per_minute=settings.INGESTION_TOKENS_PER_MINUTE_PER_CLIENT,
+    enabled=settings.ADMISSION_ENABLED,
+)
+
+
+def user_client(user) -> Tuple[str, float]:
+    """Admission key and weight of an authenticated user."""
+    return f"user:{user.id}", settings.ADMISSION_USER_WEIGHT
+
+
+async def request_client(request: Request) -> Tuple[str, float]:
+    """
+    Admission key and weight of a request to a public endpoint: its user
+    when it carries a valid bearer token, otherwise its client IP.
+    """
+    from app.accounts.services.auth import verify_token_async
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        token_data = await verify_token_async(token)
+        if token_data and token_data.user_id is not None:
+            return f"user:{token_data.user_id}", settings.ADMISSION_USER_WEIGHT
+
+    ip = request.client.host if request.client else "unknown"
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    hops = settings.ADMISSION_TRUSTED_PROXY_HOPS
+    if hops and forwarded:
+        # Only the rightmost `hops` entries were appended by our proxies
+        ip = forwarded[-min(hops, len(forwarded))]
+    elif forwarded and ip not in forwarded:
+        # Behind a proxy the server does not trust (FORWARDED_ALLOW_IPS), the
+        # client address is the proxy's: every anonymous visitor shares one client
+        _warn_untrusted_proxy(ip)
+    return f"ip:{ip}", settings.ADMISSION_ANONYMOUS_WEIGHT
+
+
+def _warn_untrusted_proxy(ip: str) -> None:
+    global _proxy_warned
+    if not _proxy_warned:
+        _proxy_warned = True
+        logger.warning(
+            f"Requests from {ip} carry X-Forwarded-For but {ip} is not a trusted proxy, so anonymous "
+            f"chat is shared as one admission client; add it to FORWARDED_ALLOW_IPS "
+            f"or set ADMISSION_TRUSTED_PROXY_HOPS"
+        )
+
+
+def too_many_requests(error: AdmissionRejected) -> HTTPException:
+    detail = "Token quota exceeded" if error.reason == "quota" else "Too many requests, try again later"
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
@@ -0,0 +1,194 @@
+"""
+Embeddings backends selected by EMBEDDING_BACKEND.
+
+"openai" calls the embeddings API. "onnx" runs a sentence-embedding model
+(all-MiniLM-L6-v2 by default, the one chromadb ships) on the CPU with
+onnxruntime and tokenizers, both already installed with chromadb.
+
+The ONNX session is created on first use rather than at import, so the
+gunicorn master never forks a live onnxruntime thread pool into its workers.
+Inference runs one batch at a time per process: each batch gets the whole
+EMBEDDING_ONNX_THREADS budget, and concurrent requests queue instead of
+oversubscribing the CPU.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Model chromadb downloads for its default embedding function
+DEFAULT_ONNX_MODEL = "all-MiniLM-L6-v2"
+
+
+def _default_model_dir(model_name: str) -> str:
+    """chromadb's download location, fetching its default model if missing."""
+    path = Path.home() / ".cache" / "chroma" / "onnx_models" / model_name / "onnx"
+    if model_name == DEFAULT_ONNX_MODEL and not (path / "model.onnx").exists():
+        from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+        logger.info(f"Downloading ONNX embedding model {model_name}")
+        ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+    return str(path)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Mean-pooled, L2-normalized sentence embeddings from a local ONNX model.
+
+    `model_dir` holds `model.onnx` and the Hugging Face `tokenizer.json`.
+    Texts are sorted by length before batching so each batch is padded only
+    to its own longest text.
+    """
+
+    def __init__(
+            self,
+            model_name: str = DEFAULT_ONNX_MODEL,
+            model_dir: Optional[str] = None,
+            threads: int = 4,
+            batch_size: int = 32,
+            max_length: int = 256,
+    ):
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    def _load(self) -> None:
+        with self._load_lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            model_dir = self.model_dir or _default_model_dir(self.model_name)
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.max_length)
+            tokenizer.no_padding()
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.log_severity_level = 3
+            session = onnxruntime.InferenceSession(
+                os.path.join(model_dir, "model.onnx"),
+                sess_options=options,
+                providers=["CPUExecutionProvider"],
+            )
+            self._input_names = [i.name for i in session.get_inputs()]
+            self._tokenizer = tokenizer
+            self._session = session
+            logger.info(f"Loaded ONNX embedding model {self.model_name} ({self.threads} threads)")
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        width = max(len(e.ids) for e in encoded)
+        input_ids = np.zeros((len(encoded), width), dtype=np.int64)
+        attention_mask = np.zeros((len(encoded), width), dtype=np.int64)
+        for row, e in enumerate(encoded):
+            input_ids[row, :len(e.ids)] = e.ids
+            attention_mask[row, :len(e.ids)] = 1
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        feeds = {name: value for name, value in feeds.items() if name in self._input_names}
+
+        with self._run_lock:
+            output = self._session.run(None, feeds)[0]
+        if output.ndim == 3:
+            # Token embeddings: mean over the real (unpadded) tokens
+            mask = attention_mask[:, :, None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self._session is None:
+            self._load()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            positions = order[start:start + self.batch_size]
+            batch = self._embed_batch([texts[i] for i in positions])
+            if not vectors.shape[1]:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[positions] = batch
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _openai_backend(settings) -> Embeddings:
+    return OpenAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        dimensions=settings.EMBEDDING_DIMENSIONS,
+        openai_api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        timeout=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+    )
+
+
+def _onnx_backend(settings) -> Embeddings:
+    return OnnxEmbeddings(
+        model_name=settings.EMBEDDING_ONNX_MODEL,
+        model_dir=settings.EMBEDDING_ONNX_MODEL_DIR,
+        threads=settings.EMBEDDING_ONNX_THREADS,
+        batch_size=settings.EMBEDDING_ONNX_BATCH_SIZE,
+        max_length=settings.EMBEDDING_ONNX_MAX_LENGTH,
+    )
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[..., Embeddings]] = {
+    "openai": _openai_backend,
+    "onnx": _onnx_backend,
+}
+
+
+def build_embedding_model(settings, backend: Optional[str] = None) -> Embeddings:
+    """Embeddings for `backend`, EMBEDDING_BACKEND by default, configured from `settings`."""
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND must be one of: {', '.join(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[backend](settings)
+
+
+def profile_settings(settings, profile: str):
+    """
+    A copy of `settings` whose embedding fields describe `profile`, the
+    inverse of Settings.EMBEDDING_PROFILE, e.g. to embed queries for a
+    collection built before the settings changed.
+    """
+    if profile.startswith("onnx:") and profile.endswith(":native"):
+        model = profile[len("onnx:"):-len(":native")]
+        update = {"EMBEDDING_BACKEND": "onnx", "EMBEDDING_ONNX_MODEL": model}
+        if model != settings.EMBEDDING_ONNX_MODEL:
+            # The configured model directory belongs to the configured model
+            update["EMBEDDING_ONNX_MODEL_DIR"] = None
+    else:
+        model, _, dimensions = profile.rpartition(":")
+        if not model or not (dimensions == "native" or dimensions.isdigit()):
+            raise ValueError(f"Unknown embedding profile '{profile}'")
+        update = {
+            "EMBEDDING_BACKEND": "openai",
+            "EMBEDDING_MODEL": model,
+            "EMBEDDING_DIMENSIONS": None if dimensions == "native" else int(dimensions),
+        }
+    return settings.model_copy(update=update)
@@ -0,0 +1,163 @@
+"""
+Conditional GETs for read endpoints.
+
+Each cacheable resource ("files", "users") has a version counter in the
+`resource_versions` table that writers bump in the same transaction as
+their change. Read endpoints look up that one row, answer If-None-Match /
+If-Modified-Since with a bodyless 304 when nothing changed, and otherwise
+serve the rendered body from an in-process cache keyed by user and version
+before falling back to the database. The counter lives in the database so
+every gunicorn worker sees the bumps of the others.
+"""
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import Column, DateTime, Integer, String, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.database import Base, engine
+from app.config.responses import prebuilt_response
+from app.config.settings import settings
+
+FILES = "files"
+USERS = "users"
+
+
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+async def bump_version(db: AsyncSession, name: str) -> None:
+    """Mark `name` as changed; committed together with the caller's change."""
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    table = ResourceVersion.__table__
+    stmt = dialect.insert(table).values(name=name, version=1, updated_at=datetime.now(timezone.utc))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    await db.execute(stmt)
+
+
+async def get_version(db: AsyncSession, name: str) -> Tuple[int, Optional[datetime]]:
+    """(version, last change) of `name`; (0, None) if it never changed."""
+    stmt = select(ResourceVersion.version, ResourceVersion.updated_at).where(ResourceVersion.name == name)
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        return 0, None
+    return row.version, _as_utc(row.updated_at)
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Weak comparison of `etag` against an If-None-Match header."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def http_last_modified(updated_at: Optional[datetime], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Last-Modified for a change at `updated_at`: HTTP dates have whole
+    seconds, so it is rounded up to the next one. Until that second is over
+    another change could still fall into it, so there is none before.
+    """
+    if updated_at is None:
+        return None
+    rounded = updated_at.replace(microsecond=0)
+    if updated_at.microsecond:
+        rounded += timedelta(seconds=1)
+    return rounded if rounded <= (now or datetime.now(timezone.utc)) else None
+
+
+def _not_modified_since(last_modified: Optional[datetime], if_modified_since: Optional[str]) -> bool:
+    if last_modified is None or not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return last_modified <= _as_utc(since)
+
+
+class ResponseCache:
+    """LRU of rendered response bodies keyed by (key, version)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+
+    def get(self, key: str, version: int) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, version: int, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        # One entry per key: a newer version replaces the stale body
+        self._entries[key] = (version, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE)
+
+
+async def conditional_response(
+        request: Request,
+        db: AsyncSession,
+        resource: str,
+        key: str,
+        build: Callable[[], Awaitable[Any]],
+) -> Response:
+    """
+    Response for a read of `resource` whose payload depends only on the
+    resource's version and on `key` (e.g. the requesting user).
+
+    `build` is awaited only when neither the client nor the response cache
+    holds the current version; it returns the already-shaped payload.
+    """
+    # Read the version before the data: a concurrent change then at worst
+    # serves newer data under the older version, never the reverse
+    version, updated_at = await get_version(db, resource)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    etag = f'W/"{resource}-{version}-{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    last_modified = http_last_modified(updated_at)
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(etag, if_none_match) or (
+        if_none_match is None and _not_modified_since(last_modified, request.headers.get("if-modified-since"))
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache_key = f"{resource}:{key}"
+    body = response_cache.get(cache_key, version)
+    if body is None:
+        body = prebuilt_response(await build()).body
+        response_cache.put(cache_key, version, body)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,325 @@
+"""
+Deadlines, stage timeouts and circuit breakers for upstream calls.
+
+A route opens a `deadline` for the request; every stage (retrieval, LLM)
+then runs with `run_stage`/`arun_stage` under the smaller of its own timeout
+and what is left of the deadline. The deadline lives in a context variable,
+so it follows the request into stage worker threads.
+
+Blocking stages run on a bounded thread pool of their own (STAGE_MAX_THREADS),
+not the default executor: a thread whose stage timed out keeps running until
+the upstream client's timeout, and such threads must never hold up the
+Chroma, parsing and database work done with `asyncio.to_thread`.
+
+Each upstream (the embeddings API, the chat models) has a `CircuitBreaker`.
+Once the failure rate over the last CIRCUIT_BREAKER_WINDOW_SECONDS reaches
+CIRCUIT_BREAKER_FAILURE_RATE the breaker opens and calls fail immediately
+with `CircuitOpenError` for CIRCUIT_BREAKER_OPEN_SECONDS; then one probe
+call is let through, and its outcome closes or re-opens the breaker.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from app.monitoring.metrics import REGISTRY
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = REGISTRY.gauge(
+    "circuit_breaker_state", "Circuit breaker state by upstream: 0 closed, 1 half-open, 2 open"
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by upstream and new state"
+)
+BREAKER_REJECTED = REGISTRY.counter(
+    "circuit_breaker_rejected_total", "Calls failed fast by an open circuit breaker, by upstream"
+)
+STAGE_TIMEOUTS = REGISTRY.counter(
+    "request_stage_timeouts_total", "Request stages cut off by their timeout or the request deadline, by stage"
+)
+STAGE_THREADS_BUSY = REGISTRY.gauge(
+    "request_stage_threads_busy", "Stage worker threads running, including ones whose stage timed out"
+)
+
+
+class DeadlineExceeded(Exception):
+    """A stage ran out of time, its own or the request's."""
+
+
+class CircuitOpenError(Exception):
+    """The upstream's circuit breaker is open; the call was not made."""
+
+
+# --------------------------------------------------------------------------- #
+# Deadlines                                                                   #
+# --------------------------------------------------------------------------- #
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound everything run in this context to `seconds` from now (None or 0: no bound)."""
+    if not seconds:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the request deadline, None without one."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def stage_timeout(stage: str, timeout: Optional[float]) -> Optional[float]:
+    """The smaller of a stage's own timeout and the time left; raises if none is left."""
+    left = remaining()
+    if left is not None and left <= 0:
+        STAGE_TIMEOUTS.inc(stage=stage)
+        raise DeadlineExceeded(f"No time left for {stage}")
+    if left is None:
+        return timeout or None
+    return min(timeout, left) if timeout else left
+
+
+async def arun_stage(stage: str, timeout: Optional[float], awaitable: Awaitable) -> Any:
+    """Await `awaitable`, cancelling it when the stage runs out of time."""
+    try:
+        limit = stage_timeout(stage, timeout)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        elif asyncio.isfuture(awaitable):
+            awaitable.cancel()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        STAGE_TIMEOUTS.inc(stage=stage)
+        raise DeadlineExceeded(f"{stage} took longer than {limit:.2f}s") from None
+
+
+_stage_executor: Optional[ThreadPoolExecutor] = None
+_stage_busy = 0
+_stage_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _stage_executor
+    if _stage_executor is None:
+        from app.config.settings import settings
+
+        with _stage_lock:
+            if _stage_executor is None:
+                _stage_executor = ThreadPoolExecutor(
+                    max_workers=settings.STAGE_MAX_THREADS, thread_name_prefix="stage",
+                )
+    return _stage_executor
+
+
+def _counted(func: Callable, *args, **kwargs) -> Any:
+    global _stage_busy
+    with _stage_lock:
+        _stage_busy += 1
+        STAGE_THREADS_BUSY.set(_stage_busy)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with _stage_lock:
+            _stage_busy -= 1
+            STAGE_THREADS_BUSY.set(_stage_busy)
+
+
+async def run_stage(stage: str, timeout: Optional[float], func: Callable, *args, **kwargs) -> Any:
+    """
+    Run blocking `func` on the stage thread pool for at most the stage's time.
+    The thread cannot be interrupted and finishes in the background, bounded
+    by the client's own timeout; the request stops waiting for it. While
+    such threads fill the pool, new stages wait for a thread within their
+    own time, and time out instead of queueing behind them.
+    """
+    call = functools.partial(contextvars.copy_context().run, _counted, func, *args, **kwargs)
+    future = asyncio.get_running_loop().run_in_executor(_executor(), call)
+    return await arun_stage(stage, timeout, future)
+
+
+# --------------------------------------------------------------------------- #
+# Circuit breakers                                                            #
+# --------------------------------------------------------------------------- #
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one upstream; safe to share between threads."""
+
+    def __init__(
+            self,
+            name: str,
+            failure_rate: float = 0.5,
+            min_calls: int = 10,
+            window_seconds: float = 30.0,
+            open_seconds: float = 15.0,
+            enabled: bool = True,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.enabled = enabled
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(_STATE_VALUES[CLOSED], upstream=name)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], upstream=self.name)
+        BREAKER_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    BREAKER_REJECTED.inc(upstream=self.name)
+                    raise CircuitOpenError(f"{self.name} circuit breaker is open")
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # One probe at a time decides whether the upstream is back
+                if self._probing:
+                    BREAKER_REJECTED.inc(upstream=self.name)
+                    raise CircuitOpenError(f"{self.name} circuit breaker is half-open")
+                self._probing = True
+
+    def record(self, success: bool) -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._calls.clear()
+                if success:
+                    self._set_state(CLOSED)
+                else:
+                    self._opened_at = now
+                    self._set_state(OPEN)
+                return
+            self._calls.append((now, success))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if (
+                    self.state == CLOSED
+                    and len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.failure_rate
+            ):
+                self._opened_at = now
+                self._set_state(OPEN)
+
+    def allows_calls(self) -> bool:
+        """Whether a call would currently be attempted, without taking the probe."""
+        if not self.enabled or self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self._opened_at >= self.open_seconds
+            return not self._probing
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self._probing = False
+            self._set_state(CLOSED)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Fail fast while open, and count the outcome of the guarded call."""
+        self.before_call()
+        try:
+            yield
+        except BaseException:
+            # Includes the cancellation of a call cut off by its stage timeout
+            self.record(False)
+            raise
+        self.record(True)
+
+    async def acall(self, awaitable: Awaitable) -> Any:
+        try:
+            self.before_call()
+        except CircuitOpenError:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            result = await awaitable
+        except BaseException:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = len(self._calls)
+            failures = sum(1 for _, ok in self._calls if not ok)
+        return {"upstream": self.name, "state": self.state, "calls": calls, "failures": failures}
+
+
+class GuardedEmbeddings(Embeddings):
+    """Embeddings whose calls go through a circuit breaker."""
+
+    def __init__(self, embeddings: Embeddings, breaker: CircuitBreaker):
+        self.embeddings = embeddings
+        self.breaker = breaker
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.breaker.guard():
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.breaker.guard():
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.breaker.acall(self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.breaker.acall(self.embeddings.aembed_query(text))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.embeddings, name)
+
+
+def build_breaker(name: str, settings) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+        min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+        window_seconds=settings.CIRCUIT_BREAKER_WINDOW_SECONDS,
+        open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+        enabled=settings.CIRCUIT_BREAKER_ENABLED,
+    )
@@ -0,0 +1,22 @@
+from typing import Any, Mapping, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from app.config.settings import settings
+
+# Default response class for the app, see ORJSON_RESPONSES
+DefaultJSONResponse = ORJSONResponse if settings.ORJSON_RESPONSES else JSONResponse
+
+
+def prebuilt_response(content: Any, status_code: int = 200, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """
+    Return an already-shaped payload as-is.
+
+    FastAPI skips `response_model` validation and serialization for Response
+    objects, so hot endpoints build plain dicts that match their schema and
+    hand them straight to the encoder.
+    """
+    if settings.ORJSON_RESPONSES:
+        return ORJSONResponse(content, status_code=status_code, headers=headers)
+    return JSONResponse(jsonable_encoder(content), status_code=status_code, headers=headers)
@@ -0,0 +1,17 @@
+"""
+Gunicorn worker class for the production server profile.
+
+Kept free of application imports so the gunicorn master can load it without
+opening database, Chroma or OpenAI clients before forking.
+"""
+from uvicorn.workers import UvicornWorker
+
+
+class ProductionUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "proxy_headers": True,
+        "server_header": False,
+    }
@@ -1,10 +1,13 @@
 import os
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_openai import ChatOpenAI
+
+from app.config.embeddings import build_embedding_model
+from app.config.resilience import GuardedEmbeddings, build_breaker
 
 # Load environment variables from .env file
 load_dotenv()
@@ -32,6 +35,8 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = Field("db", env="POSTGRES_DB")
 
     OPENAI_API_KEY: str = Field(..., env="OPENAI_API_KEY")  # <-- Add this line
+    # OpenAI-compatible endpoint instead of api.openai.com, e.g. benchmarks/fake_upstream.py
+    OPENAI_BASE_URL: Optional[str] = Field(None, env="OPENAI_BASE_URL")
 
     ALLOWED_ORIGINS_RAW: str = Field("http://localhost,http://localhost:3000", alias="ALLOWED_ORIGINS")
 
@@ -49,8 +54,244 @@ class Settings(BaseSettings):
         return f"sqlite:///{self.SQLITE_DB_PATH}"
 
     # --------------------------------------------------------------------------- #
-    # LLM MODEL CONFIGS                                                                                                                          #
+    # SERVER CONFIGS                                                              #
+    # --------------------------------------------------------------------------- #
+    # Set by the gunicorn master once migrations and admin bootstrap have run,
+    # so workers do not repeat them in their lifespan.
+    SKIP_STARTUP_TASKS: bool = Field(False, env="SKIP_STARTUP_TASKS")
+    # Remote Chroma server; required when running more than one worker, since
+    # the embedded persistent store must only be opened by a single process.
+    CHROMA_HOST: Optional[str] = Field(None, env="CHROMA_HOST")
+    CHROMA_PORT: int = Field(8000, env="CHROMA_PORT")
+    # Static bearer token for Prometheus scrapers; /metrics otherwise needs an admin token
+    METRICS_TOKEN: Optional[str] = Field(None, env="METRICS_TOKEN")
+    # Serialize responses with orjson (ORJSONResponse) instead of the stdlib encoder
+    ORJSON_RESPONSES: bool = Field(False, env="ORJSON_RESPONSES")
+    # Debug instrument: measure event-loop lag and log the stack of any
+    # synchronous call that blocks the loop longer than the threshold
+    LOOP_MONITOR_ENABLED: bool = Field(False, env="LOOP_MONITOR_ENABLED")
+    LOOP_MONITOR_INTERVAL_SECONDS: float = Field(0.05, env="LOOP_MONITOR_INTERVAL_SECONDS")
+    LOOP_BLOCK_THRESHOLD_SECONDS: float = Field(0.1, env="LOOP_BLOCK_THRESHOLD_SECONDS")
+    # Background warmup after startup; /health/ready answers 503 until it is done.
+    # Steps, in order: database, vector_stores, tokenizers, retrieval, llm
+    WARMUP_ENABLED: bool = Field(True, env="WARMUP_ENABLED")
+    WARMUP_STEPS: str = Field("database,vector_stores,tokenizers,retrieval", env="WARMUP_STEPS")
+    WARMUP_DB_CONNECTIONS: int = Field(5, env="WARMUP_DB_CONNECTIONS")
+    WARMUP_STEP_TIMEOUT_SECONDS: float = Field(60.0, env="WARMUP_STEP_TIMEOUT_SECONDS")
+    WARMUP_QUERY: str = Field("warmup", env="WARMUP_QUERY")
+
+    # --------------------------------------------------------------------------- #
+    # EMBEDDING CONFIGS                                                           #
+    # --------------------------------------------------------------------------- #
+    # "openai" (embeddings API) or "onnx" (local CPU model, see app/config/embeddings.py)
+    EMBEDDING_BACKEND: str = Field("openai", env="EMBEDDING_BACKEND")
+    EMBEDDING_MODEL: str = Field("text-embedding-3-large", env="EMBEDDING_MODEL")
+    # Reduced output size requested from the API (e.g. 256, 1024); None keeps the native size
+    EMBEDDING_DIMENSIONS: Optional[int] = Field(None, env="EMBEDDING_DIMENSIONS")
+    # Local quantization for retrieval: "none", "int8" or "binary". The codes are kept in each
+    # worker next to Chroma's own index, so they only save worker memory with a Chroma server
+    # (CHROMA_HOST), where the float vectors and HNSW graph live in the server
+    EMBEDDING_QUANTIZATION: str = Field("none", env="EMBEDDING_QUANTIZATION")
+    # Candidates fetched per result from the quantized index before float re-ranking
+    QUANTIZED_RERANK_FACTOR: int = Field(4, env="QUANTIZED_RERANK_FACTOR")
+    # How often a worker compares the quantized index with its collection, to
+    # pick up vectors written by other workers; rebuilds run in the background
+    QUANTIZED_INDEX_CHECK_SECONDS: float = Field(30, env="QUANTIZED_INDEX_CHECK_SECONDS")
+
+    # ONNX backend: model name, or a directory with model.onnx and tokenizer.json
+    # (defaults to chromadb's download of all-MiniLM-L6-v2). Inference threads
+    # are per worker process.
+    EMBEDDING_ONNX_MODEL: str = Field("all-MiniLM-L6-v2", env="EMBEDDING_ONNX_MODEL")
+    EMBEDDING_ONNX_MODEL_DIR: Optional[str] = Field(None, env="EMBEDDING_ONNX_MODEL_DIR")
+    EMBEDDING_ONNX_THREADS: int = Field(4, env="EMBEDDING_ONNX_THREADS")
+    EMBEDDING_ONNX_BATCH_SIZE: int = Field(32, env="EMBEDDING_ONNX_BATCH_SIZE")
+    EMBEDDING_ONNX_MAX_LENGTH: int = Field(256, env="EMBEDDING_ONNX_MAX_LENGTH")
+
+    @property
+    def EMBEDDING_PROFILE(self) -> str:
+        # OpenAI profiles keep their original form so existing collections still match
+        if self.EMBEDDING_BACKEND.lower() == "onnx":
+            return f"onnx:{self.EMBEDDING_ONNX_MODEL}:native"
+        return f"{self.EMBEDDING_MODEL}:{self.EMBEDDING_DIMENSIONS or 'native'}"
+
+    # --------------------------------------------------------------------------- #
+    # VECTOR STORE CONFIGS                                                        #
+    # --------------------------------------------------------------------------- #
+    # HNSW defaults used when a collection is first created. Existing collections
+    # keep their parameters; change them through the /admin/vectors endpoints.
+    HNSW_M: int = Field(32, env="HNSW_M")
+    HNSW_EF_CONSTRUCTION: int = Field(200, env="HNSW_EF_CONSTRUCTION")
+    HNSW_EF_SEARCH: int = Field(100, env="HNSW_EF_SEARCH")
+    VECTOR_REBUILD_BATCH_SIZE: int = Field(500, env="VECTOR_REBUILD_BATCH_SIZE")
+    # Shadow collections (re-embedding without downtime, see app/chat/services/vector_shadow.py):
+    # vectors embedded per call and per second while building (0: unthrottled), the most
+    # the switch may still have to embed itself, and how often workers re-resolve live names
+    VECTOR_SHADOW_BATCH_SIZE: int = Field(100, env="VECTOR_SHADOW_BATCH_SIZE")
+    VECTOR_SHADOW_MAX_VECTORS_PER_SECOND: float = Field(200, env="VECTOR_SHADOW_MAX_VECTORS_PER_SECOND")
+    VECTOR_SHADOW_MAX_CATCH_UP: int = Field(1000, env="VECTOR_SHADOW_MAX_CATCH_UP")
+    VECTOR_ALIAS_SYNC_SECONDS: float = Field(10, env="VECTOR_ALIAS_SYNC_SECONDS")
+    # Where /admin/vectors snapshot exports are written and imported from
+    SNAPSHOT_DIR: str = Field(os.path.join(BASE_DIR, "snapshots"), env="SNAPSHOT_DIR")
+
+    @property
+    def HNSW_COLLECTION_METADATA(self) -> dict:
+        return {
+            "hnsw:M": self.HNSW_M,
+            "hnsw:construction_ef": self.HNSW_EF_CONSTRUCTION,
+            "hnsw:search_ef": self.HNSW_EF_SEARCH,
+            "embedding_profile": self.EMBEDDING_PROFILE,
+        }
+
+    # --------------------------------------------------------------------------- #
+    # DOCUMENT PROCESSING CONFIGS                                                 #
     # --------------------------------------------------------------------------- #
+    # Files parsed at the same time, each in its own worker process
+    PARSE_WORKERS: int = Field(2, env="PARSE_WORKERS")
+    PARSE_TIMEOUT_SECONDS: int = Field(900, env="PARSE_TIMEOUT_SECONDS")
+    # Address-space cap of a parse worker; 0 disables it
+    PARSE_MEMORY_LIMIT_MB: int = Field(2048, env="PARSE_MEMORY_LIMIT_MB")
+    # Pages split and embedded together; progress is saved after each window
+    PARSE_WINDOW_PAGES: int = Field(25, env="PARSE_WINDOW_PAGES")
+    # CSV/XLSX rows are indexed in batches of at most this many rows/characters
+    TABLE_ROWS_PER_CHUNK: int = Field(50, env="TABLE_ROWS_PER_CHUNK")
+    TABLE_CHUNK_MAX_CHARS: int = Field(2000, env="TABLE_CHUNK_MAX_CHARS")
+
+    # --------------------------------------------------------------------------- #
+    # HTTP CACHE CONFIGS                                                          #
+    # --------------------------------------------------------------------------- #
+    # Rendered list responses kept per worker, keyed by user and resource version; 0 disables
+    RESPONSE_CACHE_SIZE: int = Field(512, env="RESPONSE_CACHE_SIZE")
+
+    # --------------------------------------------------------------------------- #
+    # EXPORT CONFIGS                                                              #
+    # --------------------------------------------------------------------------- #
+    # Rows fetched per round trip from the Postgres server-side cursor
+    EXPORT_YIELD_PER: int = Field(1000, env="EXPORT_YIELD_PER")
+    # SQLite: rows read per short transaction
+    EXPORT_PAGE_SIZE: int = Field(2000, env="EXPORT_PAGE_SIZE")
+    # Uncompressed bytes collected before a chunk is compressed and sent
+    EXPORT_CHUNK_BYTES: int = Field(64 * 1024, env="EXPORT_CHUNK_BYTES")
+
+    # --------------------------------------------------------------------------- #
+    # RETENTION CONFIGS                                                           #
+    # --------------------------------------------------------------------------- #
+    # Conversations older than this are archived to ARCHIVE_DIR and deleted; 0 keeps them forever
+    CONVERSATION_RETENTION_DAYS: int = Field(0, env="CONVERSATION_RETENTION_DAYS")
+    # Conversations saved before created_at existed carry the migration time and
+    # age from it; set this to archive them on the next run instead
+    ARCHIVE_BACKFILLED_CONVERSATIONS: bool = Field(False, env="ARCHIVE_BACKFILLED_CONVERSATIONS")
+    ARCHIVE_DIR: str = Field(os.path.join(BASE_DIR, "archives"), env="ARCHIVE_DIR")
+    ARCHIVE_BATCH_SIZE: int = Field(1000, env="ARCHIVE_BATCH_SIZE")
+    ARCHIVE_BATCH_PAUSE_SECONDS: float = Field(0.05, env="ARCHIVE_BATCH_PAUSE_SECONDS")
+    ARCHIVE_INTERVAL_SECONDS: int = Field(3600, env="ARCHIVE_INTERVAL_SECONDS")
+    # Monthly conversation partitions created in advance (Postgres only)
+    CONVERSATION_PARTITION_MONTHS_AHEAD: int = Field(3, env="CONVERSATION_PARTITION_MONTHS_AHEAD")
+
+    # --------------------------------------------------------------------------- #
+    # RETRIEVAL CONFIGS                                                           #
+    # --------------------------------------------------------------------------- #
+    # Candidates fetched from the vector store before re-ranking
+    RETRIEVAL_FETCH_K: int = Field(12, env="RETRIEVAL_FETCH_K")
+    RETRIEVAL_MIN_K: int = Field(1, env="RETRIEVAL_MIN_K")
+    # At most the 3 chunks chat used to send, so re-ranking only ever removes chunks
+    RETRIEVAL_MAX_K: int = Field(3, env="RETRIEVAL_MAX_K")
+    # Upper bound on context tokens stuffed into the QA prompt: about 3 chunks of 1000 characters
+    PROMPT_TOKEN_BUDGET: int = Field(750, env="PROMPT_TOKEN_BUDGET")
+    # Chunks scoring below this fraction of the best chunk are dropped
+    RERANK_MIN_RELATIVE_SCORE: float = Field(0.3, env="RERANK_MIN_RELATIVE_SCORE")
+    # "lexical" (offline heuristic) or "cross_encoder" (needs sentence-transformers)
+    RERANK_SCORER: str = Field("lexical", env="RERANK_SCORER")
+    CROSS_ENCODER_MODEL: str = Field("cross-encoder/ms-marco-MiniLM-L-6-v2", env="CROSS_ENCODER_MODEL")
+    # Retrieval-only /search: deepest result reachable by paging, highlight excerpts per
+    # result and their length, and query embeddings kept for repeated queries and paging
+    SEARCH_MAX_RESULTS: int = Field(100, env="SEARCH_MAX_RESULTS")
+    SEARCH_HIGHLIGHT_FRAGMENTS: int = Field(2, env="SEARCH_HIGHLIGHT_FRAGMENTS")
+    SEARCH_HIGHLIGHT_CHARS: int = Field(160, env="SEARCH_HIGHLIGHT_CHARS")
+    SEARCH_EMBEDDING_CACHE_SIZE: int = Field(1024, env="SEARCH_EMBEDDING_CACHE_SIZE")
+
+    # --------------------------------------------------------------------------- #
+    # LLM MODEL CONFIGS                                                                                                                        #
+    # --------------------------------------------------------------------------- #
+    FAST_CHAT_MODEL: str = Field("gpt-3.5-turbo", env="FAST_CHAT_MODEL")
+    STRONG_CHAT_MODEL: str = Field("gpt-4o", env="STRONG_CHAT_MODEL")
+
+    # Route each query to the fast or strong tier; when disabled public chat
+    # always uses the fast tier and private chat the strong tier.
+    ROUTING_ENABLED: bool = Field(True, env="ROUTING_ENABLED")
+    # Best retrieval relevance below which no LLM is called at all
+    ROUTING_NO_ANSWER_THRESHOLD: float = Field(0.2, env="ROUTING_NO_ANSWER_THRESHOLD")
+    # Best retrieval relevance below which the strong tier is used
+    ROUTING_STRONG_CONFIDENCE_THRESHOLD: float = Field(0.45, env="ROUTING_STRONG_CONFIDENCE_THRESHOLD")
+    # Queries longer than this many words are treated as complex
+    ROUTING_COMPLEX_QUERY_WORDS: int = Field(30, env="ROUTING_COMPLEX_QUERY_WORDS")
+    NO_RELEVANT_DOCUMENTS_REPLY: str = Field(
+        "Sorry, I couldn't find any relevant documents to answer your question.",
+        env="NO_RELEVANT_DOCUMENTS_REPLY",
+    )
+
+    # POST /chat/public/batch: most questions per call, concurrent LLM calls per batch
+    BATCH_CHAT_MAX_QUESTIONS: int = Field(100, env="BATCH_CHAT_MAX_QUESTIONS")
+    BATCH_CHAT_CONCURRENCY: int = Field(8, env="BATCH_CHAT_CONCURRENCY")
+
+    # --------------------------------------------------------------------------- #
+    # UPSTREAM TIMEOUT CONFIGS                                                    #
+    # --------------------------------------------------------------------------- #
+    # Whole-request budgets; 0 disables the deadline
+    CHAT_DEADLINE_SECONDS: float = Field(30, env="CHAT_DEADLINE_SECONDS")
+    BATCH_CHAT_DEADLINE_SECONDS: float = Field(120, env="BATCH_CHAT_DEADLINE_SECONDS")
+    SEARCH_DEADLINE_SECONDS: float = Field(5, env="SEARCH_DEADLINE_SECONDS")
+    # Per-stage limits, cut further to what is left of the request deadline
+    RETRIEVAL_TIMEOUT_SECONDS: float = Field(8, env="RETRIEVAL_TIMEOUT_SECONDS")
+    LLM_TIMEOUT_SECONDS: float = Field(25, env="LLM_TIMEOUT_SECONDS")
+    # Threads running blocking stages (retrieval); separate from asyncio's default executor
+    STAGE_MAX_THREADS: int = Field(16, env="STAGE_MAX_THREADS")
+    # HTTP client limits of the OpenAI clients, which also bound abandoned worker threads
+    EMBEDDING_REQUEST_TIMEOUT_SECONDS: float = Field(8, env="EMBEDDING_REQUEST_TIMEOUT_SECONDS")
+    EMBEDDING_MAX_RETRIES: int = Field(1, env="EMBEDDING_MAX_RETRIES")
+    LLM_REQUEST_TIMEOUT_SECONDS: float = Field(25, env="LLM_REQUEST_TIMEOUT_SECONDS")
+    LLM_MAX_RETRIES: int = Field(1, env="LLM_MAX_RETRIES")
+    # Per-upstream (embeddings, chat) breakers: open at this failure rate over the window
+    CIRCUIT_BREAKER_ENABLED: bool = Field(True, env="CIRCUIT_BREAKER_ENABLED")
+    CIRCUIT_BREAKER_FAILURE_RATE: float = Field(0.5, env="CIRCUIT_BREAKER_FAILURE_RATE")
+    CIRCUIT_BREAKER_MIN_CALLS: int = Field(10, env="CIRCUIT_BREAKER_MIN_CALLS")
+    CIRCUIT_BREAKER_WINDOW_SECONDS: float = Field(30, env="CIRCUIT_BREAKER_WINDOW_SECONDS")
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = Field(15, env="CIRCUIT_BREAKER_OPEN_SECONDS")
+    # Reply sent with the retrieved passages when the chat models are unavailable
+    DEGRADED_REPLY: str = Field(
+        "The assistant is temporarily unavailable. These passages from the documents look relevant to your question.",
+        env="DEGRADED_REPLY",
+    )
+
+    # --------------------------------------------------------------------------- #
+    # ADMISSION CONTROL CONFIGS                                                   #
+    # --------------------------------------------------------------------------- #
+    # Fair sharing of chat and ingestion between clients (users, or the IP of
+    # anonymous public chat); limits are per worker process. See app/config/admission.py
+    ADMISSION_ENABLED: bool = Field(True, env="ADMISSION_ENABLED")
+    # Number of reverse proxies in front of the app that append to X-Forwarded-For: anonymous
+    # clients are keyed by the address the outermost one appended, counted from the right
+    # (entries further left are set by the client). 0 ignores the header.
+    # Under gunicorn, prefer FORWARDED_ALLOW_IPS (gunicorn.conf.py), which fixes the client address itself
+    ADMISSION_TRUSTED_PROXY_HOPS: int = Field(0, env="ADMISSION_TRUSTED_PROXY_HOPS")
+    # Share of a busy pool each client gets, relative to the others
+    ADMISSION_ANONYMOUS_WEIGHT: float = Field(1.0, env="ADMISSION_ANONYMOUS_WEIGHT")
+    ADMISSION_USER_WEIGHT: float = Field(2.0, env="ADMISSION_USER_WEIGHT")
+    # Chat requests (a batch counts once, weighted by its questions) answered at the same time
+    CHAT_MAX_CONCURRENT: int = Field(32, env="CHAT_MAX_CONCURRENT")
+    # Per client: room for several users behind one NAT address, or a user's parallel tabs
+    CHAT_MAX_CONCURRENT_PER_CLIENT: int = Field(8, env="CHAT_MAX_CONCURRENT_PER_CLIENT")
+    CHAT_MAX_QUEUED_PER_CLIENT: int = Field(16, env="CHAT_MAX_QUEUED_PER_CLIENT")
+    CHAT_MAX_QUEUED: int = Field(256, env="CHAT_MAX_QUEUED")
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = Field(10, env="CHAT_QUEUE_TIMEOUT_SECONDS")
+    # LLM tokens a client may use per minute; 0 disables the quota
+    CHAT_TOKENS_PER_MINUTE_PER_CLIENT: int = Field(50000, env="CHAT_TOKENS_PER_MINUTE_PER_CLIENT")
+    # Files processed at the same time; the rest wait their turn in the background
+    INGESTION_MAX_CONCURRENT: int = Field(2, env="INGESTION_MAX_CONCURRENT")
+    INGESTION_MAX_CONCURRENT_PER_CLIENT: int = Field(1, env="INGESTION_MAX_CONCURRENT_PER_CLIENT")
+    INGESTION_MAX_QUEUED_PER_CLIENT: int = Field(50, env="INGESTION_MAX_QUEUED_PER_CLIENT")
+    INGESTION_MAX_QUEUED: int = Field(500, env="INGESTION_MAX_QUEUED")
+    # Tokens embedded per minute per client; 0 disables the quota
+    INGESTION_TOKENS_PER_MINUTE_PER_CLIENT: int = Field(0, env="INGESTION_TOKENS_PER_MINUTE_PER_CLIENT")
 
     class Config:
         env_file = ".env"
@@ -62,14 +303,37 @@ settings = Settings()
 
 # 3. Instantiate OpenAI client(s) USING the loaded API key
 #    and OUTSIDE the Settings config class to keep Pydantic happy.
-public_chat_model = ChatOpenAI(
-    model_name="gpt-3.5-turbo",
+fast_chat_model = ChatOpenAI(
+    model_name=settings.FAST_CHAT_MODEL,
     temperature=0,
-    openai_api_key=settings.OPENAI_API_KEY  # <-- Here it is injected
+    openai_api_key=settings.OPENAI_API_KEY,  # <-- Here it is injected
+    base_url=settings.OPENAI_BASE_URL,
+    timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
 )
-private_chat_model = ChatOpenAI(
-    model_name="gpt-4o",
+strong_chat_model = ChatOpenAI(
+    model_name=settings.STRONG_CHAT_MODEL,
     temperature=0,
-    openai_api_key=settings.OPENAI_API_KEY
+    openai_api_key=settings.OPENAI_API_KEY,
+    base_url=settings.OPENAI_BASE_URL,
+    timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
 )
+public_chat_model = fast_chat_model
+private_chat_model = strong_chat_model
+
+# One breaker per upstream, shared by every caller in the process
+embeddings_breaker = build_breaker("embeddings", settings)
+chat_breaker = build_breaker("chat", settings)
+embedding_model = GuardedEmbeddings(build_embedding_model(settings), embeddings_breaker)
+
+
+def chroma_client_kwargs(persist_directory: str) -> dict:
+    """Chroma() keyword arguments: remote server if configured, else embedded."""
+    if settings.CHROMA_HOST:
+        import chromadb
+        return {"client": chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)}
+    return {"persist_directory": persist_directory}
+
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="accounts/login")
@@ -4,16 +4,27 @@ import logging
 import subprocess
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.accounts.models.user import User, RoleEnum
 from app.accounts.routes.users import router as accounts_router, admin_router
 from app.accounts.services.auth import get_password_hash
+from app.chat.routes.analytics import admin_analytics_router
 from app.chat.routes.file import admin_files_router
 from app.chat.routes.chat import public_chat_router
+from app.chat.routes.export import admin_export_router
+from app.chat.routes.search import search_router
+from app.chat.routes.vector_index import admin_vectors_router
+from app.chat.services.retention import run_retention_loop
+from app.chat.services.vector_shadow import run_alias_sync_loop, sync_collections
 from app.config.database import engine, AsyncSessionLocal
+from app.config.http_cache import USERS, bump_version, etag_matches
+from app.config.responses import DefaultJSONResponse, prebuilt_response
 from app.config.settings import settings
+from app.monitoring.loop_monitor import LoopMonitor, LoopMonitorMiddleware
+from app.monitoring.routes import health_router, metrics_router
+from app.monitoring.warmup import run_warmup, warmup_state
 
 from decouple import config
 
@@ -73,12 +84,13 @@ async def create_admin_if_needed():
             role=RoleEnum.ADMIN
         )
         session.add(admin_user)
+        await bump_version(session, USERS)
         await session.commit()
         logger.info("Default admin user created.")
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+async def run_startup_tasks():
+    """One-time startup work: migrations and admin bootstrap."""
     # 1. Apply migrations
     await apply_alembic_migrations()
 
@@ -88,8 +100,51 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         logger.error(f"Failed to check/create admin user: {exc}")
 
+
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL_SECONDS,
+    threshold=settings.LOOP_BLOCK_THRESHOLD_SECONDS,
+) if settings.LOOP_MONITOR_ENABLED else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if loop_monitor:
+        loop_monitor.start()
+
+    # Under gunicorn the master has already run these once for all workers
+    if not settings.SKIP_STARTUP_TASKS:
+        await run_startup_tasks()
+
+    # Every worker runs the loop; the archiver itself lets only one of them work
+    retention_task = None
+    if settings.CONVERSATION_RETENTION_DAYS > 0:
+        retention_task = asyncio.create_task(run_retention_loop())
+
+    # Serve each collection with the profile it was built with, and follow
+    # shadow builds and switches made by other workers
+    await asyncio.to_thread(sync_collections)
+    alias_task = None
+    if settings.VECTOR_ALIAS_SYNC_SECONDS > 0:
+        alias_task = asyncio.create_task(run_alias_sync_loop())
+
+    # Warm up in the background: /health/ready reports 503 until it is done
+    warmup_task = None
+    if settings.WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(run_warmup())
+    else:
+        warmup_state.mark_ready()
+
     yield
 
+    if warmup_task:
+        warmup_task.cancel()
+    if retention_task:
+        retention_task.cancel()
+    if alias_task:
+        alias_task.cancel()
+    if loop_monitor:
+        loop_monitor.stop()
     await engine.dispose()
 
 app = FastAPI(
@@ -97,6 +152,7 @@ app = FastAPI(
     description="REST API for Sevensix application. Demonstrates backend expertise, modern best practices, and scalable architecture.",
     version="0.1.0",
     lifespan=lifespan,
+    default_response_class=DefaultJSONResponse,
 )
 
 app.add_middleware(
@@ -107,11 +163,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if loop_monitor:
+    app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
 app.include_router(accounts_router, prefix="/accounts", tags=["Accounts"])
 app.include_router(admin_router, prefix="/admin", tags=["Admin"])
 app.include_router(admin_files_router, prefix="/admin/files", tags=["Files"])
+app.include_router(admin_vectors_router, prefix="/admin/vectors", tags=["Vectors"])
+app.include_router(admin_analytics_router, prefix="/admin/analytics", tags=["Analytics"])
+app.include_router(admin_export_router, prefix="/admin/export", tags=["Export"])
 app.include_router(public_chat_router, prefix="/chat/public", tags=["Chat"])
+app.include_router(search_router, prefix="/search", tags=["Search"])
+app.include_router(metrics_router, prefix="/metrics", tags=["Monitoring"])
+app.include_router(health_router, prefix="/health", tags=["Monitoring"])
+
+ROOT_CONTENT = {"message": "Welcome to the Sevensix API. See /docs for interactive API documentation."}
+# Static payload: the ETag only changes with the release
+ROOT_ETAG = f'"root-{app.version}"'
+
 
 @app.get("/", tags=["Root"])
-async def root():
-    return {"message": "Welcome to the Sevensix API. See /docs for interactive API documentation."}
+async def root(request: Request):
+    headers = {"ETag": ROOT_ETAG, "Cache-Control": "public, max-age=3600"}
+    if etag_matches(ROOT_ETAG, request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return prebuilt_response(ROOT_CONTENT, headers=headers)
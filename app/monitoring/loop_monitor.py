@@ -0,0 +1,149 @@
+"""
+Event-loop lag watchdog and blocking-call detector.
+
+A heartbeat scheduled on the event loop every LOOP_MONITOR_INTERVAL_SECONDS
+records how late it runs (the loop lag). A watchdog thread checks that
+heartbeat; once it is more than LOOP_BLOCK_THRESHOLD_SECONDS overdue, the
+loop is stuck in synchronous code, so the watchdog logs the loop thread's
+current stack together with the route of the task that is running. Both
+feed the metrics endpoint.
+
+Off by default: enable LOOP_MONITOR_ENABLED in development and staging.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from app.monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event-loop heartbeat ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_LAG_MAX = REGISTRY.gauge(
+    "event_loop_lag_max_seconds", "Largest event-loop lag seen since start"
+)
+LOOP_BLOCKS = REGISTRY.counter(
+    "event_loop_blocked_total", "Times the event loop was blocked past the threshold, by route"
+)
+LOOP_BLOCKED_SECONDS = REGISTRY.counter(
+    "event_loop_blocked_seconds_total", "Time the event loop spent blocked past the threshold, by route"
+)
+
+# Label of blocks that happen outside any request (startup, background loops)
+NO_ROUTE = "none"
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, threshold: float, stack_limit: int = 30):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._expected = 0.0
+        self._heartbeat = 0.0
+        self._reported_heartbeat = 0.0
+        self._blocked_route = NO_ROUTE
+        # Request scope of each task serving a request, filled by the middleware
+        self._task_scopes: Dict[asyncio.Task, dict] = {}
+
+    # ---- loop side ---- #
+    def start(self) -> None:
+        """Start monitoring the running loop; call from within it."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._expected = self._heartbeat + self.interval
+        self._handle = self._loop.call_later(self.interval, self._tick)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Event-loop monitor started (interval {self.interval * 1000:.0f} ms, "
+            f"block threshold {self.threshold * 1000:.0f} ms)"
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        lag = max(0.0, now - self._expected)
+        LOOP_LAG.observe(lag)
+        if lag > LOOP_LAG_MAX.value():
+            LOOP_LAG_MAX.set(lag)
+        if lag > self.threshold:
+            LOOP_BLOCKED_SECONDS.inc(lag, route=self._blocked_route)
+            self._blocked_route = NO_ROUTE
+        self._heartbeat = now
+        self._expected = now + self.interval
+        self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def track(self, scope: dict) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_scopes[task] = scope
+
+    def untrack(self) -> None:
+        self._task_scopes.pop(asyncio.current_task(), None)
+
+    # ---- watchdog thread ---- #
+    def _current_route(self) -> str:
+        # The loop's running task, read from outside the loop thread
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", {})
+        task = current_tasks.get(self._loop)
+        scope = self._task_scopes.get(task) if task is not None else None
+        if scope is None:
+            return NO_ROUTE
+        # The matched route template, once routing has run; the raw path before
+        route = scope.get("route")
+        path = getattr(route, "path", None) or scope.get("path", "")
+        return f"{scope.get('method', '')} {path}".strip()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            heartbeat = self._heartbeat
+            overdue = time.monotonic() - heartbeat - self.interval
+            if overdue <= self.threshold or heartbeat == self._reported_heartbeat:
+                continue
+            # Report each block once, while it is still in progress
+            self._reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=-self.stack_limit)) if frame else ""
+            route = self._current_route()
+            self._blocked_route = route
+            LOOP_BLOCKS.inc(route=route)
+            logger.warning(
+                f"Event loop blocked for {overdue * 1000:.0f} ms+ in {route}; loop thread stack:\n{stack}"
+            )
+
+
+class LoopMonitorMiddleware:
+    """Pure ASGI middleware, so the endpoint runs in the task it registers."""
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.monitor.track(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.untrack()
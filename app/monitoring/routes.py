@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import PlainTextResponse
+
+from app.accounts.permissions import metrics_access
+from app.config.responses import prebuilt_response
+from app.monitoring.metrics import REGISTRY
+from app.monitoring.warmup import warmup_state
+
+metrics_router = APIRouter(dependencies=[Depends(metrics_access)])
+health_router = APIRouter()
+
+
+@metrics_router.get("", response_class=PlainTextResponse)
+async def metrics():
+    """In-process metrics in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@health_router.get("/live")
+async def live():
+    """The process is up and serving; restart it only if this fails."""
+    return prebuilt_response({"status": "ok"})
+
+
+@health_router.get("/ready")
+async def ready():
+    """503 until this worker's startup warmup has finished; route traffic only on 200."""
+    code = status.HTTP_200_OK if warmup_state.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return prebuilt_response(warmup_state.as_dict(), status_code=code, headers={"Cache-Control": "no-store"})
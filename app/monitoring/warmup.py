@@ -0,0 +1,167 @@
+"""
+Startup warmup and readiness.
+
+A fresh worker pays for several lazy initialisations on its first requests:
+SQLAlchemy's first connections, Chroma loading each collection's HNSW index
+into memory, tiktoken loading its encoding and the first TLS handshakes to
+OpenAI. `run_warmup` does that work once in the background after startup,
+and `/health/ready` answers 503 until it has finished, so the load balancer
+only routes traffic to warm workers.
+
+A failed step is logged and reported but does not keep the worker out of
+rotation, except for the database: without it no request can succeed, so
+that step is retried until it passes.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.chat.services.vector_index import VECTOR_STORES, check_embedding_profile
+from app.chat.utils.private_chat import private_retriever
+from app.chat.utils.public_chat import public_retriever
+from app.chat.utils.quantization import get_collection_index
+from app.chat.utils.reranking import count_tokens
+from app.config import settings as app_settings
+from app.config.database import engine
+from app.config.settings import settings
+from app.monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+READY = REGISTRY.gauge("app_ready", "1 once the startup warmup has finished")
+WARMUP_STEP_SECONDS = REGISTRY.gauge("warmup_step_seconds", "Duration of each startup warmup step")
+
+RETRIEVERS = {
+    "public": public_retriever,
+    "private": private_retriever,
+}
+
+# Seconds between attempts of the database step while the database is down
+_DB_RETRY_SECONDS = 5
+
+
+class WarmupState:
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, Dict] = {}
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.finished_at = time.time()
+        READY.set(1)
+
+    def as_dict(self) -> Dict:
+        duration = None
+        if self.started_at is not None and self.finished_at is not None:
+            duration = round(self.finished_at - self.started_at, 3)
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "warmup_seconds": duration,
+            "steps": self.steps,
+        }
+
+
+warmup_state = WarmupState()
+
+
+# --------------------------------------------------------------------------- #
+# Steps                                                                       #
+# --------------------------------------------------------------------------- #
+async def _warm_database() -> None:
+    """Open the pool's connections up front, each with a round trip."""
+
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    connections = max(1, settings.WARMUP_DB_CONNECTIONS)
+    # Hold them all at once so the pool really grows to that size
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+
+def _load_collection(store) -> None:
+    check_embedding_profile(store)
+    collection = store._collection
+    if not collection.count():
+        return
+    # A query with a stored vector loads the HNSW index without calling the
+    # embeddings API
+    sample = collection.get(limit=1, include=["embeddings"])
+    collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1, include=[])
+    mode = settings.EMBEDDING_QUANTIZATION.lower()
+    if mode != "none":
+        get_collection_index(collection, mode)
+
+
+async def _warm_vector_stores() -> None:
+    for store in VECTOR_STORES.values():
+        await asyncio.to_thread(_load_collection, store)
+
+
+async def _warm_tokenizers() -> None:
+    await asyncio.to_thread(count_tokens, settings.WARMUP_QUERY)
+
+
+async def _warm_retrieval() -> None:
+    """A full retrieval per collection: embeds the query over a warm OpenAI connection."""
+    for retriever in RETRIEVERS.values():
+        await asyncio.to_thread(retriever.invoke, settings.WARMUP_QUERY)
+
+
+async def _warm_llm() -> None:
+    """One tiny completion per chat model; off by default since it is billed."""
+    for model in (app_settings.fast_chat_model, app_settings.strong_chat_model):
+        await model.ainvoke("ping", max_tokens=1)
+
+
+WARMUP_STEPS: Dict[str, Callable[[], Awaitable[None]]] = {
+    "database": _warm_database,
+    "vector_stores": _warm_vector_stores,
+    "tokenizers": _warm_tokenizers,
+    "retrieval": _warm_retrieval,
+    "llm": _warm_llm,
+}
+
+# Steps the worker cannot serve without
+REQUIRED_STEPS = {"database"}
+
+
+def configured_steps() -> List[str]:
+    names = [name.strip() for name in settings.WARMUP_STEPS.split(",") if name.strip()]
+    unknown = [name for name in names if name not in WARMUP_STEPS]
+    if unknown:
+        raise ValueError(f"Unknown WARMUP_STEPS {', '.join(unknown)}. Must be among: {', '.join(WARMUP_STEPS)}")
+    return names
+
+
+async def _run_step(name: str) -> bool:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(WARMUP_STEPS[name](), timeout=settings.WARMUP_STEP_TIMEOUT_SECONDS)
+        result = {"status": "ok"}
+    except asyncio.TimeoutError:
+        result = {"status": "failed", "error": f"timed out after {settings.WARMUP_STEP_TIMEOUT_SECONDS}s"}
+    except Exception as e:
+        result = {"status": "failed", "error": str(e) or type(e).__name__}
+    if result["status"] == "failed":
+        logger.warning(f"Warmup step '{name}' failed: {result['error']}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    warmup_state.steps[name] = result
+    WARMUP_STEP_SECONDS.set(result["seconds"], step=name)
+    return result["status"] == "ok"
+
+
+async def run_warmup() -> None:
+    """Run the configured warmup steps in order, then mark the worker ready."""
+    warmup_state.started_at = time.time()
+    for name in configured_steps():
+        warmup_state.steps[name] = {"status": "running"}
+        while not await _run_step(name) and name in REQUIRED_STEPS:
+            await asyncio.sleep(_DB_RETRY_SECONDS)
+    warmup_state.mark_ready()
+    logger.info(f"Warmup finished in {warmup_state.finished_at - warmup_state.started_at:.2f}s")
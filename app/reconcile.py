@@ -0,0 +1,40 @@
+"""
+Reconcile the `chunks` table with the Chroma collections once, e.g. from cron
+or after upgrading, to register the vectors of files indexed before it and
+link the conversation citations migrated from JSON sources to their chunks:
+
+    python -m app.reconcile
+    python -m app.reconcile public --dry-run
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+# Register the mappers File's and User's relationships refer to
+from app.accounts.models.user import User  # noqa: F401
+from app.chat.models.conversation import Conversation  # noqa: F401
+from app.chat.services.chunks import reconcile_chunks
+from app.chat.services.vector_index import VECTOR_STORES
+from app.config.database import engine
+
+
+async def main(collections, repair):
+    try:
+        for name in collections:
+            report = await reconcile_chunks(name, repair=repair)
+            print(json.dumps(report))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collections", nargs="*", help=f"default: {' '.join(VECTOR_STORES)}")
+    parser.add_argument("--dry-run", action="store_true", help="report the differences without fixing them")
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(VECTOR_STORES)
+    if unknown:
+        parser.error(f"Unknown collection. Must be one of: {', '.join(VECTOR_STORES)}")
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(main(args.collections or list(VECTOR_STORES), not args.dry_run))
@@ -0,0 +1,33 @@
+"""
+Archive and delete expired conversations once, e.g. from cron:
+
+    python -m app.retention --days 180
+
+Uses CONVERSATION_RETENTION_DAYS when --days is not given.
+"""
+import argparse
+import asyncio
+import logging
+
+# Register the mappers Conversation's relationships refer to
+from app.accounts.models.user import User  # noqa: F401
+from app.chat.models.file import File  # noqa: F401
+from app.chat.services.retention import archive_expired_conversations
+from app.config.database import engine
+
+
+async def main(days, batch_size):
+    try:
+        archived = await archive_expired_conversations(retention_days=days, batch_size=batch_size)
+        print(f"Archived {archived} conversations")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    asyncio.run(main(args.days, args.batch_size))
@@ -0,0 +1,44 @@
+"""
+Export a vector collection to a snapshot, or load one back, without the
+API server running:
+
+    python -m app.snapshot export public /backups/public-2024-06-01
+    python -m app.snapshot import public /backups/public-2024-06-01 --replace
+
+Importing never calls the embeddings API, so a new node can be seeded from
+a snapshot in seconds.
+"""
+import argparse
+import logging
+
+from app.chat.services.vector_index import VECTOR_STORES
+from app.chat.services.vector_snapshot import export_collection, import_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Write a collection to a snapshot directory")
+    export_parser.add_argument("collection", choices=sorted(VECTOR_STORES))
+    export_parser.add_argument("path")
+    export_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    import_parser = commands.add_parser("import", help="Load a snapshot directory into a collection")
+    import_parser.add_argument("collection", choices=sorted(VECTOR_STORES))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true", help="Replace the collection's contents")
+    import_parser.add_argument("--force", action="store_true", help="Merge even if embedding profiles differ")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if args.command == "export":
+        manifest = export_collection(args.collection, args.path, dtype=args.dtype)
+        print(f"Exported {manifest['count']} vectors to {args.path}")
+    else:
+        rows = import_snapshot(args.collection, args.path, replace=args.replace, force=args.force)
+        print(f"Imported {rows} vectors into {args.collection}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency and throughput of the embeddings backends (EMBEDDING_BACKEND).
+
+For each backend: time to the first embedding (model load or first TLS
+handshake), single-query latency percentiles as seen by a chat request, and
+documents/second when embedding chunk-sized texts in bulk as ingestion does.
+
+    python benchmarks/embedding_backends.py --backends openai onnx
+    python benchmarks/embedding_backends.py --backends onnx --threads 1 2 4 --documents 512
+
+The openai backend needs OPENAI_API_KEY and network access; the onnx backend
+downloads all-MiniLM-L6-v2 on first use unless EMBEDDING_ONNX_MODEL_DIR is set.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY", "sk-unset")
+os.environ.setdefault("SECRET_KEY", "embedding-benchmark-secret-key-0123456789")
+
+from app.config.embeddings import build_embedding_model  # noqa: E402
+from app.config.settings import settings  # noqa: E402
+
+WORDS = (
+    "invoice refund shipping warranty password license firmware billing network "
+    "subscription delivery account printer installation policy customer order "
+    "the a of to and in for on with is are be this that it as by from at or"
+).split()
+
+
+def _texts(rng: random.Random, count: int, words: int) -> List[str]:
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words))) for _ in range(count)]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def bench(backend: str, queries: int, documents: int, threads: Optional[int], seed: int = 0) -> dict:
+    if threads is not None:
+        settings.EMBEDDING_ONNX_THREADS = threads
+    rng = random.Random(seed)
+    model = build_embedding_model(settings, backend)
+    row = {"backend": backend, "threads": threads if backend == "onnx" else None}
+
+    started = time.perf_counter()
+    dimensions = len(model.embed_query("warm up the backend"))
+    row["first_call_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    row["dimensions"] = dimensions
+
+    latencies = []
+    for question in _texts(rng, queries, 12):
+        started = time.perf_counter()
+        model.embed_query(question)
+        latencies.append((time.perf_counter() - started) * 1000)
+    row["query_p50_ms"] = round(statistics.median(latencies), 2)
+    row["query_p95_ms"] = round(_percentile(latencies, 95), 2)
+
+    # About the size of the 1000-character chunks process_file produces
+    chunks = _texts(rng, documents, 160)
+    started = time.perf_counter()
+    model.embed_documents(chunks)
+    elapsed = time.perf_counter() - started
+    row["bulk_docs_per_s"] = round(documents / elapsed, 1)
+    return row
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", nargs="+", default=["openai", "onnx"])
+    parser.add_argument("--queries", type=int, default=50, help="single-query embeddings timed")
+    parser.add_argument("--documents", type=int, default=256, help="chunks embedded in the bulk run")
+    parser.add_argument("--threads", type=int, nargs="+", default=[None],
+                        help="EMBEDDING_ONNX_THREADS values to compare (onnx only)")
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    for backend in args.backends:
+        for threads in (args.threads if backend == "onnx" else [None]):
+            try:
+                rows.append(bench(backend, args.queries, args.documents, threads))
+            except Exception as e:
+                rows.append({"backend": backend, "threads": threads, "error": f"{type(e).__name__}: {e}"})
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    columns = ["backend", "threads", "dimensions", "first_call_ms", "query_p50_ms", "query_p95_ms", "bulk_docs_per_s"]
+    print(" ".join(f"{c:>15}" for c in columns))
+    for row in rows:
+        if "error" in row:
+            print(f"{row['backend']:>15} {str(row['threads']):>15} error: {row['error']}")
+            continue
+        print(" ".join(f"{str(row.get(c)):>15}" for c in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
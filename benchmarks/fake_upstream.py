@@ -0,0 +1,218 @@
+"""
+Local stand-in for the OpenAI API with injectable latency and errors.
+
+Serves /v1/embeddings (deterministic hashing vectors) and
+/v1/chat/completions (a canned answer). Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and change its behaviour while
+it runs with POST /control, e.g. {"latency": 5, "error_rate": 0.5}; faults
+apply to every endpoint, or with "target": "chat" or "embeddings" to one.
+
+    python benchmarks/fake_upstream.py --port 8900 --latency 0.2 --jitter 0.1
+    curl -X POST localhost:8900/control -d '{"error_rate": 1}'
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_DIMENSIONS = 256
+
+
+def hashing_embedding(text: str, dimensions: int) -> List[float]:
+    """Bag-of-words hashing vector, so similar texts get similar vectors."""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        digest = hashlib.md5(word.encode()).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FaultConfig:
+    """Behaviour of the fake upstream, changeable while it serves requests."""
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            error_status: int = 500,
+            target: str = "",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Substring of the paths the faults apply to; "" for all
+        self.target = target
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def update(self, **values) -> None:
+        with self._lock:
+            for key, value in values.items():
+                if key in ("latency", "jitter", "error_rate", "error_status", "target"):
+                    setattr(self, key, type(getattr(self, key))(value))
+
+    def count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "latency": self.latency,
+                "jitter": self.jitter,
+                "error_rate": self.error_rate,
+                "error_status": self.error_status,
+                "target": self.target,
+                "requests": dict(self.requests),
+            }
+
+
+def _handler(config: FaultConfig, answer: str):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting, e.g. on its timeout
+                pass
+
+        def do_GET(self) -> None:
+            if self.path == "/control":
+                return self._send(200, config.as_dict())
+            self._send(404, {"error": {"message": "Not found"}})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/control":
+                config.update(**request)
+                return self._send(200, config.as_dict())
+
+            config.count(self.path)
+            faulty = config.target in self.path
+            delay = max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)) if faulty else 0.0
+            if delay:
+                time.sleep(delay)
+            if faulty and random.random() < config.error_rate:
+                return self._send(config.error_status, {
+                    "error": {"message": "Injected upstream failure", "type": "server_error", "code": None},
+                })
+
+            if self.path.endswith("/embeddings"):
+                return self._send(200, self._embeddings(request))
+            if self.path.endswith("/chat/completions"):
+                return self._send(200, self._chat(request))
+            self._send(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+        @staticmethod
+        def _embeddings(request: Dict) -> Dict:
+            inputs = request.get("input")
+            inputs = [inputs] if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)) else inputs
+            dimensions = request.get("dimensions") or DEFAULT_DIMENSIONS
+            data = [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    # Token id lists (tiktoken-enabled clients) are hashed as text too
+                    "embedding": hashing_embedding(item if isinstance(item, str) else " ".join(map(str, item)),
+                                                   dimensions),
+                }
+                for i, item in enumerate(inputs or [])
+            ]
+            tokens = sum(len(str(item).split()) for item in inputs or [])
+            return {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+
+        @staticmethod
+        def _chat(request: Dict) -> Dict:
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            completion_tokens = len(answer.split())
+            return {
+                "id": f"chatcmpl-fake-{random.getrandbits(32):08x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake-chat"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+
+    return Handler
+
+
+class FakeUpstream:
+    """The fake API served from a background thread, for use inside a test run."""
+
+    def __init__(self, port: int = 0, answer: str = "This is an answer from the fake upstream.", **faults):
+        self.config = FaultConfig(**faults)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self.config, answer))
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self) -> "FakeUpstream":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds around --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--target", default="", help="only inject faults on paths containing this, e.g. chat")
+    args = parser.parse_args()
+    upstream = FakeUpstream(
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        target=args.target,
+    )
+    print(f"Fake upstream on {upstream.base_url}")
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""
+Offline load test and profiler for the whole API.
+
+Boots `app.main:app` in-process against a temporary SQLite database and
+Chroma directory, with hashing embeddings and a canned LLM in place of
+OpenAI, so no network or API key is needed. Virtual users drive a weighted
+mix of login, dashboard reads, upload + process and public chat traffic;
+per-operation latency percentiles, event-loop lag and peak memory are
+reported, optionally with a cProfile, py-spy or tracemalloc profile.
+
+    python benchmarks/load_test.py --mix mixed --users 16 --duration 30
+    python benchmarks/load_test.py --mix chat --profile cprofile --output-dir /tmp/bench
+    python benchmarks/load_test.py --mix mixed --check            # exit 1 on regression
+    python benchmarks/load_test.py --mix mixed --save-baseline    # accept current numbers
+
+Requests go through httpx's ASGI transport, which also waits for the
+request's background tasks: the `process` latency therefore covers parsing
+and indexing the file. Baselines are machine-specific; regenerate them on
+the machine that runs the check. A failed request or a leaked database
+connection fails the check (see --max-error-rate), and a run with either
+is never saved as a baseline.
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import pstats
+import random
+import re
+import resource
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASELINES_PATH = os.path.join(ROOT, "benchmarks", "baselines.json")
+
+_tmp = tempfile.mkdtemp(prefix="sevensix-load-")
+os.environ["SQLITE_DB_PATH"] = os.path.join(_tmp, "load.db")
+os.environ["DATABASE_TYPE"] = "sqlite3"
+os.environ["SKIP_STARTUP_TASKS"] = "true"
+os.environ["SNAPSHOT_DIR"] = os.path.join(_tmp, "snapshots")
+os.environ["ARCHIVE_DIR"] = os.path.join(_tmp, "archives")
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+os.environ.setdefault("SECRET_KEY", "offline-load-test-secret-key-0123456789")
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+
+TOPICS = [
+    "invoice", "shipping", "warranty", "refund", "password", "account", "billing", "delivery",
+    "installation", "firmware", "battery", "display", "network", "printer", "license", "subscription",
+]
+FILLER = "the a of to and in for on with is are be this that it as by from at or".split()
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words feature hashing: related texts get similar vectors, no API calls."""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            # Non-negative features keep similarities, and so relevance scores, in [0, 1]
+            digest = hashlib.blake2b(token.encode(), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _install_fakes(llm_latency: float) -> None:
+    """Point the app at the temp directory and the offline models before it is imported."""
+    from app.config import settings as app_settings
+
+    app_settings.BASE_DIR = _tmp
+    os.makedirs(os.path.join(_tmp, "uploads"), exist_ok=True)
+    app_settings.embedding_model = HashingEmbeddings()
+    responses = [f"Based on the documents, the {topic} question is answered as follows." for topic in TOPICS]
+    app_settings.fast_chat_model = FakeListChatModel(responses=responses, sleep=llm_latency)
+    app_settings.strong_chat_model = FakeListChatModel(responses=responses, sleep=llm_latency * 3)
+    app_settings.public_chat_model = app_settings.fast_chat_model
+    app_settings.private_chat_model = app_settings.strong_chat_model
+
+
+def _document(rng: random.Random, paragraphs: int) -> str:
+    parts = []
+    for _ in range(paragraphs):
+        topic = rng.choice(TOPICS)
+        words = [rng.choice(FILLER) if rng.random() < 0.6 else topic for _ in range(60)]
+        parts.append(f"{topic.title()} policy. " + " ".join(words) + ".")
+    return "\n\n".join(parts)
+
+
+def _question(rng: random.Random) -> str:
+    return f"What does the {rng.choice(TOPICS)} policy say about {rng.choice(TOPICS)}?"
+
+
+# --------------------------------------------------------------------------- #
+# Traffic                                                                     #
+# --------------------------------------------------------------------------- #
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, op: str, started: float, response: Optional[httpx.Response]) -> None:
+        self.latencies[op].append(time.perf_counter() - started)
+        if response is None or response.status_code >= 400:
+            self.errors[op] += 1
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, credentials: dict, rng: random.Random):
+        self.client = client
+        self.stats = stats
+        self.credentials = credentials
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+
+    async def _request(self, op: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        response = None
+        kwargs.setdefault("headers", self.headers)
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            print(f"{op} failed: {type(e).__name__}: {e}", file=sys.stderr)
+        self.stats.record(op, started, response)
+        return response
+
+    async def login(self) -> None:
+        response = await self._request("login", "POST", "/accounts/login", json=self.credentials)
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def list_files(self) -> None:
+        await self._request("list_files", "GET", "/admin/files")
+
+    async def revalidate_files(self) -> None:
+        """Echo the file list's Last-Modified: unless the list changed meanwhile, that is a 304."""
+        response = await self._request("list_files", "GET", "/admin/files")
+        last_modified = response.headers.get("last-modified") if response is not None else None
+        if last_modified is None:
+            return
+        response = await self._request(
+            "revalidate", "GET", "/admin/files", headers={**self.headers, "If-Modified-Since": last_modified},
+        )
+        if response is not None and response.status_code == 200 and (
+                response.headers.get("last-modified") == last_modified
+        ):
+            print("revalidate: 200 for an unchanged file list", file=sys.stderr)
+            self.stats.errors["revalidate"] += 1
+
+    async def list_users(self) -> None:
+        await self._request("list_users", "GET", "/admin/users")
+
+    async def ingest(self) -> None:
+        name = f"doc-{self.rng.getrandbits(48):012x}.txt"
+        content = _document(self.rng, self.rng.randint(5, 40)).encode()
+        response = await self._request(
+            "upload", "POST", "/admin/files",
+            files={"file": (name, content, "text/plain")}, data={"information_type": "Public"},
+        )
+        if response is not None and response.status_code == 201:
+            await self._request("process", "POST", f"/admin/files/{response.json()['uid']}/process")
+
+    async def chat(self) -> None:
+        await self._request("chat", "POST", "/chat/public", json={"message": _question(self.rng)})
+
+
+# Operation weights of each traffic mix
+MIXES: Dict[str, Dict[str, int]] = {
+    "dashboard": {"list_files": 6, "revalidate_files": 2, "list_users": 3, "login": 1},
+    "ingest": {"ingest": 1},
+    "chat": {"chat": 1},
+    "mixed": {"chat": 10, "list_files": 5, "list_users": 2, "ingest": 1, "login": 1},
+}
+
+
+async def _run_user(user: VirtualUser, mix: Dict[str, int], stop_at: float) -> None:
+    ops: List[Callable] = [getattr(user, name) for name in mix]
+    weights = list(mix.values())
+    await user.login()
+    while time.monotonic() < stop_at:
+        await user.rng.choices(ops, weights)[0]()
+
+
+async def _sample_loop_lag(samples: List[float], interval: float = 0.02) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def _seed(admin_password: str, documents: int, rng: random.Random) -> dict:
+    """Schema, an admin user and a processed public corpus for chat to retrieve from."""
+    from app.accounts.models.user import RoleEnum, User
+    from app.accounts.services.auth import get_password_hash
+    from app.chat.models.file import File as FileModel, InfoType
+    from app.chat.utils.process_file import process_file
+    from app.config.database import AsyncSessionLocal, Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    credentials = {"email": "load@example.com", "password": admin_password}
+    async with AsyncSessionLocal() as db:
+        db.add(User(
+            username="load", email=credentials["email"],
+            hashed_password=get_password_hash(admin_password), role=RoleEnum.ADMIN,
+        ))
+        await db.commit()
+        for i in range(documents):
+            filename = f"seed-{i}.txt"
+            with open(os.path.join(_tmp, "uploads", filename), "w") as f:
+                f.write(_document(rng, 30))
+            record = FileModel(filename=filename, information_type=InfoType.PUBLIC)
+            db.add(record)
+            await db.commit()
+            record.status = await process_file(record)
+            await db.commit()
+    return credentials
+
+
+async def _seed_users(password: str, count: int) -> List[dict]:
+    """
+    Credentials of `count` more admins, one per virtual user: admission
+    control shares chat and ingestion per client, so the virtual users must
+    not all be the same one.
+    """
+    from app.accounts.models.user import RoleEnum, User
+    from app.accounts.services.auth import get_password_hash
+    from app.config.database import AsyncSessionLocal
+
+    hashed_password = get_password_hash(password)
+    credentials = [{"email": f"load-{i}@example.com", "password": password} for i in range(count)]
+    async with AsyncSessionLocal() as db:
+        for i, item in enumerate(credentials):
+            db.add(User(
+                username=f"load-{i}", email=item["email"], hashed_password=hashed_password, role=RoleEnum.ADMIN,
+            ))
+        await db.commit()
+    return credentials
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _summary(stats: Stats, lag: List[float], elapsed: float, leaked_connections: int) -> dict:
+    ops = {}
+    for op, latencies in sorted(stats.latencies.items()):
+        ops[op] = {
+            "requests": len(latencies),
+            "errors": stats.errors.get(op, 0),
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        }
+    return {
+        "duration_s": round(elapsed, 2),
+        "ops": ops,
+        "loop_lag_p99_ms": round(_percentile(lag, 0.99) * 1000, 2) if lag else 0.0,
+        "loop_lag_max_ms": round(max(lag) * 1000, 2) if lag else 0.0,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Database connections still checked out once all requests are done
+        "leaked_connections": leaked_connections,
+    }
+
+
+def _print_summary(summary: dict) -> None:
+    print(f"{'operation':<12} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, row in summary["ops"].items():
+        print(
+            f"{op:<12} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8.1f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+        )
+    print(
+        f"event-loop lag p99 {summary['loop_lag_p99_ms']:.1f} ms, max {summary['loop_lag_max_ms']:.1f} ms; "
+        f"peak RSS {summary['peak_rss_mb']:.0f} MB; leaked DB connections {summary['leaked_connections']}"
+    )
+
+
+# --------------------------------------------------------------------------- #
+# Baselines                                                                   #
+# --------------------------------------------------------------------------- #
+def _load_baselines() -> dict:
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def _error_rate(row: dict) -> float:
+    return round(row["errors"] / row["requests"], 4) if row["requests"] else 0.0
+
+
+def _unclean(summary: dict, max_error_rate: float) -> List[str]:
+    """Errors above `max_error_rate` and leaked connections: never part of a baseline."""
+    problems = [
+        f"{op} error rate: {_error_rate(row):.1%} > allowed {max_error_rate:.1%}"
+        for op, row in summary["ops"].items()
+        if _error_rate(row) > max_error_rate
+    ]
+    if summary["leaked_connections"]:
+        problems.append(f"leaked DB connections: {summary['leaked_connections']}")
+    return problems
+
+
+def save_baseline(mix: str, summary: dict, max_error_rate: float) -> List[str]:
+    """Store `summary` as the baseline of `mix`, unless the run had errors or leaks."""
+    problems = _unclean(summary, max_error_rate)
+    if problems:
+        return problems
+    baselines = _load_baselines()
+    baselines[mix] = {
+        "config": summary["config"],
+        "ops": {
+            op: {"p95_ms": row["p95_ms"], "p99_ms": row["p99_ms"], "error_rate": _error_rate(row)}
+            for op, row in summary["ops"].items()
+        },
+        "loop_lag_p99_ms": summary["loop_lag_p99_ms"],
+        "peak_rss_mb": summary["peak_rss_mb"],
+        "leaked_connections": summary["leaked_connections"],
+    }
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Saved {mix} baseline to {BASELINES_PATH}")
+    return []
+
+
+def check_baseline(mix: str, summary: dict, tolerance: float, slack_ms: float, max_error_rate: float) -> List[str]:
+    """Regressions of `summary` against the stored baseline of `mix`."""
+    baseline = _load_baselines().get(mix)
+    if baseline is None:
+        return [f"No baseline for mix '{mix}' in {BASELINES_PATH}; run with --save-baseline first"]
+
+    if baseline.get("config") != summary["config"]:
+        return [f"Baseline for mix '{mix}' was recorded with {baseline.get('config')}, not {summary['config']}"]
+
+    def over(current: float, allowed: float, slack: float) -> bool:
+        return current > allowed * (1 + tolerance) + slack
+
+    # Errors and leaks fail the check whatever the baseline says
+    failures = _unclean(summary, max_error_rate)
+    for op, row in summary["ops"].items():
+        op_baseline = baseline["ops"].get(op, {})
+        for key in ("p95_ms", "p99_ms"):
+            allowed = op_baseline.get(key)
+            if allowed is not None and over(row[key], allowed, slack_ms):
+                failures.append(f"{op} {key}: {row[key]:.1f} > baseline {allowed:.1f}")
+    if over(summary["loop_lag_p99_ms"], baseline["loop_lag_p99_ms"], slack_ms):
+        failures.append(
+            f"event-loop lag p99: {summary['loop_lag_p99_ms']:.1f} > baseline {baseline['loop_lag_p99_ms']:.1f}"
+        )
+    if over(summary["peak_rss_mb"], baseline["peak_rss_mb"], 0):
+        failures.append(f"peak RSS: {summary['peak_rss_mb']:.0f} MB > baseline {baseline['peak_rss_mb']:.0f} MB")
+    return failures
+
+
+# --------------------------------------------------------------------------- #
+# Profiling hooks                                                             #
+# --------------------------------------------------------------------------- #
+class Profiler:
+    """cProfile, py-spy (sampling, needs ptrace rights) or tracemalloc around the run."""
+
+    def __init__(self, kind: str, output_dir: str):
+        self.kind = kind
+        self.output_dir = output_dir
+        self._profile: Optional[cProfile.Profile] = None
+        self._py_spy: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        if self.kind == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.kind == "py-spy":
+            if shutil.which("py-spy") is None:
+                raise SystemExit("py-spy is not installed: pip install py-spy")
+            self._py_spy = subprocess.Popen([
+                "py-spy", "record", "--pid", str(os.getpid()), "--format", "speedscope",
+                "--output", os.path.join(self.output_dir, "py-spy.speedscope.json"),
+            ])
+        elif self.kind == "tracemalloc":
+            tracemalloc.start(25)
+
+    def stop(self) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+            path = os.path.join(self.output_dir, "load_test.prof")
+            self._profile.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(25)
+            print(out.getvalue())
+            print(f"cProfile stats written to {path} (open with snakeviz or pstats)")
+        elif self._py_spy is not None:
+            self._py_spy.send_signal(signal.SIGINT)
+            self._py_spy.wait(timeout=60)
+            print(f"py-spy profile written to {self.output_dir}/py-spy.speedscope.json")
+        elif self.kind == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"tracemalloc peak {peak / 2 ** 20:.1f} MB; top allocation sites:")
+            for stat in snapshot.statistics("lineno")[:15]:
+                print(f"  {stat}")
+
+
+async def run(args) -> dict:
+    # Importing the app registers every model before the seed data is written
+    from app.config.database import engine
+    from app.main import app
+
+    # Keep request logs and the fake embeddings' score warnings out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+
+    try:
+        await _seed("load-test-password", args.documents, random.Random(args.seed))
+        credentials = await _seed_users("load-test-password", args.users)
+
+        stats, lag = Stats(), []
+        profiler = Profiler(args.profile, args.output_dir)
+        lag_task = asyncio.create_task(_sample_loop_lag(lag))
+        async with contextlib.AsyncExitStack() as stack:
+            # Each virtual user is its own client: its own account and IP address
+            clients = [
+                await stack.enter_async_context(httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app, client=(f"10.0.{i // 250}.{i % 250 + 1}", 40000)),
+                    base_url="http://load-test",
+                    timeout=300,
+                ))
+                for i in range(args.users)
+            ]
+            profiler.start()
+            started = time.monotonic()
+            stop_at = started + args.duration
+            await asyncio.gather(*(
+                _run_user(
+                    VirtualUser(client, stats, credentials[i], random.Random(args.seed + i)), MIXES[args.mix], stop_at,
+                )
+                for i, client in enumerate(clients)
+            ))
+            elapsed = time.monotonic() - started
+            profiler.stop()
+        lag_task.cancel()
+        leaked_connections = engine.pool.checkedout()
+    finally:
+        await engine.dispose()
+    return _summary(stats, lag, elapsed, leaked_connections)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--documents", type=int, default=20, help="public documents seeded for chat")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="fake fast-tier LLM latency")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--profile", choices=["none", "cprofile", "py-spy", "tracemalloc"], default="none")
+    parser.add_argument("--output-dir", default=".", help="where profiles and results.json are written")
+    parser.add_argument("--check", action="store_true", help="exit 1 if results regress past the baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--slack-ms", type=float, default=5, help="allowed absolute regression")
+    parser.add_argument(
+        "--max-error-rate", type=float, default=0.0, help="allowed share of failed requests per operation",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    _install_fakes(args.llm_latency_ms / 1000)
+    try:
+        summary = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(_tmp, ignore_errors=True)
+
+    summary["config"] = {key: getattr(args, key) for key in ("mix", "users", "duration", "documents", "llm_latency_ms")}
+    _print_summary(summary)
+    with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    if args.save_baseline:
+        problems = save_baseline(args.mix, summary, args.max_error_rate)
+        for problem in problems:
+            print(f"NOT SAVED {problem}")
+        if problems:
+            return 1
+    if args.check:
+        failures = check_baseline(args.mix, summary, args.tolerance, args.slack_ms, args.max_error_rate)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print(f"No regressions against the {args.mix} baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Leaked aiosqlite connections run non-daemon threads that would keep the
+    # interpreter from exiting; they are already reported above
+    os._exit(code)
@@ -0,0 +1,146 @@
+"""
+Public chat latency of a well-behaved client next to an abusive one, with
+and without admission control (app/config/admission.py).
+
+Runs the chat path on the offline fakes of benchmarks/load_test.py. A
+"victim" client sends requests at low concurrency from one IP while a
+"noisy" client floods /chat/public from another; per phase it prints the
+victim's latency, the noisy client's throughput and how many of its
+requests were refused with 429.
+
+    python benchmarks/noisy_neighbour.py
+    python benchmarks/noisy_neighbour.py --noisy-concurrency 64 --duration 10 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+# Every question goes to the LLM, and the pool is small enough to be the bottleneck
+for _key, _value in {
+    "ROUTING_NO_ANSWER_THRESHOLD": "0",
+    "CHAT_MAX_CONCURRENT": "4",
+    "CHAT_MAX_CONCURRENT_PER_CLIENT": "2",
+    "CHAT_MAX_QUEUED_PER_CLIENT": "8",
+    "CHAT_TOKENS_PER_MINUTE_PER_CLIENT": "0",
+    "WARMUP_ENABLED": "false",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import load_test  # noqa: E402  (temp database, Chroma and upload directories)
+
+PHASES = [
+    {"name": "victim_alone", "noisy": False, "admission": True},
+    {"name": "noisy_no_admission", "noisy": True, "admission": False},
+    {"name": "noisy_admission", "noisy": True, "admission": True},
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def _client_loop(
+        client, concurrency: int, retry_delay: float, stop_at: float, rng, latencies: List[float], codes: Dict,
+) -> None:
+    async def one() -> None:
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            response = await client.post("/chat/public", json={"message": load_test._question(rng)})
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            elif response.status_code == 429:
+                # A polite client would wait Retry-After; a noisy one retries soon
+                await asyncio.sleep(retry_delay)
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+
+
+async def _phase(app, phase: Dict, args, rng) -> Dict:
+    import httpx
+
+    from app.config.admission import chat_admission
+
+    chat_admission.enabled = phase["admission"]
+    stop_at = time.perf_counter() + args.duration
+    victim_latencies, victim_codes = [], {}
+    noisy_latencies, noisy_codes = [], {}
+
+    def client(ip: str) -> httpx.AsyncClient:
+        transport = httpx.ASGITransport(app=app, client=(ip, 40000))
+        return httpx.AsyncClient(transport=transport, base_url="http://noisy-neighbour", timeout=120)
+
+    async with client("10.0.0.1") as victim, client("10.0.0.2") as noisy:
+        loops = [_client_loop(victim, args.victim_concurrency, 1.0, stop_at, rng, victim_latencies, victim_codes)]
+        if phase["noisy"]:
+            loops.append(_client_loop(
+                noisy, args.noisy_concurrency, args.retry_delay, stop_at, rng, noisy_latencies, noisy_codes,
+            ))
+        await asyncio.gather(*loops)
+
+    return {
+        "phase": phase["name"],
+        "victim_p50_ms": round(statistics.median(victim_latencies) * 1000, 1) if victim_latencies else None,
+        "victim_p95_ms": round(_percentile(victim_latencies, 95) * 1000, 1) if victim_latencies else None,
+        "victim_ok": len(victim_latencies),
+        "victim_429": victim_codes.get(429, 0),
+        "noisy_ok": len(noisy_latencies),
+        "noisy_429": noisy_codes.get(429, 0),
+    }
+
+
+async def run(args) -> List[Dict]:
+    import logging
+    import warnings
+
+    load_test._install_fakes(args.llm_latency)
+    from app.config.database import engine
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+    rows = []
+    try:
+        await load_test._seed("noisy-neighbour-password", args.documents, random.Random(args.seed))
+        rng = random.Random(args.seed)
+        for phase in PHASES:
+            rows.append(await _phase(app, phase, args, rng))
+    finally:
+        await engine.dispose()
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=5, help="seconds per phase")
+    parser.add_argument("--victim-concurrency", type=int, default=1)
+    parser.add_argument("--noisy-concurrency", type=int, default=32)
+    parser.add_argument("--retry-delay", type=float, default=0.1, help="noisy client's wait after a 429")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--documents", type=int, default=5, help="files indexed before the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    columns = ["phase", "victim_p50_ms", "victim_p95_ms", "victim_ok", "victim_429", "noisy_ok", "noisy_429"]
+    print(" ".join(f"{c:>18}" for c in columns))
+    for row in rows:
+        print(" ".join(f"{str(row[c]):>18}" for c in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
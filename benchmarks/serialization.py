@@ -0,0 +1,124 @@
+"""
+Per-request CPU of the response paths for /admin/files and /chat/public.
+
+Compares the default path (ORM entities validated through the response
+model and encoded with the stdlib encoder) with the fast path used by the
+endpoints (column-only select, pre-built dicts, orjson). Runs offline
+against a temporary SQLite database.
+
+    python benchmarks/serialization.py --files 10000 --sources 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="sevensix-bench-")
+os.environ["SQLITE_DB_PATH"] = os.path.join(_tmp, "bench.db")
+os.environ["DATABASE_TYPE"] = "sqlite3"
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.accounts.models.user import User  # noqa: E402
+from app.chat.models.conversation import Conversation  # noqa: E402,F401
+from app.chat.models.file import File as FileModel, InfoType  # noqa: E402
+from app.chat.routes.file import FILE_OUT_COLUMNS, _file_row  # noqa: E402
+from app.chat.schemas.chat import ChatResponseWithSources  # noqa: E402
+from app.chat.schemas.file import FileOut  # noqa: E402
+from app.config.database import AsyncSessionLocal, Base, engine  # noqa: E402
+
+
+def _cpu_ms(fn, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) * 1000 / repeat
+
+
+async def _acpu_ms(fn, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        await fn()
+    return (time.process_time() - started) * 1000 / repeat
+
+
+async def bench_files(count: int, repeat: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        db.add_all([
+            FileModel(filename=f"file-{i}.pdf", user_uid=user.uid, information_type=InfoType.PUBLIC)
+            for i in range(count)
+        ])
+        await db.commit()
+        user_uid = user.uid
+
+    async def default_path():
+        async with AsyncSessionLocal() as db:
+            stmt = select(FileModel).where(FileModel.user_uid == user_uid).order_by(FileModel.uploaded_at.desc())
+            files = (await db.execute(stmt)).scalars().all()
+            payload = [FileOut.model_validate(f).model_dump(mode="json") for f in files]
+            json.dumps(jsonable_encoder(payload)).encode()
+
+    async def fast_path():
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(*FILE_OUT_COLUMNS)
+                .where(FileModel.user_uid == user_uid)
+                .order_by(FileModel.uploaded_at.desc())
+            )
+            rows = (await db.execute(stmt)).mappings()
+            orjson.dumps([_file_row(row) for row in rows])
+
+    default_ms = await _acpu_ms(default_path, repeat)
+    fast_ms = await _acpu_ms(fast_path, repeat)
+    print(f"/admin/files ({count} files): default {default_ms:.2f} ms CPU, fast {fast_ms:.2f} ms CPU "
+          f"({default_ms / fast_ms:.1f}x)")
+
+
+def bench_chat(sources: int, repeat: int) -> None:
+    payload = {
+        "reply": "An answer of moderate length. " * 20,
+        "sources": [{"source": f"doc-{i}.pdf", "content": "snippet " * 25} for i in range(sources)],
+    }
+
+    def default_path():
+        model = ChatResponseWithSources(**payload)
+        json.dumps(jsonable_encoder(ChatResponseWithSources.model_validate(model.model_dump()))).encode()
+
+    def fast_path():
+        orjson.dumps(payload)
+
+    default_ms = _cpu_ms(default_path, repeat)
+    fast_ms = _cpu_ms(fast_path, repeat)
+    print(f"/chat/public ({sources} sources): default {default_ms:.3f} ms CPU, fast {fast_ms:.3f} ms CPU "
+          f"({default_ms / fast_ms:.1f}x)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--sources", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    await bench_files(args.files, args.repeat)
+    bench_chat(args.sources, args.repeat * 50)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
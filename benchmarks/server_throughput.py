@@ -0,0 +1,113 @@
+"""
+Throughput of the production server profile for different worker counts.
+
+Starts `gunicorn -c gunicorn.conf.py app.main:app` once per worker count,
+drives it with concurrent requests for a fixed duration and prints
+requests/second and latency percentiles.
+
+    python benchmarks/server_throughput.py --workers 1 4 --concurrency 64 --path /
+
+More than one worker needs CHROMA_HOST pointing at a Chroma server
+(e.g. `chroma run --path /tmp/chroma`); the server refuses to start
+several workers on the embedded store.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}", ACCESS_LOG="")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def _wait_ready(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+async def _drive(url: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    stop_at = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    default_workers = [1, os.cpu_count() or 2] if os.getenv("CHROMA_HOST") else [1]
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if max(args.workers) > 1 and not os.getenv("CHROMA_HOST"):
+        parser.error("more than one worker needs CHROMA_HOST set to a Chroma server")
+
+    print(f"{'workers':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        server = _start_server(workers, args.port)
+        try:
+            url = f"http://127.0.0.1:{args.port}{args.path}"
+            await _wait_ready(url)
+            result = await _drive(url, args.concurrency, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=120)
+        print(
+            f"{workers:>8} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+"""
+Public chat under upstream faults: deadlines, stage timeouts and circuit
+breakers against the fake OpenAI API in benchmarks/fake_upstream.py.
+
+Runs the real chat path (OpenAI clients, retrieval, routing) on a temp
+SQLite database and Chroma directory, through a sequence of phases that
+inject latency or errors into the chat and embeddings endpoints, and prints
+per phase the latency of /chat/public, how requests ended (answered,
+retrieval-only, failed) and the circuit breaker states afterwards.
+
+    python benchmarks/upstream_faults.py
+    python benchmarks/upstream_faults.py --requests 40 --concurrency 8 --json
+
+Timeouts and breaker settings are shortened for the run; override them with
+the usual environment variables.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+# Short budgets so a run takes seconds; must be set before the app is imported
+for _key, _value in {
+    "CHAT_DEADLINE_SECONDS": "3",
+    "RETRIEVAL_TIMEOUT_SECONDS": "1",
+    "LLM_TIMEOUT_SECONDS": "1.5",
+    "EMBEDDING_REQUEST_TIMEOUT_SECONDS": "1",
+    "LLM_REQUEST_TIMEOUT_SECONDS": "1.5",
+    "EMBEDDING_MAX_RETRIES": "0",
+    "LLM_MAX_RETRIES": "0",
+    "CIRCUIT_BREAKER_MIN_CALLS": "5",
+    "CIRCUIT_BREAKER_WINDOW_SECONDS": "2",
+    "CIRCUIT_BREAKER_OPEN_SECONDS": "3",
+    "ROUTING_NO_ANSWER_THRESHOLD": "0",
+    "WARMUP_ENABLED": "false",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import load_test  # noqa: E402  (temp database, Chroma and upload directories)
+from fake_upstream import FakeUpstream  # noqa: E402
+
+# Faults injected per phase; "pause" first lets open breakers allow a probe
+# and earlier calls leave the breakers' windows
+PHASES = [
+    {"name": "healthy", "faults": {}},
+    {"name": "slow_chat", "faults": {"target": "chat", "latency": 5}},
+    {"name": "chat_errors", "faults": {"target": "chat", "error_rate": 1}},
+    {"name": "embeddings_errors", "faults": {"target": "embeddings", "error_rate": 1}, "pause": True},
+    {"name": "recovered", "faults": {}, "pause": True},
+]
+
+
+def _install(upstream: FakeUpstream) -> None:
+    os.environ["OPENAI_BASE_URL"] = upstream.base_url
+    from langchain_openai import OpenAIEmbeddings
+
+    from app.config import settings as app_settings
+    from app.config.resilience import GuardedEmbeddings
+
+    settings = app_settings.settings
+    app_settings.BASE_DIR = load_test._tmp
+    os.makedirs(os.path.join(load_test._tmp, "uploads"), exist_ok=True)
+    # As configured, but sending text rather than tiktoken ids so the run needs no tokenizer download
+    app_settings.embedding_model = GuardedEmbeddings(
+        OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            dimensions=settings.EMBEDDING_DIMENSIONS,
+            openai_api_key=settings.OPENAI_API_KEY,
+            base_url=upstream.base_url,
+            timeout=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS,
+            max_retries=settings.EMBEDDING_MAX_RETRIES,
+            check_embedding_ctx_length=False,
+        ),
+        app_settings.embeddings_breaker,
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def _phase(client, phase: Dict, upstream: FakeUpstream, requests: int, concurrency: int, rng) -> Dict:
+    from app.chat.utils.routing import FAILURE_REPLY
+    from app.config import settings as app_settings
+
+    breakers = [app_settings.embeddings_breaker, app_settings.chat_breaker]
+    if phase.get("pause"):
+        await asyncio.sleep(max(b.open_seconds for b in breakers) + 0.1)
+    upstream.config.update(latency=0, jitter=0, error_rate=0, target="")
+    upstream.config.update(**phase["faults"])
+    before = dict(upstream.config.requests)
+
+    latencies = []
+    outcomes = {"answered": 0, "unanswered": 0, "retrieval_only": 0, "failed": 0, "http_error": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/chat/public", json={"message": load_test._question(rng)})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                outcomes["http_error"] += 1
+                return
+            reply = response.json()["reply"]
+            if reply == app_settings.settings.DEGRADED_REPLY:
+                outcomes["retrieval_only"] += 1
+            elif reply == FAILURE_REPLY:
+                outcomes["failed"] += 1
+            elif reply == app_settings.settings.NO_RELEVANT_DOCUMENTS_REPLY:
+                outcomes["unanswered"] += 1
+            else:
+                outcomes["answered"] += 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    calls = {
+        path.rsplit("/", 1)[-1]: count - before.get(path, 0)
+        for path, count in upstream.config.requests.items()
+    }
+    return {
+        "phase": phase["name"],
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        **outcomes,
+        "upstream_calls": calls,
+        "breakers": {b.name: b.state for b in breakers},
+    }
+
+
+async def run(args) -> List[Dict]:
+    import logging
+    import warnings
+
+    import httpx
+
+    upstream = FakeUpstream().start()
+    _install(upstream)
+    from app.config.database import engine
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+    rows = []
+    try:
+        await load_test._seed("upstream-faults-password", args.documents, random.Random(args.seed))
+        # Start the phases without the indexing calls in the breakers' windows
+        from app.config import settings as app_settings
+        app_settings.embeddings_breaker.reset()
+        app_settings.chat_breaker.reset()
+        rng = random.Random(args.seed)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://upstream-faults", timeout=60) as client:
+            for phase in PHASES:
+                rows.append(await _phase(client, phase, upstream, args.requests, args.concurrency, rng))
+    finally:
+        await engine.dispose()
+        upstream.stop()
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20, help="chat requests per phase")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=5, help="files indexed before the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    columns = [
+        "phase", "p50_ms", "p95_ms", "max_ms", "answered", "unanswered", "retrieval_only", "failed", "http_error",
+    ]
+    print(" ".join(f"{c:>14}" for c in columns) + "  breakers")
+    for row in rows:
+        breakers = " ".join(f"{name}={state}" for name, state in row["breakers"].items())
+        print(" ".join(f"{str(row[c]):>14}" for c in columns) + f"  {breakers}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# Production server profile:
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# Use `uvicorn app.main:app --reload` for local development instead.
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+
+logger = logging.getLogger("gunicorn.error")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# Requests are I/O bound (OpenAI, database), so use the usual 2 * CPU + 1,
+# capped to keep memory per container predictable. The embedded Chroma store
+# is a directory only one process may write, so without a Chroma server
+# (CHROMA_HOST) there is a single worker.
+_cpus = multiprocessing.cpu_count()
+_default_workers = min(2 * _cpus + 1, int(os.getenv("MAX_WORKERS", 8))) if os.getenv("CHROMA_HOST") else 1
+workers = int(os.getenv("WEB_CONCURRENCY", _default_workers))
+worker_class = "app.config.server.ProductionUvicornWorker"
+
+# Proxies whose X-Forwarded-For gives the client address (admission control
+# tells anonymous clients apart by it); set to the reverse proxy's address
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Let in-flight chats (LLM calls can take tens of seconds) finish on SIGTERM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 90))
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.getenv("MAX_REQUESTS", 5000))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 500))
+
+# The app itself is NOT preloaded: it opens Chroma, which does not survive a
+# fork. Heavy libraries are imported in the master instead so workers share
+# their pages copy-on-write and boot faster.
+preload_app = False
+_PRELOAD_MODULES = (
+    "numpy",
+    "sqlalchemy",
+    "pydantic",
+    "fastapi",
+    "langchain_core",
+    "langchain",
+    "langchain_openai",
+    "langchain_community",
+)
+
+accesslog = os.getenv("ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    """Run migrations and admin bootstrap once, before any worker starts."""
+    if os.getenv("SKIP_STARTUP_TASKS", "").lower() not in ("1", "true", "yes"):
+        logger.info("Running startup tasks in the master")
+        subprocess.run([sys.executable, "-m", "app.bootstrap"], check=True)
+        os.environ["SKIP_STARTUP_TASKS"] = "true"
+
+    for module in _PRELOAD_MODULES:
+        try:
+            __import__(module)
+        except ImportError:
+            logger.warning("Could not preload %s", module)
+
+    if workers > 1 and not os.getenv("CHROMA_HOST"):
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={workers} needs a Chroma server: set CHROMA_HOST, or run one worker "
+            f"on the embedded Chroma store"
+        )